@@ -49,6 +49,10 @@ if "vlm_collections" in locals():
     importlib.reload(vlm_collections)
 else:
     from . import vlm_collections
+if "vlm_raster" in locals():
+    importlib.reload(vlm_raster)
+else:
+    from . import vlm_raster
 if "vlm_utils" in locals():
     importlib.reload(vlm_utils)
 else:
@@ -61,6 +65,14 @@ if "vlm_camera" in locals():
     importlib.reload(vlm_camera)
 else:
     from . import vlm_camera
+if "vlm_render_cache" in locals():
+    importlib.reload(vlm_render_cache)
+else:
+    from . import vlm_render_cache
+if "vlm_render_telemetry" in locals():
+    importlib.reload(vlm_render_telemetry)
+else:
+    from . import vlm_render_telemetry
 
 # Only load submodules that have external dependencies if they are satisfied
 dependencies = (
@@ -68,8 +80,6 @@ dependencies = (
     vlm_dependencies.Dependency(module="olefile", package=None, name=None),
     # Pillow image processing lib: https://pillow.readthedocs.io/en/stable/
     vlm_dependencies.Dependency(module="PIL", package="Pillow", name="Pillow"),
-    # Win32 native lib: https://github.com/mhammond/pywin32
-    vlm_dependencies.Dependency(module="win32crypt", package="pywin32", name=None),
 )
 dependencies_installed = vlm_dependencies.import_dependencies(dependencies)
 if dependencies_installed:
@@ -77,6 +87,10 @@ if dependencies_installed:
         importlib.reload(biff_io)
     else:
         from . import biff_io
+    if "cfb_io" in locals():
+        importlib.reload(cfb_io)
+    else:
+        from . import cfb_io
     if "vlm_import" in locals():
         importlib.reload(vlm_import)
     else:
@@ -200,6 +214,18 @@ class VLM_Scene_props(PropertyGroup):
     remove_backface: FloatProperty(name="Backface Limit", description="Angle (degree) limit for backfacing geometry removal", default = 0.0)
     keep_pf_reflection_faces: BoolProperty(name="Keep playfield reflection", description="Keep faces only visible through playfield reflection", default = False)
     max_lighting: IntProperty(name="Max Light.", description="Maximum number of lighting scenario baked simultaneously at 4K (0 = no limit)", default = 0, min = 0)
+    mask_mode: EnumProperty(
+        items=[
+            ('render', 'Render', 'Render object and group masks with Blender', '', 0),
+            ('raster', 'Rasterize', 'Rasterize object and group masks on the CPU (no GPU needed, works in background mode)', '', 1),
+        ],
+        name='Masks',
+        default='render'
+    )
+    influence_prepass: BoolProperty(name="Influence Pre-pass", description="Measure the influence of lights without an evaluable area of influence (node driven emission,...) with a low resolution render before rendering", default = False)
+    use_render_farm: BoolProperty(name="Render Farm", description="Dispatch group renders as jobs to background Blender workers", default = False)
+    render_farm_workers: IntProperty(name="Farm Workers", description="Number of local background Blender workers launched when rendering with the render farm (0 = only use workers launched by the user)", default = 2, min = 0)
+    render_farm_path: StringProperty(name="Farm Folder", description="Folder, shared with the workers, used to exchange render jobs (default to a 'Farm' folder in the bake folder)", subtype='DIR_PATH', default="")
     # Exporter options
     enable_vpx_reflection: BoolProperty(name="Enable VPX reflection", description="Enable VPX playfield reflection for exported models and lightmaps. Note that this will usually leads to 'double' reflections since indirect light is already baked.", default = False)
     export_mode: EnumProperty(
@@ -212,6 +238,15 @@ class VLM_Scene_props(PropertyGroup):
         name='Export mode',
         default='remove_all'
     )
+    export_compression: EnumProperty(
+        items=[
+            ('fast', 'Fast', 'Fast compression of exported meshes, for iterating', '', 0),
+            ('default', 'Default', 'Default zlib compression of exported meshes', '', 1),
+            ('max', 'Max', 'Best compression of exported meshes, for release', '', 2),
+        ],
+        name='Compression',
+        default='default'
+    )
     playfield_col: PointerProperty(name="Playfield", type=bpy.types.Collection, description="Bake collection used for VPX playfield (object rendered with table reflections)")
     # Active table informations
     table_file: StringProperty(name="Table", description="Table filename", default="")
@@ -368,6 +403,17 @@ class VLM_OT_render_all_groups(Operator):
         return vlm_render_baker.render_all_groups(self, context)
 
 
+class VLM_OT_render_farm_worker(Operator):
+    bl_idname = "vlm.render_farm_worker"
+    bl_label = "Render Farm Worker"
+    bl_description = "Render the jobs of a render farm job manifest (used by worker.py in background mode)"
+    bl_options = {"REGISTER"}
+    manifest: StringProperty(name="Manifest", description="Path of the job manifest", default="")
+    
+    def execute(self, context):
+        return vlm_render_baker.run_render_worker(self, context, self.manifest)
+
+
 class VLM_OT_create_bake_meshes(Operator):
     bl_idname = "vlm.create_bake_meshes_operator"
     bl_label = "3. Bake Meshes"
@@ -678,8 +724,13 @@ class VLM_OT_load_render_images(Operator):
                 for im in images:
                     if im != None and im.name != 'VLM.NoTex': bpy.data.images.remove(im)
             else:
+                render_cache = vlm_render_cache.RenderCache(context)
                 for path, mat in zip(paths, obj.data.materials):
-                    _, im = vlm_utils.get_image_or_black(path)
+                    crop = render_cache.get_crop(path)
+                    if crop and not vlm_utils.image_by_path(path) and os.path.exists(bpy.path.abspath(path)):
+                        im = vlm_render_cache.load_full_frame_image(path, crop)
+                    else:
+                        _, im = vlm_utils.get_image_or_black(path)
                     mat.node_tree.nodes["BakeTex"].image = im
         return {"FINISHED"}
 
@@ -746,9 +797,16 @@ class VLM_PT_Lightmapper(bpy.types.Panel):
         layout.prop(vlmProps, "tex_size")
         layout.prop(vlmProps, "max_lighting")
         layout.prop(vlmProps, "padding")
+        layout.prop(vlmProps, "mask_mode")
+        layout.prop(vlmProps, "influence_prepass")
+        layout.prop(vlmProps, "use_render_farm")
+        if vlmProps.use_render_farm:
+            layout.prop(vlmProps, "render_farm_workers")
+            layout.prop(vlmProps, "render_farm_path")
         layout.prop(vlmProps, "remove_backface", text='Backface')
         layout.prop(vlmProps, "keep_pf_reflection_faces")
         layout.prop(vlmProps, "export_mode")
+        layout.prop(vlmProps, "export_compression")
         layout.prop(vlmProps, "playfield_col")
         layout.prop(vlmProps, "enable_vpx_reflection")
         row = layout.row()
@@ -1035,6 +1093,7 @@ classes = (
     VLM_OT_update,
     VLM_OT_compute_render_groups,
     VLM_OT_render_all_groups,
+    VLM_OT_render_farm_worker,
     VLM_OT_create_bake_meshes,
     VLM_OT_render_nestmaps,
     VLM_OT_batch_bake,
@@ -1084,6 +1143,8 @@ def unregister():
         del bpy.types.Scene.vlmSettings
         del bpy.types.Collection.vlmSettings
         del bpy.types.Object.vlmSettings
+    if vlm_utils._geometry_update_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(vlm_utils._geometry_update_handler)
     vlm_utils.uninstall_assetlib()
 
 
@@ -15,11 +15,37 @@
 
 import io
 import struct
+import zlib
+import numpy as np
+
+
+# Precompiled decoders, used with unpack_from/pack_into to avoid slicing the stream for each field
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_F32 = struct.Struct("<f")
+
+# Vertex layout of VPX primitive meshes (M3DX/M3CX): position, normal, texture coordinates
+VERTEX_DTYPE = np.dtype([('co', '<f4', 3), ('normal', '<f4', 3), ('uv', '<f4', 2)])
 
 
 class BIFF_reader:
-    def __init__(self, stream):
-        self.data = stream
+    def __init__(self, stream, zero_copy=False):
+        """Create a reader on the given stream (bytes or bytearray).
+        In zero copy mode, the stream is wrapped in a memoryview: reads do not allocate a new
+        bytes object per field and child readers share the same buffer. This mode is meant
+        for parsing.
+        Inserts and deletes are not applied to the stream but recorded in an edit log against
+        the original offsets (reading continues on the original data). The edited stream is
+        built once by get_data. put_xxx methods patch the stream in place (it must then be a bytearray).
+        Edits at the same offset are applied in the order they were recorded (data inserted at the
+        start of a deleted span is kept). Overlapping deletes and inserts strictly inside a deleted
+        span are rejected with a ValueError.
+        """
+        self.zero_copy = zero_copy
+        self.data = memoryview(stream) if zero_copy else stream
+        self.edits = [] # List of (position, deleted byte count, inserted data)
         self.pos = 0
         self.record_start = 0
         self.bytes_in_record_remaining = 0
@@ -40,42 +66,41 @@ class BIFF_reader:
         return self.data[self.pos - 4] != 0
 
     def get_u8(self):
-        i = struct.unpack("<B", self.data[self.pos:self.pos+1])[0]
+        i = _U8.unpack_from(self.data, self.pos)[0]
         self.pos = self.pos + 1
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 1
         return i
 
     def get_u16(self):
-        i = struct.unpack("<H", self.data[self.pos:self.pos+2])[0]
+        i = _U16.unpack_from(self.data, self.pos)[0]
         self.pos = self.pos + 2
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 2
         return i
 
     def get_u32(self):
-        i = struct.unpack("<I", self.data[self.pos:self.pos+4])[0]
+        i = _U32.unpack_from(self.data, self.pos)[0]
         self.pos = self.pos + 4
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
         return i
 
     def get_32(self):
-        i = struct.unpack("<i", self.data[self.pos:self.pos+4])[0]
+        i = _I32.unpack_from(self.data, self.pos)[0]
         self.pos = self.pos + 4
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
         return i
 
     def get_float(self):
-        i = struct.unpack("<f", self.data[self.pos:self.pos+4])[0]
+        i = _F32.unpack_from(self.data, self.pos)[0]
         self.pos = self.pos + 4
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
         return i
 
     def get_str(self, count):
-        pos_0 = count
-        for p in range(count):
-            if self.data[self.pos+p] == 0:
-                pos_0 = p
-                break
-        i = str(struct.unpack("%ds" % pos_0, self.data[self.pos:self.pos+pos_0])[0], 'latin_1')
+        d = self.data[self.pos:self.pos+count]
+        if self.zero_copy: d = d.tobytes()
+        pos_0 = d.find(b'\x00')
+        if pos_0 >= 0: d = d[:pos_0]
+        i = str(d, 'latin_1')
         self.pos = self.pos + count
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - count
         return i
@@ -90,6 +115,24 @@ class BIFF_reader:
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - count
         return i
     
+    def get_vertices(self, count):
+        """Read an array of count vertices (M3DX) as a numpy array of VERTEX_DTYPE"""
+        return np.frombuffer(self.get(count * VERTEX_DTYPE.itemsize), dtype=VERTEX_DTYPE)
+
+    def get_compressed_vertices(self, compressed_size):
+        """Read a zlib compressed vertex array (M3CX) as a numpy array of VERTEX_DTYPE"""
+        return np.frombuffer(zlib.decompress(self.get(compressed_size)), dtype=VERTEX_DTYPE)
+
+    def get_indices(self, count, n_vertices):
+        """Read an index array (M3DI), stored as u16 or u32 depending on the vertex count"""
+        dtype = np.dtype('<u4') if n_vertices > 65535 else np.dtype('<u2')
+        return np.frombuffer(self.get(count * dtype.itemsize), dtype=dtype)
+
+    def get_compressed_indices(self, compressed_size, n_vertices):
+        """Read a zlib compressed index array (M3CI), stored as u16 or u32 depending on the vertex count"""
+        dtype = np.dtype('<u4') if n_vertices > 65535 else np.dtype('<u2')
+        return np.frombuffer(zlib.decompress(self.get(compressed_size)), dtype=dtype)
+
     def get_color(self, has_alpha=False):
         if has_alpha:
             i = (self.get_u8() / 255.0, self.get_u8() / 255.0, self.get_u8() / 255.0, self.get_u8() / 255.0)
@@ -123,19 +166,42 @@ class BIFF_reader:
         self.bytes_in_record_remaining = self.get_u32()
         self.tag = self.get_str(4)
     
+    def _record_edit(self, pos, count, new_data):
+        for edit_pos, edit_count, _ in self.edits:
+            if edit_count > 0 and (edit_pos < pos < edit_pos + edit_count or (count > 0 and pos <= edit_pos < pos + count)):
+                raise ValueError(f'Edit of [{pos}, {pos + count}) overlaps the deleted span [{edit_pos}, {edit_pos + edit_count})')
+            if edit_count == 0 and pos < edit_pos < pos + count:
+                raise ValueError(f'Delete of [{pos}, {pos + count}) contains the data inserted at {edit_pos}')
+        self.edits.append((pos, count, new_data))
+
     def delete_tag(self):
-        self.data = self.data[:self.record_start] + self.data[self.pos + self.bytes_in_record_remaining:]
-        self.pos = self.record_start
+        end = self.pos + self.bytes_in_record_remaining
+        self._record_edit(self.record_start, end - self.record_start, None)
+        self.pos = end
         self.bytes_in_record_remaining = 0
         self.tag = b''
     
     def delete_bytes(self, count):
-        self.data = self.data[:self.pos] + self.data[self.pos + count:]
+        self._record_edit(self.pos, count, None)
+        self.pos = self.pos + count
     
     def insert_data(self, new_data):
-        for d in new_data:
-            self.data.insert(self.pos, d)
-            self.pos += 1
+        self._record_edit(self.pos, 0, bytes(new_data))
+    
+    def get_data(self):
+        """Return the stream with all recorded edits applied, as bytes"""
+        if not self.edits:
+            return bytes(self.data)
+        parts = []
+        pos = 0
+        for edit_pos, count, new_data in sorted(self.edits, key=lambda e: e[0]):
+            if edit_pos > pos:
+                parts.append(self.data[pos:edit_pos])
+            if new_data:
+                parts.append(new_data)
+            pos = max(pos, edit_pos + count)
+        parts.append(self.data[pos:])
+        return b''.join(parts)
     
     def put_bool(self, value):
         if value:
@@ -146,19 +212,141 @@ class BIFF_reader:
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
 
     def put_u32(self, value):
-        self.data[self.pos:self.pos+4] = struct.pack("<I", value)
+        _U32.pack_into(self.data, self.pos, value)
         self.pos = self.pos + 4
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
 
     def put_float(self, value):
-        self.data[self.pos:self.pos+4] = struct.pack("<f", value)
+        _F32.pack_into(self.data, self.pos, value)
         self.pos = self.pos + 4
         self.bytes_in_record_remaining = self.bytes_in_record_remaining - 4
 
     def child_reader(self):
+        if self.zero_copy:
+            return BIFF_reader(self.data[self.pos:], zero_copy=True)
         return BIFF_reader(self.data[self.pos:])
 
 
+class BIFF_index:
+    """Index of the records of a BIFF stream, built with a single pass over the record headers.
+
+    Each entry is a tuple (tag, record_start, pos, length) where pos is the offset of the record
+    payload and length its size. Tags whose payload is not covered by the record size are handled:
+    CODE (script length stored as the first u32 of the payload), nested streams (DPNT, JPEG) which
+    run up to their own ENDB, and BITS (raw LZW image data) which runs to the end of the stream.
+    Tag lookups are O(1) and the put_xxx methods patch the underlying buffer in place (it must then
+    be a bytearray), without moving any record.
+    """
+    NESTED_TAGS = ('DPNT', 'JPEG')
+
+    def __init__(self, stream, start=0):
+        self.data = stream
+        self.entries = []
+        self.tags = {}
+        self.end = self._scan(start)
+        for entry in self.entries:
+            self.tags.setdefault(entry[0], []).append(entry)
+
+    def _scan(self, pos, nested=False):
+        data = self.data
+        n = len(data)
+        while pos + 8 <= n:
+            record_start = pos
+            length = _U32.unpack_from(data, pos)[0] - 4
+            tag = str(data[pos+4:pos+8], 'latin_1')
+            pos += 8
+            if tag == 'CODE':
+                length = 4 + _U32.unpack_from(data, pos)[0]
+            elif tag in BIFF_index.NESTED_TAGS:
+                length = self._scan(pos, nested=True) - pos
+            elif tag == 'BITS':
+                length = n - pos
+            if not nested:
+                self.entries.append((tag, record_start, pos, length))
+            pos += length
+            if tag == 'ENDB':
+                break
+        return pos
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def find(self, tag):
+        """Return the first entry for the given tag, or None"""
+        entries = self.tags.get(tag)
+        return entries[0] if entries else None
+
+    def find_all(self, tag):
+        return self.tags.get(tag, [])
+
+    def reader(self, tag):
+        """Return a BIFF_reader positioned at the payload of the first record with the given tag, or None"""
+        entry = self.find(tag)
+        if entry is None:
+            return None
+        return self.reader_at(entry)
+
+    def reader_at(self, entry, reader=None):
+        """Position a reader (created on the indexed stream if not provided) at the payload of the given entry"""
+        if reader is None:
+            reader = BIFF_reader(self.data, zero_copy=isinstance(self.data, memoryview))
+        reader.tag, reader.record_start, reader.pos, reader.bytes_in_record_remaining = entry
+        return reader
+
+    def walk(self):
+        """Iterate the records of the stream, yielding a single reader positioned at each record payload"""
+        reader = BIFF_reader(self.data, zero_copy=isinstance(self.data, memoryview))
+        for entry in self.entries:
+            yield self.reader_at(entry, reader)
+
+    def sub_index(self, tag):
+        """Return the index of the nested stream stored in the given tag (DPNT, JPEG), or None"""
+        entry = self.find(tag)
+        if entry is None:
+            return None
+        return BIFF_index(self.data, entry[2])
+
+    def get_data(self, tag, default=None):
+        entry = self.find(tag)
+        if entry is None:
+            return default
+        return self.data[entry[2]:entry[2]+entry[3]]
+
+    def get_bool(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else self.data[entry[2]] != 0
+
+    def get_u32(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else _U32.unpack_from(self.data, entry[2])[0]
+
+    def get_32(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else _I32.unpack_from(self.data, entry[2])[0]
+
+    def get_float(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else _F32.unpack_from(self.data, entry[2])[0]
+
+    def get_string(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else self.reader_at(entry).get_string()
+
+    def get_wide_string(self, tag, default=None):
+        entry = self.find(tag)
+        return default if entry is None else self.reader_at(entry).get_wide_string()
+
+    def put_bool(self, tag, value, offset=0):
+        pos = self.find(tag)[2] + offset
+        self.data[pos] = 0xFF if value else 0
+
+    def put_u32(self, tag, value, offset=0):
+        _U32.pack_into(self.data, self.find(tag)[2] + offset, value)
+
+    def put_float(self, tag, value, offset=0):
+        _F32.pack_into(self.data, self.find(tag)[2] + offset, value)
+
+
 class BIFF_writer:
     def __init__(self):
         self.data = io.BytesIO()
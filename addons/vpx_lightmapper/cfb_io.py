@@ -0,0 +1,250 @@
+#    Copyright (C) 2022  Vincent Bousquet
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import hashlib
+import struct
+
+# Pure Python writer for OLE compound files (MS-CFB, version 3 with 512 bytes sectors) and MD2 hasher,
+# allowing to write VPX files without the Windows structured storage and crypto APIs.
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+DIFSECT = 0xFFFFFFFC
+FATSECT = 0xFFFFFFFD
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+NOSTREAM = 0xFFFFFFFF
+
+_DIR_ENTRY = struct.Struct("<64sHBBIII16sIQQIQ")
+
+
+class CFB_entry:
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type # 1 = storage, 2 = stream, 5 = root storage
+        self.children = []
+        self.start = ENDOFCHAIN
+        self.size = 0
+        self.id = 0
+        self.left = self.right = self.child = NOSTREAM
+        self.color = 1 # 0 = red, 1 = black
+
+
+class CFB_storage:
+    def __init__(self, writer, entry):
+        self.writer = writer
+        self.entry = entry
+
+    def create_storage(self, name):
+        entry = CFB_entry(name, 1)
+        self.entry.children.append(entry)
+        return CFB_storage(self.writer, entry)
+
+    def write_stream(self, name, data):
+        entry = CFB_entry(name, 2)
+        self.entry.children.append(entry)
+        self.writer.write_stream_data(entry, data)
+
+
+class CFB_writer:
+    """Write a compound file, streaming the content of each stream to disk when it is added.
+    Small streams are gathered in the mini stream which, like the directory and allocation
+    tables, is written when the file is closed.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(bytes(SECTOR_SIZE)) # Placeholder for the header
+        self.fat = []
+        self.mini_fat = []
+        self.mini_stream = bytearray()
+        self.root = CFB_entry('Root Entry', 5)
+
+    def create_storage(self, name):
+        return CFB_storage(self, self.root).create_storage(name)
+
+    def write_stream(self, name, data):
+        CFB_storage(self, self.root).write_stream(name, data)
+
+    def _write_sectors(self, data):
+        """Append data as a chain of contiguous sectors, returning the first sector"""
+        n_sectors = (len(data) + SECTOR_SIZE - 1) // SECTOR_SIZE
+        if n_sectors == 0:
+            return ENDOFCHAIN
+        start = len(self.fat)
+        self.fat.extend(range(start + 1, start + n_sectors))
+        self.fat.append(ENDOFCHAIN)
+        self.file.write(data)
+        padding = n_sectors * SECTOR_SIZE - len(data)
+        if padding:
+            self.file.write(bytes(padding))
+        return start
+
+    def write_stream_data(self, entry, data):
+        entry.size = len(data)
+        if len(data) == 0:
+            entry.start = ENDOFCHAIN
+        elif len(data) < MINI_STREAM_CUTOFF:
+            n_sectors = (len(data) + MINI_SECTOR_SIZE - 1) // MINI_SECTOR_SIZE
+            start = len(self.mini_fat)
+            self.mini_fat.extend(range(start + 1, start + n_sectors))
+            self.mini_fat.append(ENDOFCHAIN)
+            self.mini_stream.extend(data)
+            self.mini_stream.extend(bytes(n_sectors * MINI_SECTOR_SIZE - len(data)))
+            entry.start = start
+        else:
+            entry.start = self._write_sectors(data)
+
+    def _build_tree(self, entries):
+        """Organize siblings as a balanced binary tree (valid red-black tree) sorted by the compound file name order,
+        returning the root entry index of the tree"""
+        entries = sorted(entries, key=lambda e: (len(e.name), e.name.upper()))
+        full_levels = (len(entries) + 1).bit_length() - 1
+        def build(lo, hi, depth):
+            if lo >= hi:
+                return NOSTREAM
+            mid = (lo + hi) // 2
+            entry = entries[mid]
+            entry.color = 0 if depth >= full_levels else 1
+            entry.left = build(lo, mid, depth + 1)
+            entry.right = build(mid + 1, hi, depth + 1)
+            return entry.id
+        return build(0, len(entries), 0)
+
+    def close(self):
+        # Mini stream, stored in a regular sector chain, referenced by the root entry
+        self.root.start = self._write_sectors(self.mini_stream)
+        self.root.size = len(self.mini_stream)
+
+        # Directory
+        entries = [self.root]
+        for entry in entries:
+            for child in entry.children:
+                child.id = len(entries)
+                entries.append(child)
+        for entry in entries:
+            entry.child = self._build_tree(entry.children)
+        directory = bytearray()
+        for entry in entries:
+            name = entry.name.encode('utf-16-le')
+            directory.extend(_DIR_ENTRY.pack(name, len(name) + 2, entry.type, entry.color, entry.left, entry.right, entry.child,
+                bytes(16), 0, 0, 0, entry.start, entry.size))
+        while len(directory) % SECTOR_SIZE:
+            directory.extend(_DIR_ENTRY.pack(b'', 0, 0, 0, NOSTREAM, NOSTREAM, NOSTREAM, bytes(16), 0, 0, 0, 0, 0))
+        first_dir_sector = self._write_sectors(directory)
+
+        # Mini FAT
+        mini_fat = self.mini_fat + [FREESECT] * (-len(self.mini_fat) % (SECTOR_SIZE // 4))
+        first_mini_fat_sector = self._write_sectors(struct.pack(f'<{len(mini_fat)}I', *mini_fat)) if mini_fat else ENDOFCHAIN
+        n_mini_fat_sectors = len(mini_fat) * 4 // SECTOR_SIZE
+
+        # FAT (which must also cover its own sectors and the DIFAT sectors)
+        n_data_sectors = len(self.fat)
+        n_fat_sectors = n_difat_sectors = 0
+        while True:
+            n_difat_sectors = max(0, (n_fat_sectors - 109 + 126) // 127)
+            needed = (n_data_sectors + n_fat_sectors + n_difat_sectors + 127) // 128
+            if needed <= n_fat_sectors:
+                break
+            n_fat_sectors = needed
+        fat_sectors = list(range(n_data_sectors, n_data_sectors + n_fat_sectors))
+        difat_sectors = list(range(n_data_sectors + n_fat_sectors, n_data_sectors + n_fat_sectors + n_difat_sectors))
+        fat = self.fat + [FATSECT] * n_fat_sectors + [DIFSECT] * n_difat_sectors
+        fat.extend([FREESECT] * (n_fat_sectors * 128 - len(fat)))
+        self.file.write(struct.pack(f'<{len(fat)}I', *fat))
+        for i, sector in enumerate(difat_sectors):
+            values = fat_sectors[109 + i * 127:109 + (i + 1) * 127]
+            values = values + [FREESECT] * (127 - len(values))
+            values.append(difat_sectors[i + 1] if i + 1 < len(difat_sectors) else ENDOFCHAIN)
+            self.file.write(struct.pack('<128I', *values))
+
+        # Header
+        difat = fat_sectors[:109] + [FREESECT] * (109 - min(109, n_fat_sectors))
+        header = struct.pack('<8s16sHHHHH6sIIIIIIIII', b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1', bytes(16), 0x003E, 0x0003, 0xFFFE, 9, 6, bytes(6),
+            0, n_fat_sectors, first_dir_sector, 0, MINI_STREAM_CUTOFF, first_mini_fat_sector, n_mini_fat_sectors,
+            difat_sectors[0] if difat_sectors else ENDOFCHAIN, n_difat_sectors)
+        header += struct.pack('<109I', *difat)
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+
+
+# MD2 message digest (RFC 1319), used by VPX to sign table files
+_MD2_S = bytes((
+    41, 46, 67, 201, 162, 216, 124, 1, 61, 54, 84, 161, 236, 240, 6, 19,
+    98, 167, 5, 243, 192, 199, 115, 140, 152, 147, 43, 217, 188, 76, 130, 202,
+    30, 155, 87, 60, 253, 212, 224, 22, 103, 66, 111, 24, 138, 23, 229, 18,
+    190, 78, 196, 214, 218, 158, 222, 73, 160, 251, 245, 142, 187, 47, 238, 122,
+    169, 104, 121, 145, 21, 178, 7, 63, 148, 194, 16, 137, 11, 34, 95, 33,
+    128, 127, 93, 154, 90, 144, 50, 39, 53, 62, 204, 231, 191, 247, 151, 3,
+    255, 25, 48, 179, 72, 165, 181, 209, 215, 94, 146, 42, 172, 86, 170, 198,
+    79, 184, 56, 210, 150, 164, 125, 182, 118, 252, 107, 226, 156, 116, 4, 241,
+    69, 157, 112, 89, 100, 113, 135, 32, 134, 91, 207, 101, 230, 45, 168, 2,
+    27, 96, 37, 173, 174, 176, 185, 246, 28, 70, 97, 105, 52, 64, 126, 15,
+    85, 71, 163, 35, 221, 81, 175, 58, 195, 92, 249, 206, 186, 197, 234, 38,
+    44, 83, 13, 110, 133, 40, 132, 9, 211, 223, 205, 244, 65, 129, 77, 82,
+    106, 220, 55, 200, 108, 193, 171, 250, 36, 225, 123, 8, 12, 189, 177, 74,
+    120, 136, 149, 139, 227, 99, 232, 109, 233, 203, 213, 254, 59, 0, 29, 57,
+    242, 239, 183, 14, 102, 88, 208, 228, 166, 119, 114, 248, 235, 117, 75, 10,
+    49, 68, 80, 180, 143, 237, 31, 26, 219, 153, 141, 51, 159, 17, 131, 20))
+
+
+class MD2:
+    """Incremental MD2 hasher. Uses the hashlib implementation when available (it has been removed from recent OpenSSL).
+    The pure Python fallback runs at about 200 KB/s, so hashing the whole content of large tables takes minutes."""
+    def __init__(self):
+        try:
+            self.native = hashlib.new('md2')
+        except ValueError:
+            self.native = None
+        self.state = [0] * 48
+        self.checksum = [0] * 16
+        self.pending = b''
+
+    def update(self, data):
+        if self.native:
+            self.native.update(data)
+            return
+        data = self.pending + bytes(data)
+        n_blocks = len(data) // 16
+        for i in range(n_blocks):
+            self._process(data[i * 16:(i + 1) * 16])
+        self.pending = data[n_blocks * 16:]
+
+    def _process(self, block):
+        S = _MD2_S
+        x = self.state
+        c = self.checksum
+        l = c[15]
+        for j in range(16):
+            l = c[j] = c[j] ^ S[block[j] ^ l]
+            x[16 + j] = block[j]
+            x[32 + j] = block[j] ^ x[j]
+        t = 0
+        for j in range(18):
+            for k in range(48):
+                t = x[k] = x[k] ^ S[t]
+            t = (t + j) & 0xFF
+
+    def digest(self):
+        if self.native:
+            return self.native.digest()
+        state, checksum, pending = list(self.state), list(self.checksum), self.pending
+        n = 16 - len(self.pending)
+        self.update(bytes([n]) * n)
+        self.update(bytes(self.checksum))
+        result = bytes(self.state[:16])
+        self.state, self.checksum, self.pending = state, checksum, pending
+        return result
@@ -21,6 +21,7 @@ import gpu
 import math
 import mathutils
 import functools
+import numpy as np
 from gpu_extras.presets import draw_texture_2d
 from gpu_extras.batch import batch_for_shader
 
@@ -121,6 +122,14 @@ def fit_camera(context, camera_object, camera_inclination, camera_layback, bake_
     camera_object.data.shift_y = 0
     view_vector = mathutils.Vector((0, math.sin(camera_angle), -math.cos(camera_angle)))
     aspect_ratio = 1.0
+    # Bounding box corners of all bake meshes, in world space, as homogeneous coordinates (they do not depend on the camera)
+    corners = [np.zeros((0, 4))]
+    for obj in bake_col.all_objects:
+        if obj.type == 'MESH': # and not obj.hide_get() and not obj.hide_render:
+            matrix = np.array(obj.matrix_world @ layback, dtype=np.float64)
+            bbox = np.array([corner[:] for corner in obj.bound_box], dtype=np.float64)
+            corners.append(np.hstack((bbox @ matrix[:3, :3].T + matrix[:3, 3], np.ones((len(bbox), 1)))))
+    corners = np.concatenate(corners)
     for i in range(3): # iterations since it depends on the aspect ratio fitting which change after each computation
         # Compute the camera distance with the current aspect ratio
         camera_object.location = (playfield_left + 0.5 * playfield_width, -playfield_top -0.5 * playfield_height, 0)
@@ -128,29 +137,17 @@ def fit_camera(context, camera_object, camera_inclination, camera_layback, bake_
         s = 1.0 / math.tan(camera_fov/2.0)
         sx = s if aspect_ratio > 1.0 else s/aspect_ratio
         sy = s if aspect_ratio < 1.0 else s*aspect_ratio
-        min_dist = 0
-        for obj in bake_col.all_objects:
-            if obj.type == 'MESH': # and not obj.hide_get() and not obj.hide_render:
-                bbox_corners = [modelview_matrix @ obj.matrix_world @ layback @ mathutils.Vector(corner) for corner in obj.bound_box]
-                proj_x = map(lambda a: abs(sx * a.x + a.z), bbox_corners)
-                proj_y = map(lambda a: abs(sy * a.y + a.z), bbox_corners)
-                min_dist = max(min_dist, max(proj_x), max(proj_y))
+        view_corners = corners @ np.array(modelview_matrix, dtype=np.float64).T
+        min_dist = max(0, np.abs(sx * view_corners[:, 0] + view_corners[:, 2]).max(initial=0), np.abs(sy * view_corners[:, 1] + view_corners[:, 2]).max(initial=0))
         camera_object.location.y -= min_dist * view_vector.y
         camera_object.location.z -= min_dist * view_vector.z
         # adjust aspect ratio and compute camera shift to fill the render output
         modelview_matrix = camera_object.matrix_basis.inverted()
         projection_matrix = camera_object.calc_matrix_camera(context.evaluated_depsgraph_get())
-        max_x = max_y = -10000000
-        min_x = min_y = 10000000
-        for obj in bake_col.all_objects:
-            if obj.type == 'MESH': # and not obj.hide_get() and not obj.hide_render:
-                bbox_corners = [projection_matrix @ modelview_matrix @ obj.matrix_world @ layback @ mathutils.Vector((corner[0], corner[1], corner[2], 1)) for corner in obj.bound_box]
-                proj_x = [o for o in map(lambda a: a.x / a.w, bbox_corners)]
-                proj_y = [o for o in map(lambda a: a.y / a.w, bbox_corners)]
-                min_x = min(min_x, min(proj_x))
-                min_y = min(min_y, min(proj_y))
-                max_x = max(max_x, max(proj_x))
-                max_y = max(max_y, max(proj_y))
+        clip_corners = corners @ np.array(projection_matrix @ modelview_matrix, dtype=np.float64).T
+        proj = clip_corners[:, :2] / clip_corners[:, 3:4]
+        min_x, min_y = proj.min(axis=0)
+        max_x, max_y = proj.max(axis=0)
         aspect_ratio = (max_x - min_x) / (max_y - min_y)
         context.scene.vlmSettings.render_aspect_ratio = aspect_ratio
         render_size = vlm_utils.get_render_size(context)
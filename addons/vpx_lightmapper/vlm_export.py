@@ -17,25 +17,50 @@ import bpy
 import os
 import zlib
 import math
-import struct
+import time
 import re
 import itertools
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from . import biff_io
+from . import cfb_io
 from . import vlm_utils
 from . import vlm_collections
 
 # Dependencies which need a custom install (not included in the Blender install)
 import olefile
-import pythoncom
-import win32crypt
-import win32cryptcon
-from win32com import storagecon
 
 
 def export_name(object_name):
     return object_name.replace(".", "_").replace(" ", "_").replace("-", "_")
 
 
+def weld_vertices(loop_data):
+    """Merge identical rows of the (n, 8) per loop vertex array (position, normal, uv).
+    Returns the unique vertices, ordered by first use, and the index buffer referencing them.
+    """
+    if len(loop_data) == 0:
+        return np.zeros((0, 8), dtype=loop_data.dtype), np.zeros(0, dtype=np.int64)
+    # Adding 0.0 maps -0.0 to 0.0 so that they are merged like Python float equality does
+    _, first_index, inverse = np.unique(loop_data + 0.0, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first_index)
+    remap = np.empty(len(order), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return loop_data[first_index[order]], remap[inverse.ravel()]
+
+
+# zlib compression level for each export compression mode
+COMPRESSION_LEVELS = {'fast': 1, 'default': zlib.Z_DEFAULT_COMPRESSION, 'max': 9}
+
+
+def compress_buffer(data, level):
+    """Compress a buffer with zlib (which releases the GIL), returning the compressed data and the time spent"""
+    start_time = time.time()
+    compressed = zlib.compress(data, level)
+    return compressed, time.time() - start_time
+
+
 def elem_ref(name):
     name = name[:31] if len(name) > 31 else name
     if ' ' in name or '.' in name:
@@ -106,13 +131,13 @@ def export_vpx(op, context):
     print(f'\nExporting bake results to {bpy.path.basename(output_path)}')
 
     src_storage = olefile.OleFileIO(input_path)
-    dst_storage = pythoncom.StgCreateStorageEx(output_path, storagecon.STGM_TRANSACTED | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, storagecon.STGFMT_DOCFILE, 0, pythoncom.IID_IStorage, None, None)
-    dst_gamestg = dst_storage.CreateStorage("GameStg", storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-    dst_tableinfo = dst_storage.CreateStorage("TableInfo", storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
+    dst_storage = cfb_io.CFB_writer(output_path)
+    dst_gamestg = dst_storage.create_storage("GameStg")
+    dst_tableinfo = dst_storage.create_storage("TableInfo")
+    game_data_index = biff_io.BIFF_index(src_storage.openstream('GameStg/GameData').read())
 
-    crypt_context = win32crypt.CryptAcquireContext(None, None, win32cryptcon.PROV_RSA_FULL, win32cryptcon.CRYPT_VERIFYCONTEXT | win32cryptcon.CRYPT_NEWKEYSET)
-    data_hash = crypt_context.CryptCreateHash(win32cryptcon.CALG_MD2)
-    data_hash.CryptHashData(b'Visual Pinball')
+    data_hash = cfb_io.MD2()
+    data_hash.update(b'Visual Pinball')
     def append_structure(src_path, mode, hashed):
         index = 0
         while src_storage.exists(f'{src_path}{index}'):
@@ -147,6 +172,9 @@ def export_vpx(op, context):
     baked_vpx_objects = list(itertools.chain.from_iterable(o.vlmSettings.vpx_object.split(';') for o in bake_col.all_objects))
     if playfield_col: baked_vpx_objects.append('playfield_mesh')
 
+    stage_times = {'Game items': 0.0, 'Meshes': 0.0, 'Compression wait': 0.0, 'Compression (workers)': 0.0, 'Images': 0.0, 'Game data & hash': 0.0}
+    stage_start = time.time()
+
     # Remove previous baked models and append the new ones, also hide/remove baked items
     n_read_item = n_game_items = 0
     used_images = {}
@@ -157,35 +185,23 @@ def export_vpx(op, context):
     while src_storage.exists(f'GameStg/GameItem{n_read_item}'):
         data = src_storage.openstream(f'GameStg/GameItem{n_read_item}').read()
         data = bytearray(data)
-        item_data = biff_io.BIFF_reader(data)
-        item_type = item_data.get_32()
+        item_type = biff_io.BIFF_reader(data).get_32()
         if item_type < 0 or item_type >= len(prefix):
             print(f'Unsupported item #{n_read_item} type #{item_type}')
-            dst_stream = dst_gamestg.CreateStream(f'GameItem{n_game_items}', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-            dst_stream.Write(data)
+            dst_gamestg.write_stream(f'GameItem{n_game_items}', data)
             n_game_items += 1
             n_read_item += 1
             continue
-        name = 'unknown'
+        item_index = biff_io.BIFF_index(data, 4)
+        name = item_index.get_wide_string('NAME', 'unknown')
         item_images = []
-        is_baked = False
-        is_baked_light = False
+        is_baked = name in baked_vpx_objects
+        is_baked_light = name in baked_vpx_lights
         is_physics = True
-        while not item_data.is_eof():
-            item_data.next()
-            if item_data.tag == 'NAME':
-                name = item_data.get_wide_string()
-                is_baked = name in baked_vpx_objects
-                is_baked_light = name in baked_vpx_lights
-                break
-            item_data.skip_tag()
-        item_data = biff_io.BIFF_reader(data)
-        item_type = item_data.get_32()
         layer_name = ''
         is_bulb = is_reflect_on_ball = False
         is_playfield_mesh = False
-        while not item_data.is_eof():
-            item_data.next()
+        for item_data in item_index.walk():
             reflection_field = visibility_field = False
             is_part_baked = is_baked
             if item_data.tag == 'NAME':
@@ -263,7 +279,6 @@ def export_vpx(op, context):
                         item_data.put_float(-2800)
             if is_part_baked and (visibility_field or reflection_field):
                 item_data.put_bool(False)
-            item_data.skip_tag()
         if is_playfield_mesh and not layer_name == 'VLM.Visuals':
             needs_playfield_physics = False
         # Filters out objects
@@ -276,8 +291,7 @@ def export_vpx(op, context):
         if remove:
             print(f'. Item {name:>21s} was removed from export table')
         else:
-            dst_stream = dst_gamestg.CreateStream(f'GameItem{n_game_items}', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-            dst_stream.Write(data)
+            dst_gamestg.write_stream(f'GameItem{n_game_items}', data)
             n_game_items += 1
         # Mark images as used or not (if baked)
         if remove or ((export_mode == 'remove' or export_mode == 'remove_all') and is_baked):
@@ -296,6 +310,9 @@ def export_vpx(op, context):
 
 
 
+    stage_times['Game items'] = time.time() - stage_start
+    stage_start = time.time()
+
     # Add new bake models and default playfield collider if needed
     meshes_to_export = sorted([obj for obj in result_col.all_objects], key=lambda x: f'{x.vlmSettings.bake_type == "lightmap"}-{x.name}')
     pfobj = None
@@ -317,193 +334,203 @@ def export_vpx(op, context):
         # FIXME For the time being, for some reason I can't get VPX to render the right playfield
         meshes_to_export.insert(0, pfobj) # collidable playfield_mesh must be the first
         # meshes_to_export.append(pfobj) # collidable playfield_mesh must be the last
-        br = biff_io.BIFF_reader(src_storage.openstream('GameStg/GameData').read())
-        while not br.is_eof():
-            br.next()
-            if br.tag == "FRCT":
-                pf_friction = br.get_float()
-            elif br.tag == "ELAS":
-                pf_elasticity = br.get_float()
-            elif br.tag == "ELFA":
-                pf_falloff = br.get_float()
-            elif br.tag == "PFSC":
-                pf_scatter = br.get_float()
-            br.skip_tag()
-    new_playfield_image = None
-    for obj in meshes_to_export:
-        uv_layer_nested = obj.data.uv_layers.get("UVMap Nested")
-        if not uv_layer_nested:
-            print(f'. Missing nested uv map for {obj.name}')
-            continue
-        is_light = obj.vlmSettings.bake_type == 'lightmap'
-        is_active = obj.vlmSettings.bake_type == 'active'
-        is_static = obj.vlmSettings.bake_type == 'static'
-        is_movable = obj.vlmSettings.bake_sync_trans != ''
-        is_playfield = playfield_col != '' and not is_light and obj.vlmSettings.bake_objects == playfield_col.name
-        if is_playfield: new_playfield_image = f'VLM.Nestmap{obj.vlmSettings.bake_nestmap}'
-        depth_bias = None
-        for col_name in obj.vlmSettings.bake_objects.split(';'):
-            col = vlm_collections.get_collection(bake_col, col_name, create=False)
-            if col:
-                if depth_bias != None and depth_bias != col.vlmSettings.depth_bias:
-                    print(f'ERROR: {obj.name} merges multiple bake collections with different depth bias settings {obj.vlmSettings.bake_objects}')
-                depth_bias = col.vlmSettings.depth_bias
-            elif obj != pfobj:
-                print(f'ERROR: {obj.name} contains object of missing bake collection {col}')
-        if not depth_bias: depth_bias = 0
-        if is_light: depth_bias = depth_bias - 10
-        writer = biff_io.BIFF_writer()
-        writer.write_u32(19)
-        writer.write_tagged_padded_vector(b'VPOS', obj.location[0]/global_scale, -obj.location[1]/global_scale, obj.location[2]/global_scale)
-        writer.write_tagged_padded_vector(b'VSIZ', obj.scale[0], obj.scale[1], obj.scale[2])
-        use_obj_pos = False
-        if obj.vlmSettings.bake_sync_trans:
-            sync_obj = bpy.data.objects.get(obj.vlmSettings.bake_sync_trans)
-            if sync_obj:
-                use_obj_pos = obj.vlmSettings.use_obj_pos
-        if use_obj_pos:
-            # RotX / RotY / RotZ
-            writer.write_tagged_float(b'RTV0', 0)
-            writer.write_tagged_float(b'RTV1', 0)
-            writer.write_tagged_float(b'RTV2', 0)
-            # TransX / TransY / TransZ
-            writer.write_tagged_float(b'RTV3', 0)
-            writer.write_tagged_float(b'RTV4', 0)
-            writer.write_tagged_float(b'RTV5', 0)
-            # ObjRotX / ObjRotY / ObjRotZ
-            writer.write_tagged_float(b'RTV6', math.degrees(obj.rotation_euler[0]))
-            writer.write_tagged_float(b'RTV7', math.degrees(obj.rotation_euler[1]))
-            writer.write_tagged_float(b'RTV8', -math.degrees(obj.rotation_euler[2]) - 180)
-        else:
-            # RotX / RotY / RotZ
-            writer.write_tagged_float(b'RTV0', math.degrees(obj.rotation_euler[0]))
-            writer.write_tagged_float(b'RTV1', math.degrees(obj.rotation_euler[1]))
-            writer.write_tagged_float(b'RTV2', -math.degrees(obj.rotation_euler[2]) - 180)
-            # TransX / TransY / TransZ
-            writer.write_tagged_float(b'RTV3', 0)
-            writer.write_tagged_float(b'RTV4', 0)
-            writer.write_tagged_float(b'RTV5', 0)
-            # ObjRotX / ObjRotY / ObjRotZ
-            writer.write_tagged_float(b'RTV6', 0)
-            writer.write_tagged_float(b'RTV7', 0)
-            writer.write_tagged_float(b'RTV8', 0)
-        writer.write_tagged_string(b'IMAG', f'VLM.Nestmap{obj.vlmSettings.bake_nestmap}')
-        writer.write_tagged_string(b'NRMA', '')
-        writer.write_tagged_u32(b'SIDS', 4)
-        writer.write_tagged_wide_string(b'NAME', 'playfield_mesh' if is_playfield else 'playfield_physics' if obj == pfobj else export_name(obj.name))
-        # writer.write_tagged_wide_string(b'NAME', 'playfield_mesh' if is_playfield or obj == pfobj else export_name(obj.name))
-        writer.write_tagged_string(b'MATR', 'VLM.Lightmap' if is_light else 'VLM.Bake.Active' if is_active else 'VLM.Bake.Solid')
-        writer.write_tagged_u32(b'SCOL', 0xFFFFFF)
-        writer.write_tagged_bool(b'TVIS', obj != pfobj)
-        writer.write_tagged_bool(b'DTXI', False)
-        writer.write_tagged_bool(b'HTEV', obj == pfobj)
-        writer.write_tagged_float(b'THRS', 2.0)
-        writer.write_tagged_float(b'ELAS', pf_elasticity if obj == pfobj else 0.3)
-        writer.write_tagged_float(b'ELFO', pf_falloff if obj == pfobj else 0.0)
-        writer.write_tagged_float(b'RFCT', pf_friction if obj == pfobj else 0.0)
-        writer.write_tagged_float(b'RSCT', pf_scatter if obj == pfobj else 0.0)
-        writer.write_tagged_float(b'EFUI', 0.0)
-        writer.write_tagged_float(b'CORF', 0.0)
-        writer.write_tagged_bool(b'CLDR', obj == pfobj)
-        writer.write_tagged_bool(b'ISTO', obj != pfobj)
-        writer.write_tagged_bool(b'U3DM', True)
-        writer.write_tagged_bool(b'STRE', is_static)
-        writer.write_tagged_u32(b'DILI', 255) # 255 if 1.0 for disable lighting
-        writer.write_tagged_float(b'DILB', 1.0) # also disable lighting from below
-        writer.write_tagged_bool(b'REEN', not is_playfield and context.scene.vlmSettings.enable_vpx_reflection)
-        writer.write_tagged_bool(b'EBFC', False)
-        writer.write_tagged_string(b'MAPH', '')
-        writer.write_tagged_bool(b'OVPH', True if obj == pfobj else False)
-        writer.write_tagged_bool(b'DIPT', False)
-        writer.write_tagged_bool(b'OSNM', False)
-        writer.write_tagged_string(b'M3DN', f'VLM.{obj.name}')
-        indices = []
-        vertices = []
-        vert_dict = {}
-        n_vertices = 0
-        for poly in obj.data.polygons:
-            if len(poly.loop_indices) != 3:
+        pf_friction = game_data_index.get_float('FRCT', pf_friction)
+        pf_elasticity = game_data_index.get_float('ELAS', pf_elasticity)
+        pf_falloff = game_data_index.get_float('ELFA', pf_falloff)
+        pf_scatter = game_data_index.get_float('PFSC', pf_scatter)
+
+    # Vertex and index buffers are compressed on a thread pool while the main thread prepares the next meshes.
+    # The number of items waiting for their compressed buffers is bounded to limit memory use.
+    compression_level = COMPRESSION_LEVELS[context.scene.vlmSettings.export_compression]
+    n_workers = max(1, os.cpu_count() or 1)
+    max_in_flight = 2 * n_workers
+    with ThreadPoolExecutor(max_workers=n_workers) as compression_pool:
+        pending_items = deque()
+        def write_compressed_item(item):
+            n_item, head, n_vertices, n_indices, vertices_future, indices_future, tail = item
+            wait_start = time.time()
+            compressed_vertices, vertices_time = vertices_future.result()
+            compressed_indices, indices_time = indices_future.result()
+            stage_times['Compression wait'] += time.time() - wait_start
+            stage_times['Compression (workers)'] += vertices_time + indices_time
+            writer = biff_io.BIFF_writer()
+            writer.write_tagged_u32(b'M3VN', n_vertices)
+            writer.write_tagged_u32(b'M3CY', len(compressed_vertices))
+            writer.write_tagged_data(b'M3CX', compressed_vertices)
+            writer.write_tagged_u32(b'M3FN', n_indices)
+            writer.write_tagged_u32(b'M3CJ', len(compressed_indices))
+            writer.write_tagged_data(b'M3CI', compressed_indices)
+            writer.close(write_endb=False)
+            dst_gamestg.write_stream(f'GameItem{n_item}', head.get_data() + writer.get_data() + tail.get_data())
+
+        new_playfield_image = None
+        for obj in meshes_to_export:
+            uv_layer_nested = obj.data.uv_layers.get("UVMap Nested")
+            if not uv_layer_nested:
+                print(f'. Missing nested uv map for {obj.name}')
                 continue
-            for loop_index in reversed(poly.loop_indices):
-                loop = obj.data.loops[loop_index]
-                x, y, z = obj.data.vertices[loop.vertex_index].co
-                nx, ny, nz = loop.normal
-                u, v = uv_layer_nested.data[loop_index].uv
-                vertex = (-x / global_scale, y / global_scale, z / global_scale, -nx, ny, nz, u, 1.0 - v)
-                existing_index = vert_dict.get(vertex, None)
-                if existing_index is None:
-                    vert_dict[vertex] = n_vertices
-                    vertices.extend(vertex)
-                    indices.append(n_vertices)
-                    n_vertices += 1
-                else:
-                    indices.append(existing_index)
-        n_indices = len(indices)
-        print(f'. Adding {n_vertices:>6} vertices, {int(n_indices/3):>6} faces for {obj.name}')
+            is_light = obj.vlmSettings.bake_type == 'lightmap'
+            is_active = obj.vlmSettings.bake_type == 'active'
+            is_static = obj.vlmSettings.bake_type == 'static'
+            is_movable = obj.vlmSettings.bake_sync_trans != ''
+            is_playfield = playfield_col != '' and not is_light and obj.vlmSettings.bake_objects == playfield_col.name
+            if is_playfield: new_playfield_image = f'VLM.Nestmap{obj.vlmSettings.bake_nestmap}'
+            depth_bias = None
+            for col_name in obj.vlmSettings.bake_objects.split(';'):
+                col = vlm_collections.get_collection(bake_col, col_name, create=False)
+                if col:
+                    if depth_bias != None and depth_bias != col.vlmSettings.depth_bias:
+                        print(f'ERROR: {obj.name} merges multiple bake collections with different depth bias settings {obj.vlmSettings.bake_objects}')
+                    depth_bias = col.vlmSettings.depth_bias
+                elif obj != pfobj:
+                    print(f'ERROR: {obj.name} contains object of missing bake collection {col}')
+            if not depth_bias: depth_bias = 0
+            if is_light: depth_bias = depth_bias - 10
+            writer = biff_io.BIFF_writer()
+            writer.write_u32(19)
+            writer.write_tagged_padded_vector(b'VPOS', obj.location[0]/global_scale, -obj.location[1]/global_scale, obj.location[2]/global_scale)
+            writer.write_tagged_padded_vector(b'VSIZ', obj.scale[0], obj.scale[1], obj.scale[2])
+            use_obj_pos = False
+            if obj.vlmSettings.bake_sync_trans:
+                sync_obj = bpy.data.objects.get(obj.vlmSettings.bake_sync_trans)
+                if sync_obj:
+                    use_obj_pos = obj.vlmSettings.use_obj_pos
+            if use_obj_pos:
+                # RotX / RotY / RotZ
+                writer.write_tagged_float(b'RTV0', 0)
+                writer.write_tagged_float(b'RTV1', 0)
+                writer.write_tagged_float(b'RTV2', 0)
+                # TransX / TransY / TransZ
+                writer.write_tagged_float(b'RTV3', 0)
+                writer.write_tagged_float(b'RTV4', 0)
+                writer.write_tagged_float(b'RTV5', 0)
+                # ObjRotX / ObjRotY / ObjRotZ
+                writer.write_tagged_float(b'RTV6', math.degrees(obj.rotation_euler[0]))
+                writer.write_tagged_float(b'RTV7', math.degrees(obj.rotation_euler[1]))
+                writer.write_tagged_float(b'RTV8', -math.degrees(obj.rotation_euler[2]) - 180)
+            else:
+                # RotX / RotY / RotZ
+                writer.write_tagged_float(b'RTV0', math.degrees(obj.rotation_euler[0]))
+                writer.write_tagged_float(b'RTV1', math.degrees(obj.rotation_euler[1]))
+                writer.write_tagged_float(b'RTV2', -math.degrees(obj.rotation_euler[2]) - 180)
+                # TransX / TransY / TransZ
+                writer.write_tagged_float(b'RTV3', 0)
+                writer.write_tagged_float(b'RTV4', 0)
+                writer.write_tagged_float(b'RTV5', 0)
+                # ObjRotX / ObjRotY / ObjRotZ
+                writer.write_tagged_float(b'RTV6', 0)
+                writer.write_tagged_float(b'RTV7', 0)
+                writer.write_tagged_float(b'RTV8', 0)
+            writer.write_tagged_string(b'IMAG', f'VLM.Nestmap{obj.vlmSettings.bake_nestmap}')
+            writer.write_tagged_string(b'NRMA', '')
+            writer.write_tagged_u32(b'SIDS', 4)
+            writer.write_tagged_wide_string(b'NAME', 'playfield_mesh' if is_playfield else 'playfield_physics' if obj == pfobj else export_name(obj.name))
+            # writer.write_tagged_wide_string(b'NAME', 'playfield_mesh' if is_playfield or obj == pfobj else export_name(obj.name))
+            writer.write_tagged_string(b'MATR', 'VLM.Lightmap' if is_light else 'VLM.Bake.Active' if is_active else 'VLM.Bake.Solid')
+            writer.write_tagged_u32(b'SCOL', 0xFFFFFF)
+            writer.write_tagged_bool(b'TVIS', obj != pfobj)
+            writer.write_tagged_bool(b'DTXI', False)
+            writer.write_tagged_bool(b'HTEV', obj == pfobj)
+            writer.write_tagged_float(b'THRS', 2.0)
+            writer.write_tagged_float(b'ELAS', pf_elasticity if obj == pfobj else 0.3)
+            writer.write_tagged_float(b'ELFO', pf_falloff if obj == pfobj else 0.0)
+            writer.write_tagged_float(b'RFCT', pf_friction if obj == pfobj else 0.0)
+            writer.write_tagged_float(b'RSCT', pf_scatter if obj == pfobj else 0.0)
+            writer.write_tagged_float(b'EFUI', 0.0)
+            writer.write_tagged_float(b'CORF', 0.0)
+            writer.write_tagged_bool(b'CLDR', obj == pfobj)
+            writer.write_tagged_bool(b'ISTO', obj != pfobj)
+            writer.write_tagged_bool(b'U3DM', True)
+            writer.write_tagged_bool(b'STRE', is_static)
+            writer.write_tagged_u32(b'DILI', 255) # 255 if 1.0 for disable lighting
+            writer.write_tagged_float(b'DILB', 1.0) # also disable lighting from below
+            writer.write_tagged_bool(b'REEN', not is_playfield and context.scene.vlmSettings.enable_vpx_reflection)
+            writer.write_tagged_bool(b'EBFC', False)
+            writer.write_tagged_string(b'MAPH', '')
+            writer.write_tagged_bool(b'OVPH', True if obj == pfobj else False)
+            writer.write_tagged_bool(b'DIPT', False)
+            writer.write_tagged_bool(b'OSNM', False)
+            writer.write_tagged_string(b'M3DN', f'VLM.{obj.name}')
+            mesh = obj.data
+            loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+            loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+            mesh.polygons.foreach_get('loop_start', loop_starts)
+            mesh.polygons.foreach_get('loop_total', loop_totals)
+            tri_loops = (loop_starts[loop_totals == 3][:, np.newaxis] + np.array([2, 1, 0], dtype=np.int32)).ravel() # Only triangles, with reversed winding
+            loop_vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', loop_vertex_indices)
+            co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', co)
+            normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+            mesh.loops.foreach_get('normal', normals)
+            uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            uv_layer_nested.data.foreach_get('uv', uvs)
+            # Computations are performed in double precision like VPX values were computed before being packed to floats
+            pos = co.reshape((-1, 3))[loop_vertex_indices[tri_loops]].astype(np.float64)
+            nor = normals.reshape((-1, 3))[tri_loops].astype(np.float64)
+            uv = uvs.reshape((-1, 2))[tri_loops].astype(np.float64)
+            loop_data = np.empty((len(tri_loops), 8), dtype=np.float64)
+            loop_data[:, 0] = -pos[:, 0] / global_scale
+            loop_data[:, 1] = pos[:, 1] / global_scale
+            loop_data[:, 2] = pos[:, 2] / global_scale
+            loop_data[:, 3] = -nor[:, 0]
+            loop_data[:, 4] = nor[:, 1]
+            loop_data[:, 5] = nor[:, 2]
+            loop_data[:, 6] = uv[:, 0]
+            loop_data[:, 7] = 1.0 - uv[:, 1]
+            vertices, indices = weld_vertices(loop_data)
+            n_vertices = len(vertices)
+            n_indices = len(indices)
+            print(f'. Adding {n_vertices:>6} vertices, {int(n_indices/3):>6} faces for {obj.name}')
         
-        writer.write_tagged_u32(b'M3VN', n_vertices)
-        #writer.write_tagged_data(b'M3DX', struct.pack(f'<{len(vertices)}f', *vertices))
-        compressed_vertices = zlib.compress(struct.pack(f'<{len(vertices)}f', *vertices))
-        writer.write_tagged_u32(b'M3CY', len(compressed_vertices))
-        writer.write_tagged_data(b'M3CX', compressed_vertices)
+            head_writer = writer
+            head_writer.close(write_endb=False)
+            #vertices_data = vertices.astype('<f4').tobytes() # M3DX
+            #indices_data = indices.astype('<u4' if n_vertices > 65535 else '<u2').tobytes() # M3DI
+            vertices_future = compression_pool.submit(compress_buffer, vertices.astype('<f4').tobytes(), compression_level)
+            indices_future = compression_pool.submit(compress_buffer, indices.astype('<u4' if n_vertices > 65535 else '<u2').tobytes(), compression_level)
         
-        writer.write_tagged_u32(b'M3FN', n_indices)
-        if n_vertices > 65535:
-            #writer.write_tagged_data(b'M3DI', struct.pack(f'<{n_indices}I', *indices))
-            compressed_indices = zlib.compress(struct.pack(f'<{n_indices}I', *indices))
-        else:
-            #writer.write_tagged_data(b'M3DI', struct.pack(f'<{n_indices}H', *indices))
-            compressed_indices = zlib.compress(struct.pack(f'<{n_indices}H', *indices))
-        writer.write_tagged_u32(b'M3CJ', len(compressed_indices))
-        writer.write_tagged_data(b'M3CI', compressed_indices)
-        writer.write_tagged_float(b'PIDB', depth_bias)
-        writer.write_tagged_bool(b'ADDB', is_light) # Additive blending VPX mod
-        writer.write_tagged_float(b'FALP', 100) # Additive blending VPX mod
-        writer.write_tagged_u32(b'COLR', 0xFFFFFF)
-        writer.write_tagged_bool(b'LOCK', True)
-        writer.write_tagged_bool(b'LVIS', True)
-        writer.write_tagged_u32(b'LAYR', 0)
-        writer.write_tagged_string(b'LANR', 'VLM.Visuals')
-        writer.close()
-        dst_stream = dst_gamestg.CreateStream(f'GameItem{n_game_items}', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-        dst_stream.Write(writer.get_data())
-        n_game_items += 1
+            writer = biff_io.BIFF_writer()
+            writer.write_tagged_float(b'PIDB', depth_bias)
+            writer.write_tagged_bool(b'ADDB', is_light) # Additive blending VPX mod
+            writer.write_tagged_float(b'FALP', 100) # Additive blending VPX mod
+            writer.write_tagged_u32(b'COLR', 0xFFFFFF)
+            writer.write_tagged_bool(b'LOCK', True)
+            writer.write_tagged_bool(b'LVIS', True)
+            writer.write_tagged_u32(b'LAYR', 0)
+            writer.write_tagged_string(b'LANR', 'VLM.Visuals')
+            writer.close()
+            pending_items.append((n_game_items, head_writer, n_vertices, n_indices, vertices_future, indices_future, writer))
+            n_game_items += 1
+            while len(pending_items) > max_in_flight:
+                write_compressed_item(pending_items.popleft())
+        while pending_items:
+            write_compressed_item(pending_items.popleft())
+    stage_times['Meshes'] = time.time() - stage_start - stage_times['Compression wait']
+    stage_start = time.time()
             
     # Mark playfield image has removable
     if new_playfield_image:
-        br = biff_io.BIFF_reader(src_storage.openstream('GameStg/GameData').read())
-        while not br.is_eof():
-            br.next()
-            if br.tag == "IMAG":
-                image = br.get_string()
-                if image not in removed_images:
-                    removed_images[image] = ['PF']
-                else:
-                    removed_images[image].append('PF')
-                break
-            br.skip_tag()
+        image = game_data_index.get_string('IMAG')
+        if image is not None:
+            if image not in removed_images:
+                removed_images[image] = ['PF']
+            else:
+                removed_images[image].append('PF')
 
     # Remove previous nestmaps
     n_images = 0
     n_read_images = 0
     while src_storage.exists(f'GameStg/Image{n_read_images}'):
         data = src_storage.openstream(f'GameStg/Image{n_read_images}').read()
-        br = biff_io.BIFF_reader(data)
-        name = 'unknown'
-        while not br.is_eof():
-            br.next()
-            if br.tag == "NAME":
-                name = br.get_string()
-                break
-            br.skip_tag()
+        name = biff_io.BIFF_index(memoryview(data)).get_string('NAME', 'unknown')
         remove = name.startswith('VLM.Nestmap')
         remove = remove or (export_mode=='remove_all' and name not in used_images and name in removed_images)
         if remove:
             print(f'. Image {name:>20s} was removed from export table')
         else:
             print(f'. Image {name:>20s} was kept (known users: {used_images.get(name)})')
-            dst_stream = dst_gamestg.CreateStream(f'Image{n_images}', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-            dst_stream.Write(data)
+            dst_gamestg.write_stream(f'Image{n_images}', data)
             n_images += 1
         n_read_images = n_read_images + 1
 
@@ -542,8 +569,7 @@ def export_vpx(op, context):
         writer.write_data(img_writer.get_data())
         writer.write_tagged_float(b'ALTV', 1.0) # Limit for pixel cut and z write
         writer.close()
-        dst_stream = dst_gamestg.CreateStream(f'Image{n_images}', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-        dst_stream.Write(writer.get_data())
+        dst_gamestg.write_stream(f'Image{n_images}', writer.get_data())
         #print(f'. Adding Nestmap #{nestmap_index} as a {width:>4} x {height:>4} image (Format: {"EXR" if is_hdr else "PNG"})')
         print(f'. Adding Nestmap #{nestmap_index} as a {width:>4} x {height:>4} image (HDR: {is_hdr})')
         nestmap_index += 1
@@ -594,6 +620,9 @@ def export_vpx(op, context):
             return push_map_move([obj for obj in result_col.all_objects if obj.vlmSettings.bake_type == 'lightmap' and obj.vlmSettings.bake_sync_trans == pending[2]], int(pending[1]))
 
 
+    stage_times['Images'] = time.time() - stage_start
+    stage_start = time.time()
+
     # Copy data from reference file
     for src_path, mode, hashed in file_structure:
         if not src_storage.exists(src_path):
@@ -744,32 +773,29 @@ def export_vpx(op, context):
             br.put_u32(n_materials + n_material_to_add)
             br.pos = mate_pos - 8
             br.put_u32((n_materials + n_material_to_add) * 76 + 4)
-            for i, d in enumerate(wr.get_data()):
-                br.data.insert(mate_pos + i, d)
-            if phma_pos > mate_pos:
-                phma_pos += len(wr.get_data())
+            br.pos = mate_pos
+            br.insert_data(wr.get_data())
             br.pos = phma_pos - 8
             br.put_u32((n_materials + n_material_to_add) * 48 + 4)
-            for i, d in enumerate(pr.get_data()):
-                br.data.insert(phma_pos + i, d)
-            data = bytes(br.data)
+            br.pos = phma_pos
+            br.insert_data(pr.get_data())
+            data = br.get_data()
         if hashed:
             if mode == 0:
-                data_hash.CryptHashData(data)
+                data_hash.update(data)
             elif mode == 1:
                 br = biff_io.BIFF_reader(data)
                 while not br.is_eof():
                     br.next()
                     if br.tag == "CODE": # For some reason, the code length info is not hashed, just the tag and code string
-                        data_hash.CryptHashData(b'CODE')
+                        data_hash.update(b'CODE')
                         code_length = br.get_u32() 
-                        data_hash.CryptHashData(br.get(code_length))
+                        data_hash.update(br.get(code_length))
                     else: # Biff tags and data are hashed but not their size
-                        data_hash.CryptHashData(br.get_record_data(True))
-        dst_stream = dst_st.CreateStream(src_path.split('/')[-1], storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-        dst_stream.Write(data)
+                        data_hash.update(br.get_record_data(True))
+        dst_st.write_stream(src_path.split('/')[-1], data)
         if src_path == 'GameStg/CustomInfoTags': # process the custom info tags since they need to be hashed
-            br = biff_io.BIFF_reader(data)
+            br = biff_io.BIFF_reader(data, zero_copy=True)
             while not br.is_eof():
                 br.next()
                 if br.tag == "CUST":
@@ -777,20 +803,16 @@ def export_vpx(op, context):
                     print(f'Hashing custom information block {cust_name}')
                     if src_storage.exists(f'TableInfo/f{cust_name}'):
                         data = src_storage.openstream(f'TableInfo/f{cust_name}').read()
-                        data_hash.CryptHashData(data)
-                        dst_stream = dst_tableinfo.CreateStream(cust_name, storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-                        dst_stream.Write(data)
+                        data_hash.update(data)
+                        dst_tableinfo.write_stream(cust_name, data)
                 else:
                     br.skip_tag()
 
-    hash_size = data_hash.CryptGetHashParam(win32cryptcon.HP_HASHSIZE)
-    file_hash = data_hash.CryptGetHashParam(win32cryptcon.HP_HASHVAL)
-    data_hash.CryptDestroyHash()
-    crypt_context.CryptReleaseContext()
-    dst_stream = dst_gamestg.CreateStream('MAC', storagecon.STGM_DIRECT | storagecon.STGM_READWRITE | storagecon.STGM_SHARE_EXCLUSIVE | storagecon.STGM_CREATE, 0, 0)
-    dst_stream.Write(file_hash)
-    dst_storage.Commit(storagecon.STGC_DEFAULT)
+    file_hash = data_hash.digest()
+    dst_gamestg.write_stream('MAC', file_hash)
+    dst_storage.close()
     src_storage.close()
+    stage_times['Game data & hash'] = time.time() - stage_start
 
     # Create the script helper file
     code = ''
@@ -928,6 +950,9 @@ def export_vpx(op, context):
     print(f". {n_images} images exported in table files")
     print(". Images marked as used:", list(used_images.keys()))
     print(". Images marked as deletable:", list(removed_images.keys()))
+    print(f". Export timings (compression level {compression_level}):")
+    for stage, length in stage_times.items():
+        print(f".   {stage:<22s} {length:>7.2f}s")
 
     print(f'\nExport finished.')
     return {"FINISHED"}
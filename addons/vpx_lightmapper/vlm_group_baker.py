@@ -18,25 +18,136 @@ import os
 import math
 import mathutils
 import time
+import random
+import numpy as np
 from . import vlm_utils
 from . import vlm_camera
 from . import vlm_collections
+from . import vlm_raster
+from . import vlm_render_cache
 from PIL import Image # External dependency
 
-def projected_bounds_area(mvp_matrix, obj):
-    max_x = max_y = -10000000
-    min_x = min_y = 10000000
+def projected_corners(mvp_matrix, obj, depsgraph):
+    """Return the homogeneous clip space coordinates (n, 4) of the vertices (or bounding box corners for non mesh objects)
+    of an object, evaluated with its modifiers since they can add geometry outside of the base mesh"""
+    eval_obj = obj.evaluated_get(depsgraph)
     if obj.type == 'MESH':
-        corners = [mvp_matrix @ obj.matrix_world @ mathutils.Vector((v.co[0], v.co[1], v.co[2], 1)) for v in obj.data.vertices]
+        co = np.empty(len(eval_obj.data.vertices) * 3, dtype=np.float32)
+        eval_obj.data.vertices.foreach_get('co', co)
+        co = co.reshape((-1, 3))
     else:
-        corners = [mvp_matrix @ obj.matrix_world @ mathutils.Vector((corner[0], corner[1], corner[2], 1)) for corner in obj.bound_box]
-    proj_x = [o for o in map(lambda a: a.x / a.w, corners)]
-    proj_y = [o for o in map(lambda a: a.y / a.w, corners)]
-    min_x = min(min_x, min(proj_x))
-    min_y = min(min_y, min(proj_y))
-    max_x = max(max_x, max(proj_x))
-    max_y = max(max_y, max(proj_y))
-    return (max_x - min_x) * (max_y - min_y)
+        co = np.array([corner[:] for corner in eval_obj.bound_box], dtype=np.float32)
+    matrix = np.array(mvp_matrix @ eval_obj.matrix_world, dtype=np.float64)
+    return co @ matrix[:, :3].T + matrix[:, 3]
+
+
+def projected_pixel_bounds(mvp_matrix, objects, width, height, pad, depsgraph):
+    """Evaluate the pixel bounds (min_x, min_y, max_x, max_y) of the given objects, with y going downward, or None
+    if the projection is not reliable (object crossing the camera plane)"""
+    corners = np.concatenate([projected_corners(mvp_matrix, obj, depsgraph) for obj in objects])
+    if len(corners) == 0 or np.any(corners[:, 3] <= 0):
+        return None
+    proj_x = (1 + corners[:, 0] / corners[:, 3]) * 0.5 * width
+    proj_y = (1 - corners[:, 1] / corners[:, 3]) * 0.5 * height
+    return (max(0, math.floor(proj_x.min()) - pad), max(0, math.floor(proj_y.min()) - pad),
+        min(width, math.ceil(proj_x.max()) + pad), min(height, math.ceil(proj_y.max()) + pad))
+
+
+def projected_bounds_area(mvp_matrix, obj, depsgraph):
+    corners = projected_corners(mvp_matrix, obj, depsgraph)
+    if len(corners) == 0:
+        return 0
+    proj = corners[:, :2] / corners[:, 3:4]
+    size = proj.max(axis=0) - proj.min(axis=0)
+    return size[0] * size[1]
+
+
+def crop_mask(alpha):
+    """Crop a 2D mask to its non zero area, returning ((min_y, min_x, max_y, max_x), cropped mask) or (None, None) for empty masks"""
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if len(rows) == 0:
+        return (None, None)
+    cols = np.flatnonzero(alpha.any(axis=0))
+    bounds = (rows[0], cols[0], rows[-1] + 1, cols[-1] + 1)
+    return (bounds, alpha[bounds[0]:bounds[2], bounds[1]:bounds[3]] > 0)
+
+
+def masks_overlap(a, b):
+    """Evaluate if 2 cropped masks (as returned by crop_mask) have common covered pixels"""
+    (a_bounds, a_mask), (b_bounds, b_mask) = a, b
+    if a_bounds is None or b_bounds is None:
+        return False
+    min_y, min_x = max(a_bounds[0], b_bounds[0]), max(a_bounds[1], b_bounds[1])
+    max_y, max_x = min(a_bounds[2], b_bounds[2]), min(a_bounds[3], b_bounds[3])
+    if min_y >= max_y or min_x >= max_x:
+        return False
+    return np.any(a_mask[min_y - a_bounds[0]:max_y - a_bounds[0], min_x - a_bounds[1]:max_x - a_bounds[1]]
+        & b_mask[min_y - b_bounds[0]:max_y - b_bounds[0], min_x - b_bounds[1]:max_x - b_bounds[1]])
+
+
+def greedy_coloring(adjacency):
+    """Assign each vertex, in order, to the first color not used by its already colored neighbors"""
+    colors = [-1] * len(adjacency)
+    for v, neighbors in enumerate(adjacency):
+        used = {colors[n] for n in neighbors}
+        colors[v] = next(c for c in range(len(adjacency) + 1) if c not in used)
+    return colors
+
+
+def dsatur_coloring(adjacency, rng=None):
+    """DSatur graph coloring: color the vertex with the most differently colored neighbors first (ties are broken by
+    the number of uncolored neighbors, then by order or randomly if a random generator is given)"""
+    n = len(adjacency)
+    colors = [-1] * n
+    neighbor_colors = [set() for v in range(n)]
+    degrees = [len(neighbors) for neighbors in adjacency]
+    uncolored = set(range(n))
+    tie_break = [rng.random() for v in range(n)] if rng else [-v for v in range(n)]
+    while uncolored:
+        v = max(uncolored, key=lambda u: (len(neighbor_colors[u]), degrees[u], tie_break[u]))
+        c = next(c for c in range(n + 1) if c not in neighbor_colors[v])
+        colors[v] = c
+        uncolored.remove(v)
+        for u in adjacency[v]:
+            neighbor_colors[u].add(c)
+            degrees[u] -= 1
+    return colors
+
+
+def optimize_coloring(adjacency, time_budget, max_stall):
+    """Search for a coloring using as few colors as possible, starting from the best of a DSatur and a greedy coloring, then trying randomized
+    DSatur colorings until a clique lower bound is reached, max_stall tries in a row did not improve the coloring,
+    or the time budget is elapsed. Returns the best coloring."""
+    start_time = time.time()
+    best = dsatur_coloring(adjacency)
+    greedy = greedy_coloring(adjacency) # DSatur is usually better but not always, so never do worse than the in order coloring
+    if max(greedy, default=-1) < max(best, default=-1):
+        best = greedy
+    # Lower bound from a greedily grown clique
+    lower_bound = 0
+    for v in range(len(adjacency)):
+        clique = [v]
+        for u in sorted(adjacency[v], key=lambda u: -len(adjacency[u])):
+            if all(u in adjacency[w] for w in clique):
+                clique.append(u)
+        lower_bound = max(lower_bound, len(clique))
+    rng = random.Random(0)
+    n_stall = 0
+    while max(best, default=-1) + 1 > lower_bound and n_stall < max_stall and time.time() - start_time < time_budget:
+        colors = dsatur_coloring(adjacency, rng)
+        if max(colors) < max(best):
+            best = colors
+            n_stall = 0
+        else:
+            n_stall += 1
+    return best
+
+
+def save_mask(mask, filepath):
+    """Save a coverage mask as a white RGBA image using the mask as alpha, like the masks rendered by Blender"""
+    pixels = np.full(mask.shape + (4,), 255, dtype=np.uint8)
+    pixels[:, :, 3] = mask
+    Image.fromarray(pixels, 'RGBA').save(bpy.path.abspath(filepath))
 
 
 def compute_render_groups(op, context):
@@ -68,6 +179,9 @@ def compute_render_groups(op, context):
     print(f"\nEvaluating render groups")
     opt_mask_size = 1024 # Height used for the object masks
     opt_force_render = False # Force rendering even if cache is available
+    opt_layered_masks = True # Render objects with non overlapping projected bounds together, then split their masks
+    opt_group_time_budget = 10.0 # Time budget in seconds for the render group assignment optimization
+    opt_group_max_stall = 200 # Stop the render group assignment optimization after this number of tries without improvement
 
     # Force a camera update
     vlm_camera.camera_inclination_update(op, context)
@@ -94,74 +208,133 @@ def compute_render_groups(op, context):
     scene.world = None
     scene.use_nodes = False
 
+    depsgraph = context.evaluated_depsgraph_get()
     modelview_matrix = camera_object.matrix_basis.inverted()
-    projection_matrix = camera_object.calc_matrix_camera(context.evaluated_depsgraph_get(),
+    projection_matrix = camera_object.calc_matrix_camera(depsgraph,
         x = scene.render.resolution_x,
         y = scene.render.resolution_y,
         scale_x = scene.render.pixel_aspect_x,
         scale_y = scene.render.pixel_aspect_y)
     mvp_matrix = projection_matrix @ modelview_matrix
 
-    object_masks = []
+    render_cache = vlm_render_cache.RenderCache(context)
     bakepath = vlm_utils.get_bakepath(context, type='MASKS')
     vlm_utils.mkpath(bakepath)
     for obj in bake_col.all_objects:
         obj.vlmSettings.render_group = -1
     all_objects = list([o for o in bake_col.all_objects if not o.vlmSettings.indirect_only])
-    object_surfaces = [projected_bounds_area(mvp_matrix, o) for o in all_objects]
+    object_surfaces = [projected_bounds_area(mvp_matrix, o, depsgraph) for o in all_objects]
     all_objects = sorted(zip(object_surfaces, all_objects), key=lambda pair: pair[0], reverse=True)
-    for i, (area, obj) in enumerate(all_objects, start=1):
-        if obj.vlmSettings.indirect_only:
-            print(f". Skipping   object mask #{i:>3}/{len(all_objects)} for '{obj.name}' since it is only indirectly influencing the scene")
-            continue
-        if obj.vlmSettings.render_group != -1: # Render group already defined
-            continue
+    mask_jobs = []
+    for area, obj in all_objects:
         if obj.vlmSettings.bake_to:
-            scene.render.filepath = f"{bakepath}{vlm_utils.clean_filename(obj.vlmSettings.bake_to.name)}.png"
+            if next((job for job in mask_jobs if job[1].vlmSettings.bake_to == obj.vlmSettings.bake_to), None):
+                continue
+            filepath = f"{bakepath}{vlm_utils.clean_filename(obj.vlmSettings.bake_to.name)}.png"
             obj_group = [o for _, o in all_objects if o.vlmSettings.bake_to == obj.vlmSettings.bake_to]
             obj_group.append(obj.vlmSettings.bake_to)
-            print(f". Evaluating object mask #{i:>3}/{len(all_objects)} for bake target '{obj.vlmSettings.bake_to.name}' ({[o.name for o in obj_group]} with a total projected area of {area})")
         else:
-            scene.render.filepath = f"{bakepath}{vlm_utils.clean_filename(obj.name)}.png"
+            filepath = f"{bakepath}{vlm_utils.clean_filename(obj.name)}.png"
             obj_group = [obj]
-            print(f". Evaluating object mask #{i:>3}/{len(all_objects)} for '{obj.name}' (projected area of {area})")
-        need_render = opt_force_render or not os.path.exists(bpy.path.abspath(scene.render.filepath))
-        if not need_render:
-            im = Image.open(bpy.path.abspath(scene.render.filepath))
-            need_render = im.size[0] != scene.render.resolution_x or im.size[1] != scene.render.resolution_y
-        if need_render:
-            for o in obj_group: scene.collection.objects.link(o)
-            bpy.ops.render.render(write_still=True, scene=scene.name)
-            for o in obj_group: scene.collection.objects.unlink(o)
-            im = Image.open(bpy.path.abspath(scene.render.filepath))
-        # Evaluate if this object can be grouped with previous renders (no overlaps)
-        for p in range(opt_mask_pad):
-            im.alpha_composite(im, (0, 1))
-            im.alpha_composite(im, (0, -1))
-            im.alpha_composite(im, (1, 0))
-            im.alpha_composite(im, (-1, 0))
-        alpha = im.tobytes("raw", "A")
+        mask_hash = render_cache.mask_digest(camera_object, obj_group, scene.render.resolution_x, scene.render.resolution_y)
+        need_render = opt_force_render or not render_cache.is_valid(filepath, mask_hash)
+        mask_jobs.append((area, obj, obj_group, filepath, mask_hash, need_render))
+
+    # Rasterize missing object masks on the CPU (no render engine needed, binary masks)
+    if context.scene.vlmSettings.mask_mode == 'raster':
+        for job in (job for job in mask_jobs if job[5]):
+            print(f". Rasterizing object mask for {[o.name for o in job[2]]}")
+            save_mask(vlm_raster.rasterize_objects(job[2], mvp_matrix, scene.render.resolution_x, scene.render.resolution_y, depsgraph), job[3])
+            render_cache.store(job[3], job[4])
+        mask_jobs = [job[:5] + (False,) for job in mask_jobs]
+
+    # Render missing object masks. Objects with non overlapping projected bounds are rendered together in layers,
+    # each object mask being then extracted from its bounds (the bounds are padded to account for antialiasing).
+    width, height = scene.render.resolution_x, scene.render.resolution_y
+    layers = []
+    for job in (job for job in mask_jobs if job[5]):
+        bounds = projected_pixel_bounds(mvp_matrix, job[2], width, height, 2, depsgraph) if opt_layered_masks else None
+        layer = None
+        if bounds:
+            layer = next((l for l in layers if l[0] and all(
+                b[2] <= bounds[0] or bounds[2] <= b[0] or b[3] <= bounds[1] or bounds[3] <= b[1] for b in l[0])), None)
+        if layer:
+            layer[0].append(bounds)
+            layer[1].append(job)
+        else:
+            layers.append(([bounds] if bounds else None, [job]))
+    n_mask_renders = sum(len(layer[1]) for layer in layers)
+    if layers:
+        print(f". Rendering {n_mask_renders} object masks in {len(layers)} renders")
+    layer_path = f"{bakepath}VLM.Layer.png"
+    for layer_index, (bounds_list, jobs) in enumerate(layers, start=1):
+        if len(jobs) == 1:
+            print(f". Rendering object mask {layer_index:>3}/{len(layers)} for {[o.name for o in jobs[0][2]]}")
+        else:
+            print(f". Rendering object mask {layer_index:>3}/{len(layers)} for {len(jobs)} objects")
+        linked_objects = list({o: True for job in jobs for o in job[2]})
+        for o in linked_objects: scene.collection.objects.link(o)
+        scene.render.filepath = jobs[0][3] if len(jobs) == 1 else layer_path
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+        for o in linked_objects: scene.collection.objects.unlink(o)
+        if len(jobs) > 1:
+            layer_im = np.asarray(Image.open(bpy.path.abspath(layer_path)).convert('RGBA'))
+            for (min_x, min_y, max_x, max_y), job in zip(bounds_list, jobs):
+                job_im = np.zeros_like(layer_im)
+                job_im[min_y:max_y, min_x:max_x] = layer_im[min_y:max_y, min_x:max_x]
+                Image.fromarray(job_im, 'RGBA').save(bpy.path.abspath(job[3]))
+        for job in jobs:
+            render_cache.store(job[3], job[4])
+    if os.path.exists(bpy.path.abspath(layer_path)):
+        os.remove(bpy.path.abspath(layer_path))
+
+    group_jobs = []
+    for i, (area, obj, obj_group, filepath, mask_hash, need_render) in enumerate(mask_jobs, start=1):
+        if obj.vlmSettings.bake_to:
+            print(f". Evaluating object mask #{i:>3}/{len(mask_jobs)} for bake target '{obj.vlmSettings.bake_to.name}' ({[o.name for o in obj_group]} with a total projected area of {area})")
+        else:
+            print(f". Evaluating object mask #{i:>3}/{len(mask_jobs)} for '{obj.name}' (projected area of {area})")
+        im = Image.open(bpy.path.abspath(filepath))
+        alpha = np.frombuffer(im.tobytes("raw", "A"), dtype=np.uint8).reshape((im.size[1], im.size[0]))
+        alpha = vlm_raster.dilate_mask(alpha, opt_mask_pad)
         if obj.vlmSettings.use_bake:
-            im = Image.frombytes('L', (scene.render.resolution_x, scene.render.resolution_y), bytes(alpha), 'raw')
+            im = Image.frombytes('L', (scene.render.resolution_x, scene.render.resolution_y), alpha.tobytes(), 'raw')
             im.save(bpy.path.abspath(f'{bakepath}Mask - Bake - {obj.name} (Padded LD).png'))
-            print(f". Skipping   object mask #{i:>3}/{len(all_objects)} for '{obj.name}' since it use traditional baking instead of projective baking")
+            print(f". Skipping   object mask #{i:>3}/{len(mask_jobs)} for '{obj.name}' since it use traditional baking instead of projective baking")
             continue
-        n_groups = len(object_masks)
-        g = n_groups
-        for group_index in range(n_groups):
-            ga = object_masks[group_index]
-            if next((b for b in zip(alpha, ga) if b[0] > 0.0 and b[1] > 0.0), None) is None:
-                object_masks[group_index] = [max(b[0],b[1]) for b in zip(alpha, ga)]
-                g = group_index
-                break
-        if g == n_groups:
-            object_masks.append(alpha)
+        bounds, coverage = crop_mask(alpha)
+        group_jobs.append((obj_group, bounds, coverage, alpha[bounds[0]:bounds[2], bounds[1]:bounds[3]].copy() if bounds else None))
+
+    # Evaluate the overlap graph of the padded masks, and group objects without overlaps using as few groups as possible
+    adjacency = [set() for job in group_jobs]
+    for i in range(len(group_jobs)):
+        for j in range(i + 1, len(group_jobs)):
+            if masks_overlap(group_jobs[i][1:3], group_jobs[j][1:3]):
+                adjacency[i].add(j)
+                adjacency[j].add(i)
+    greedy_groups = greedy_coloring(adjacency)
+    optimized_groups = optimize_coloring(adjacency, opt_group_time_budget, opt_group_max_stall)
+    n_greedy = max(greedy_groups, default=-1) + 1
+    n_optimized = max(optimized_groups, default=-1) + 1
+    if n_optimized < n_greedy:
+        print(f". Render group optimization saved {n_greedy - n_optimized} groups compared to greedy assignment ({n_optimized} instead of {n_greedy})")
+        job_groups = optimized_groups
+    else:
+        print(f". Render group optimization did not find a better assignment than greedy assignment ({n_greedy} groups)")
+        job_groups = greedy_groups
+    object_masks = [np.zeros((scene.render.resolution_y, scene.render.resolution_x), dtype=np.uint8) for g in range(max(job_groups, default=-1) + 1)]
+    for (obj_group, bounds, coverage, alpha), g in zip(group_jobs, job_groups):
+        if bounds:
+            group_mask = object_masks[g][bounds[0]:bounds[2], bounds[1]:bounds[3]]
+            np.maximum(group_mask, alpha, out=group_mask)
         for o in obj_group:
             o.vlmSettings.render_group = g
     
+    render_cache.save()
+
     # Save group masks for later use
     for i, group in enumerate(object_masks):
-        im = Image.frombytes('L', (scene.render.resolution_x, scene.render.resolution_y), bytes(group), 'raw')
+        im = Image.frombytes('L', (scene.render.resolution_x, scene.render.resolution_y), group.tobytes(), 'raw')
         im.save(bpy.path.abspath(f'{bakepath}Mask - Group {i} (Padded LD).png'))
 
 
@@ -237,6 +410,15 @@ def render_group_masks(op, context):
 
     print(f'\nEvaluating {n_render_groups} render group masks')
     bakepath = vlm_utils.get_bakepath(context, type='MASKS')
+    if context.scene.vlmSettings.mask_mode == 'raster':
+        depsgraph = context.evaluated_depsgraph_get()
+        modelview_matrix = camera_object.matrix_basis.inverted()
+        projection_matrix = camera_object.calc_matrix_camera(depsgraph,
+            x = scene.render.resolution_x,
+            y = scene.render.resolution_y,
+            scale_x = scene.render.pixel_aspect_x,
+            scale_y = scene.render.pixel_aspect_y)
+        mvp_matrix = projection_matrix @ modelview_matrix
     for group_index in range(n_render_groups):
         linked_objects = []
         for obj in bake_col.all_objects:
@@ -251,6 +433,13 @@ def render_group_masks(op, context):
                     linked_objects.append(obj)
         print(f'\n. Rendering group #{group_index+1}/{n_render_groups} ({len(linked_objects)} objects)')
         
+        if context.scene.vlmSettings.mask_mode == 'raster':
+            for obj in linked_objects:
+                scene.collection.objects.unlink(obj)
+            save_mask(vlm_raster.rasterize_objects(linked_objects, mvp_matrix, scene.render.resolution_x, scene.render.resolution_y, depsgraph),
+                f'{bakepath}Mask - Group {group_index}.png')
+            continue
+
         scene.render.filepath = f'{bakepath}Mask - Group {group_index}.png'
         scene.render.image_settings.file_format = 'PNG'
         scene.render.image_settings.color_mode = 'RGBA'
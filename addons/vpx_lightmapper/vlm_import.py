@@ -15,7 +15,6 @@
 
 import bpy
 import re
-import struct
 import bmesh
 import os
 import io
@@ -23,6 +22,7 @@ import importlib
 import math
 import mathutils
 import zlib
+import numpy as np
 from math import radians
 from bpy_extras.io_utils import axis_conversion
 from . import biff_io
@@ -361,7 +361,7 @@ def read_vpx(op, context, filepath):
         print(f"VPX file version: {version/100}")
 
         # Read the table informations
-        game_data = biff_io.BIFF_reader(ole.openstream('GameStg/GameData').read())
+        game_data = biff_io.BIFF_reader(ole.openstream('GameStg/GameData').read(), zero_copy=True)
         n_materials = 0
         env_image = ""
         env_light_height = 0
@@ -467,47 +467,22 @@ def read_vpx(op, context, filepath):
         opaque_images = ['']
         alpha_images = ['']
         for index in range(n_images):
-            image_data = biff_io.BIFF_reader(ole.openstream(f"GameStg/Image{index}").read())
-            vpx_name = ""
-            path = ""
-            width = 0
-            height = 0
+            image_index = biff_io.BIFF_index(memoryview(ole.openstream(f"GameStg/Image{index}").read()))
+            vpx_name = image_index.get_string('NAME', "")
+            path = image_index.get_string('PATH', "")
+            width = image_index.get_u32('WDTH', 0)
+            height = image_index.get_u32('HGHT', 0)
             size = 0
             data = ""
-            while not image_data.is_eof():
-                image_data.next()
-                if image_data.tag == 'NAME':
-                    vpx_name = image_data.get_string()
-                elif image_data.tag == 'PATH':
-                    path = image_data.get_string()
-                elif image_data.tag == 'WDTH':
-                    width = image_data.get_u32()
-                elif image_data.tag == 'HGHT':
-                    height = image_data.get_u32()
-                elif image_data.tag == 'ALTV':
-                    image_data.skip_tag()
-                elif image_data.tag == 'BITS':
-                    print(f"GameStg/Image{index} {vpx_name}: Unsupported bmp image file")
-                    #uncompressed = zlib.decompress(image_data.data[image_data.pos:]) #, wbits=9)
-                    data = None
-                    break
-                elif image_data.tag == 'JPEG':
-                    sub_data = image_data.child_reader()
-                    while not sub_data.is_eof():
-                        sub_data.next()
-                        if sub_data.tag == 'SIZE':
-                            size = sub_data.get_u32()
-                        elif sub_data.tag == 'DATA':
-                            data = sub_data.get(size)
-                        elif sub_data.tag == 'NAME':
-                            sub_data.skip_tag()
-                        elif sub_data.tag == 'PATH':
-                            path = sub_data.get_string()
-                        else:
-                            sub_data.skip_tag()
-                    image_data.skip(sub_data.pos)
-                else:
-                    image_data.skip_tag()
+            if 'BITS' in image_index:
+                print(f"GameStg/Image{index} {vpx_name}: Unsupported bmp image file")
+                data = None
+            elif 'JPEG' in image_index:
+                jpeg_index = image_index.sub_index('JPEG')
+                size = jpeg_index.get_u32('SIZE', 0)
+                if 'DATA' in jpeg_index:
+                    data = jpeg_index.get_data('DATA')[:size].tobytes()
+                path = jpeg_index.get_string('PATH', path)
             name = f"VPX.Tex.{vpx_name.casefold()}"
             if name in bpy.data.images:
                 image = bpy.data.images[name]
@@ -597,7 +572,7 @@ def read_vpx(op, context, filepath):
         insert_cups = []
         for index in range(n_items):
             name = ""
-            item_data = biff_io.BIFF_reader(ole.openstream(f"GameStg/GameItem{index}").read())
+            item_data = biff_io.BIFF_reader(ole.openstream(f"GameStg/GameItem{index}").read(), zero_copy=True)
             item_type = item_data.get_32()
 
             if item_type == 0: # Surface (wall)
@@ -1432,10 +1407,8 @@ def read_vpx(op, context, filepath):
                 image = ""
                 compressed_indices_size = 0
                 compressed_vertices_size = 0
-                vertices = []
-                normals = []
-                faces = []
-                uvs = []
+                vertices = np.zeros(0, dtype=biff_io.VERTEX_DTYPE)
+                indices = np.zeros(0, dtype=np.uint16)
                 visible = True
                 rot_tra = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
                 position = (0.0, 0.0, 0.0)
@@ -1485,49 +1458,17 @@ def read_vpx(op, context, filepath):
                     elif item_data.tag == 'M3CJ':
                         compressed_indices_size = item_data.get_u32()
                     elif item_data.tag == 'M3CI':
-                        uncompressed = zlib.decompress(item_data.get(compressed_indices_size))
-                        p = 0
-                        if n_vertices > 65535:
-                            while p < len(uncompressed):
-                                faces.append(struct.unpack("<3I", uncompressed[p:p + 3*4]))
-                                p = p + 3 * 4
-                        else:
-                            while p < len(uncompressed):
-                                faces.append(struct.unpack("<3H", uncompressed[p:p + 3*2]))
-                                p = p + 3 * 2
+                        indices = item_data.get_compressed_indices(compressed_indices_size, n_vertices)
                     elif item_data.tag == 'M3DI':
-                        if n_vertices > 65535:
-                            for i in range(int(n_indices / 3)):
-                                faces.append((item_data.get_u32(), item_data.get_u32(), item_data.get_u32()))
-                        else:
-                            for i in range(int(n_indices / 3)):
-                                faces.append((item_data.get_u16(), item_data.get_u16(), item_data.get_u16()))
+                        indices = item_data.get_indices(n_indices, n_vertices)
                     elif item_data.tag == 'M3FN':
                         n_indices = item_data.get_u32()
                     elif item_data.tag == 'M3CY':
                         compressed_vertices_size = item_data.get_u32()
                     elif item_data.tag == "M3CX":
-                        uncompressed = zlib.decompress(item_data.get(compressed_vertices_size))
-                        p = 0
-                        while p < len(uncompressed):
-                            vertex = struct.unpack("<3f", uncompressed[p:p + 3*4])
-                            vertex = (-vertex[0], -vertex[1], -vertex[2])
-                            vertices.append(vertex)
-                            p = p + 4 * 3
-                            normal = struct.unpack("<3f", uncompressed[p:p + 3*4])
-                            normal = (-normal[0], -normal[1], -normal[2])
-                            normals.append(normal)
-                            p = p + 4 * 3
-                            uv = struct.unpack("<2f", uncompressed[p:p + 2*4])
-                            uvs.append((uv[0], 1.0 - uv[1]))
-                            p = p + 4 * 2
+                        vertices = item_data.get_compressed_vertices(compressed_vertices_size)
                     elif item_data.tag == "M3DX":
-                        d = struct.unpack(f'<{n_vertices * 8}f', item_data.get(n_vertices * 8 * 4))
-                        for i in range(n_vertices):
-                            p = i * 8
-                            vertices.append( (-d[p+0], -d[p+1], -d[p+2]) )
-                            normals.append( (-d[p+3], -d[p+4], -d[p+5]) )
-                            uvs.append( (d[p+6], 1.0 - d[p+7]) )
+                        vertices = item_data.get_vertices(n_vertices)
                     elif item_data.tag in skipped:
                         item_data.skip_tag()
 
@@ -1545,14 +1486,25 @@ def read_vpx(op, context, filepath):
                 mesh_name = f"{name}"
                 mesh = bpy.data.meshes.new(mesh_name)
                 if use_3d_mesh:
-                    mesh.from_pydata(vertices, [], faces)
+                    n_faces = len(indices) // 3
+                    mesh.vertices.add(len(vertices))
+                    mesh.vertices.foreach_set('co', np.negative(vertices['co']).ravel())
+                    mesh.loops.add(n_faces * 3)
+                    mesh.loops.foreach_set('vertex_index', indices[:n_faces * 3].astype(np.int32))
+                    mesh.polygons.add(n_faces)
+                    mesh.polygons.foreach_set('loop_start', np.arange(0, n_faces * 3, 3, dtype=np.int32))
+                    mesh.polygons.foreach_set('loop_total', np.full(n_faces, 3, dtype=np.int32))
+                    mesh.update(calc_edges=True)
                     mesh.flip_normals()
                     mesh.validate()
                     mesh.use_auto_smooth = True
-                    mesh.normals_split_custom_set_from_vertices(normals)
+                    mesh.normals_split_custom_set_from_vertices(np.negative(vertices['normal']))
                     uv_layer = mesh.uv_layers.new()
-                    for i in range(len(mesh.loops)):
-                        uv_layer.data[i].uv = uvs[mesh.loops[i].vertex_index]
+                    loop_vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+                    mesh.loops.foreach_get('vertex_index', loop_vertex_indices)
+                    uvs = vertices['uv'][loop_vertex_indices]
+                    uvs[:, 1] = 1.0 - uvs[:, 1]
+                    uv_layer.data.foreach_set('uv', uvs.ravel())
                     bm = bmesh.new()
                     bm.from_mesh(mesh)
                     bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.01 * global_scale)
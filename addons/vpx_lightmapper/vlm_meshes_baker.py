@@ -29,6 +29,8 @@ from mathutils import Matrix
 from gpu_extras.batch import batch_for_shader
 from . import vlm_utils
 from . import vlm_collections
+from . import vlm_render_cache
+from . import vlm_raster
 from PIL import Image # External dependency
 
 
@@ -432,11 +434,17 @@ def create_bake_meshes(op, context):
 
     # Process each of the bake meshes according to the light scenario, pruning unneeded faces
     render_path = vlm_utils.get_bakepath(context, type='RENDERS')
+    render_cache = vlm_render_cache.RenderCache(context)
+    render_size = vlm_utils.get_render_size(context)
     lm_threshold = vlm_utils.get_lm_threshold()
     for light_scenario in light_scenarios:
         light_name, is_lightmap, _, lights = light_scenario
         if not is_lightmap: continue
-        influence = build_influence_map(render_path, light_name, prunemap_width, prunemap_height)
+        try:
+            influence = build_influence_map(render_path, light_name, prunemap_width, prunemap_height, render_cache, render_size)
+        except ValueError as e: # Renders which do not match the render cache
+            op.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
         print(f'\nProcessing lightmaps for {light_name}')
         for (bake_col, bake_name, bake_mesh, sync_obj), lightmap_vmap in zip(merged_bake_meshes, vmaps):
             obj_name = f'{bake_name}.LM.{light_name}'
@@ -474,87 +482,36 @@ def create_bake_meshes(op, context):
     return {'FINISHED'}
 
 
-def orient2d(ax, ay, bx, by, x, y):
-    """Evaluate on which side of a line a-b, a given point stand
-    """
-    return (bx-ax)*(y-ay) - (by-ay)*(x-ax)
-
-
 def build_visibility_map(bake_name, bake_instance_mesh, n_render_groups, width, height):
-    """Build a set of rasterized maps where each pixels contains the list of visible faces.
-    The code here is derived from https://fgiesen.wordpress.com/2013/02/08/triangle-rasterization-in-practice/
-    The odification consists in extending the rasterzed area by 1 pixel by changing the orient2d test.
+    """Build a rasterized map where each pixels contains the list of visible faces, stored as a compressed sparse row
+    structure (indptr, faces): the faces covering pixel xy are faces[indptr[xy]:indptr[xy+1]], in increasing order.
+    See vlm_raster.rasterize_uv_triangles for the rasterization rules.
     """
-    bm = bmesh.new()
-    bm.from_mesh(bake_instance_mesh)
-    uv_layer = bm.loops.layers.uv["UVMap"]
-    vmaps = [[] for xy in range(width * height)]
-    bm.faces.ensure_lookup_table()
-    dx = 1.0 / width
-    dy = 1.0 / height
-    for i, face in enumerate(bm.faces):
-        if len(face.loops) != 3: # This should not happen
-            continue
-        a = face.loops[0][uv_layer].uv
-        b = face.loops[1][uv_layer].uv
-        c = face.loops[2][uv_layer].uv
-        ax = int(a.x * width)
-        ay = int(a.y * height)
-        bx = int(b.x * width)
-        by = int(b.y * height)
-        cx = int(c.x * width)
-        cy = int(c.y * height)
-        lab = -math.sqrt((bx-ax)*(bx-ax)+(by-ay)*(by-ay))
-        lac = -math.sqrt((cx-ax)*(cx-ax)+(cy-ay)*(cy-ay))
-        lbc = -math.sqrt((bx-cx)*(bx-cx)+(by-cy)*(by-cy))
-        min_x = max(0, min(width - 1, min(ax, bx, cx) - 1))
-        min_y = max(0, min(height - 1, min(ay, by, cy) - 1))
-        max_x = max(0, min(width - 1, max(ax, bx, cx) + 1))
-        max_y = max(0, min(height - 1, max(ay, by, cy) + 1))
-        A01 = ay - by
-        B01 = bx - ax
-        A12 = by - cy
-        B12 = cx - bx
-        A20 = cy - ay
-        B20 = ax - cx
-        w0_row = orient2d(bx, by, cx, cy, min_x, min_y)
-        w1_row = orient2d(cx, cy, ax, ay, min_x, min_y)
-        w2_row = orient2d(ax, ay, bx, by, min_x, min_y)
-        marked = False
-        for y in range(min_y, max_y + 1):
-            w0 = w0_row
-            w1 = w1_row
-            w2 = w2_row
-            for x in range(min_x, max_x + 1):
-                if w0 >= lbc and w1 >= lac and w2 >= lab:
-                    marked = True
-                    vmaps[x + y * width].append(face.index)
-                w0 += A12
-                w1 += A20
-                w2 += A01
-            w0_row += B12
-            w1_row += B20
-            w2_row += B01
-        if not marked: # for triangles that occupy less than one pixel in the visibility map
-            vmaps[min_x + min_y * width].append(face.index)
-    bm.free()
+    n_polygons = len(bake_instance_mesh.polygons)
+    loop_total = np.empty(n_polygons, dtype=np.int32)
+    loop_start = np.empty(n_polygons, dtype=np.int32)
+    bake_instance_mesh.polygons.foreach_get('loop_total', loop_total)
+    bake_instance_mesh.polygons.foreach_get('loop_start', loop_start)
+    uvs = np.empty(len(bake_instance_mesh.loops) * 2, dtype=np.float32)
+    bake_instance_mesh.uv_layers["UVMap"].data.foreach_get('uv', uvs)
+    tri_faces = np.flatnonzero(loop_total == 3).astype(np.int32) # Other faces should not happen
+    tri_uvs = uvs.reshape((-1, 2)).astype(np.float64)[loop_start[tri_faces, None] + np.arange(3)]
+    indptr, triangles = vlm_raster.rasterize_uv_triangles(tri_uvs, width, height)
+    faces = tri_faces[triangles] # Triangles are ordered like their faces, so faces stay in increasing order
     if False: # For debug purpose, save generated visibility map
         print(f'. Saving visibility map {bake_name}')
-        pixels = [1.0 for i in range(width*height*4)]
-        for xy in range(width*height):
-            pixels[xy*4] = len(vmaps[xy])
-            pixels[xy*4+1] = len(vmaps[xy])
-            pixels[xy*4+2] = len(vmaps[xy])
+        pixels = np.ones((width * height, 4), dtype=np.float32)
+        pixels[:, :3] = np.diff(indptr)[:, None]
         image = bpy.data.images.new("debug", width, height, alpha=False, float_buffer=True)
-        image.pixels = pixels
+        image.pixels.foreach_set(pixels.ravel())
         image.filepath_raw = f'//{bake_name} - Visibility Map.exr'
         image.file_format = 'OPEN_EXR'
         image.save()
         bpy.data.images.remove(image)
-    return vmaps
+    return indptr, faces
 
 
-def build_influence_map(render_path, name, w, h):
+def build_influence_map(render_path, name, w, h, render_cache, render_size):
     """ Build influence maps by loading all renders, scaling them down using a max filter, then reducing to BW.
         A global (maximum of all light groups) influence map as well as one per render group.
         The red channel is the brightness. The blue channel contains the maximum of all render channel for HDR level evaluation.
@@ -568,6 +525,8 @@ def build_influence_map(render_path, name, w, h):
         uniform float stacking;
         uniform int nx;
         uniform int ny;
+        uniform vec2 cropOfs; // Crop region of renders stored cropped to their render border (offset and scale from full frame uv)
+        uniform vec2 cropScale;
         in vec2 uvInterp;
         in vec2 uvInterp2;
         out vec4 FragColor;
@@ -575,8 +534,11 @@ def build_influence_map(render_path, name, w, h):
             vec3 t = stacking * texture(back, uvInterp2).rgb;
             for (int y=0; y<ny; y++) {
                 for (int x=0; x<nx; x++) {
-                    vec4 s = texture(image, uvInterp + vec2(x * deltaU, y * deltaV));
-                    t = max(t, s.a * s.rgb);
+                    vec2 uv = (uvInterp + vec2(x * deltaU, y * deltaV) - cropOfs) * cropScale;
+                    if (uv.x >= 0.0 && uv.x < 1.0 && uv.y >= 0.0 && uv.y < 1.0) {
+                        vec4 s = texture(image, uv);
+                        t = max(t, s.a * s.rgb);
+                    }
                 }
             }
             float v = dot(t.rgb, vec3(0.299, 0.587, 0.114));
@@ -603,7 +565,14 @@ def build_influence_map(render_path, name, w, h):
         id = path_exr[len(bpy.path.abspath(f'{render_path}{name} - ')):]
         id = id[:-4]
         image = bpy.data.images.load(path_exr, check_existing=False)
-        im_width, im_height = image.size
+        # Group renders are full frame renders or cropped parts of them, while bakes have the size of their bake
+        full_size = render_size if id.startswith('Group ') else tuple(image.size)
+        crop = render_cache.get_checked_crop(f'{render_path}{name} - {id}.exr', image.size, full_size)
+        if crop:
+            crop_x, crop_y, crop_w, crop_h, im_width, im_height = crop
+        else:
+            im_width, im_height = full_size
+            crop_x, crop_y, crop_w, crop_h = 0, 0, im_width, im_height
         nx = int(im_width / w)
         ny = int(im_height / h)
         batch = batch_for_shader(
@@ -629,6 +598,8 @@ def build_influence_map(render_path, name, w, h):
         bw_shader.uniform_float("deltaV", 1.0 / im_height)
         bw_shader.uniform_int("nx", nx)
         bw_shader.uniform_int("ny", ny)
+        bw_shader.uniform_float("cropOfs", (crop_x / im_width, crop_y / im_height))
+        bw_shader.uniform_float("cropScale", (im_width / crop_w, im_height / crop_h))
         with layers[1].bind():
             bw_shader.uniform_float("stacking", 1.0)
             batch.draw(bw_shader)
@@ -654,10 +625,12 @@ def build_influence_map(render_path, name, w, h):
     return imaps
 
 
-def prune_lightmap_by_visibility_map(bake_instance_mesh, bake_name, light_name, vmaps, imaps, w, h):
-    """ Prune given lightmap mesh based on the given influence map / visibility map
+def prune_lightmap_by_visibility_map(bake_instance_mesh, bake_name, light_name, vmap, imaps, w, h):
+    """ Prune given lightmap mesh based on the given influence map / visibility map (compressed sparse row face lists)
     """
     lm_threshold = vlm_utils.get_lm_threshold()
+    material_index = np.empty(len(bake_instance_mesh.polygons), dtype=np.int32)
+    bake_instance_mesh.polygons.foreach_get('material_index', material_index)
     bpy.ops.object.mode_set(mode='EDIT')
     bm = bmesh.from_edit_mesh(bake_instance_mesh)
     bm.faces.ensure_lookup_table()
@@ -672,18 +645,25 @@ def prune_lightmap_by_visibility_map(bake_instance_mesh, bake_name, light_name,
             ids.append(f'Bake - {render}')
     
     # Mark faces that are actually influenced
-    hdr_range = 0.0
+    indptr, faces = vmap
+    gmap = np.asarray(imaps['Global'], dtype=np.float32).reshape((-1, 4))
+    counts = np.diff(indptr)
+    influenced = (counts > 0) & (gmap[:, 1] > lm_threshold) # prune by max channel
+    hdr_range = float(gmap[influenced, 1].max()) if np.any(influenced) else 0.0 # HDR Range is maximum of channels
+    entry_pixels = np.repeat(np.arange(w * h), counts)
+    selected = influenced[entry_pixels]
+    entry_pixels = entry_pixels[selected]
+    entry_faces = faces[selected]
+    entry_materials = material_index[entry_faces]
+    tagged = np.zeros(len(bm.faces), dtype=bool)
+    for index, id in enumerate(ids):
+        imap = imaps.get(id)
+        if imap is None: continue
+        imap = np.asarray(imap, dtype=np.float32)[0::4]
+        selected = (entry_materials == index) & (imap[entry_pixels] > lm_threshold)
+        tagged[entry_faces[selected]] = True
     for face in bm.faces:
-        face.tag = False
-    gmap = imaps['Global']
-    for xy in range(w * h):
-        if vmaps[xy] and gmap[4 * xy + 1] > lm_threshold: # prune by max channel
-            hdr_range = max(hdr_range, gmap[4 * xy + 1]) # HDR Range is maximum of channels
-            for face_index in vmaps[xy]:
-                face = bm.faces[face_index]
-                imap = imaps.get(ids[face.material_index])
-                if imap is not None and imap[4 * xy] > lm_threshold:
-                    face.tag = True
+        face.tag = bool(tagged[face.index])
     if False:
         # Basic pruning: just remove the face under a lighting threshold
         faces = [face for face in bm.faces if not face.tag]
@@ -28,6 +28,7 @@ import gpu
 from collections import namedtuple
 from gpu_extras.batch import batch_for_shader
 from . import vlm_utils
+from . import vlm_render_cache
 from PIL import Image # External dependency
 
 
@@ -153,6 +154,7 @@ def nest(context, objects, uv_bake_name, uv_nest_name, tex_w, tex_h, nestmap_nam
     tick_time = time.time()
     islands_to_pack = []
     render_sizes = {}
+    render_cache = vlm_render_cache.RenderCache(context) # Used to get the crop region of renders stored cropped to their render border
     
     to_prepare = [o for o in objects]
     while to_prepare:
@@ -218,7 +220,7 @@ def nest(context, objects, uv_bake_name, uv_nest_name, tex_w, tex_h, nestmap_nam
                 print(f'. Nesting succeeded.')
                 # Success: store result for later nestmap render
                 tick_time = time.time()
-                render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nestmap_offset + nestmap_index)
+                render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nestmap_offset + nestmap_index, render_cache)
                 render_length = time.time() - tick_time
                 nestmap_index = nestmap_index + 1
                 for block in selection:
@@ -323,7 +325,7 @@ def nest(context, objects, uv_bake_name, uv_nest_name, tex_w, tex_h, nestmap_nam
                     bm_copy.free()
                     nestmap = NestMap(padding, processed_islands, targets[0:1], target_heights[0:1])
                     tick_time = time.time()
-                    render_nestmap(context, [NestBlock(obj_copy, None, processed_islands, processed_pix_count)], uv_bake_name, nestmap, nestmap_name, nestmap_offset + nestmap_index)
+                    render_nestmap(context, [NestBlock(obj_copy, None, processed_islands, processed_pix_count)], uv_bake_name, nestmap, nestmap_name, nestmap_offset + nestmap_index, render_cache)
                     render_length = time.time() - tick_time
                     nestmap_index = nestmap_index + 1
                     print(f'. {len(processed_islands)} islands were nested on the first page and kept.')
@@ -365,7 +367,7 @@ def cache_clear(cache):
     cache.clear()
 
 
-def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nestmap_index):
+def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nestmap_index, render_cache):
     padding, islands, targets, target_heights = nestmap
     n_render_groups = vlm_utils.get_n_render_groups(context)
     nestmaps = [np.zeros((len(target) * height * 4), 'f') for target, height in zip(targets, target_heights)]
@@ -410,7 +412,15 @@ def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nest
         uniform sampler2D render_mask;
         uniform sampler2D render;
         uniform vec2 src_size;
+        uniform vec2 render_ofs; // Render crop region (renders may be stored cropped to their render border)
+        uniform vec2 render_dim;
         uniform int padding;
+        vec4 sample_render(vec2 uv) {
+            vec2 crop_uv = (uv * src_size - render_ofs) / render_dim;
+            if (crop_uv.x < 0.0 || crop_uv.x >= 1.0 || crop_uv.y < 0.0 || crop_uv.y >= 1.0)
+                return vec4(0.0);
+            return texture(render, crop_uv);
+        }
         void main() {
             if (uv.x < 0.0 || uv.x >= 1.0 || uv.y < 0.0 || uv.y >= 1.0)
                 FragColor = vec4(0.0);
@@ -441,7 +451,7 @@ def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nest
                         }
                         else
                         { // Only accumulate outside of border (mask < 1.0) since it would contain border fade as well mixed with part transparency
-                            padding_accum += texture(render, uv_ofs) * dist_factor;
+                            padding_accum += sample_render(uv_ofs) * dist_factor;
                             padding_sum += dist_factor;
                         }
                     }
@@ -455,7 +465,7 @@ def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nest
                     float inside = smoothstep(0.0, 2.0, sqrt(distance_to_outside)); // Fixed 2 pixel border/interior fading
                     seam = seam / seam_sum;
                     seam.a = step(0.001, seam.a); // binary island mask
-                    FragColor = seam * mix(padding_accum / padding_sum, texture(render, uv), inside);
+                    FragColor = seam * mix(padding_accum / padding_sum, sample_render(uv), inside);
                }
             }
         }'''
@@ -515,6 +525,7 @@ def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nest
             if island_render is None:
                 print('. No render (likely uninfluenced lightmap), skipping island')
                 continue
+            crop = render_cache.get_checked_crop(render_path, island_render.size, (src_w, src_h))
             #FIXME for traditional bake, use the solid bake alpha channel ?
             render_id = island_obj.data.materials[island['mat_index']].get('VLM.Render')
             if isinstance(render_id, int):
@@ -593,6 +604,8 @@ def render_nestmap(context, selection, uv_bake_name, nestmap, nestmap_name, nest
                 render_shader.uniform_sampler("render_mask", gpu.texture.from_image(island_render_mask))
                 render_shader.uniform_sampler("seam_mask", offscreen_seams.texture_color)
                 render_shader.uniform_sampler("render", gpu.texture.from_image(island_render))
+                render_shader.uniform_float("render_ofs", crop[0:2] if crop else (0, 0))
+                render_shader.uniform_float("render_dim", crop[2:4] if crop else (src_w, src_h))
                 render_batch.draw(render_shader)
                 # fb = gpu.state.active_framebuffer_get()
                 # image_data = fb.read_color(0, 0, target_w, target_h, 4, 0, 'UBYTE')
@@ -672,7 +685,11 @@ def prepare_nesting(context, obj, padding, uv_nest_name, render_sizes, tex_w, te
     for index, island in enumerate(islands, start=1):
         render_path = vlm_utils.get_packmap_bakepath(context, obj.data.materials[island['faces'][0].material_index])
         render_size = render_sizes.get(render_path)
-        if render_size is None:
+        if render_size is None and isinstance(obj.data.materials[island['faces'][0].material_index].get('VLM.Render'), int):
+            # Group renders are full frame renders or cropped parts of them (checked when they are loaded for rendering)
+            render_size = vlm_utils.get_render_size(context)
+            render_sizes[render_path] = render_size
+        elif render_size is None:
             im = bpy.data.images.load(render_path, check_existing=False)
             render_size = (im.size[0], im.size[1])
             render_sizes[render_path] = render_size
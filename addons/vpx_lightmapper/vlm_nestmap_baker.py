@@ -60,14 +60,18 @@ def render_nestmaps(op, context):
     # Perform the actual island nesting and nestmap generation
     max_tex_size = min(8192, int(context.scene.vlmSettings.tex_size))
 
-    if True:
-        print('\nNesting all LDR parts')
-        n_ldr_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest_ldr, 'UVMap', 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', 0)
-        print('\nNesting all HDR parts')
-        n_hdr_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest_hdr, 'UVMap', 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', n_ldr_nestmaps)
-        n_nestmaps = n_ldr_nestmaps + n_hdr_nestmaps
-    else:
-        n_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest, 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', 0)
+    try:
+        if True:
+            print('\nNesting all LDR parts')
+            n_ldr_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest_ldr, 'UVMap', 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', 0)
+            print('\nNesting all HDR parts')
+            n_hdr_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest_hdr, 'UVMap', 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', n_ldr_nestmaps)
+            n_nestmaps = n_ldr_nestmaps + n_hdr_nestmaps
+        else:
+            n_nestmaps, splitted_objects = vlm_nest.nest(context, to_nest, 'UVMap Nested', max_tex_size, max_tex_size, 'Nestmap', 0)
+    except ValueError as e: # Renders which do not match the render cache
+        op.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
 
     # Restore initial state
     bpy.ops.object.select_all(action='DESELECT')
@@ -0,0 +1,219 @@
+#    Copyright (C) 2022  Vincent Bousquet
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import numpy as np
+
+# CPU triangle rasterizer used to compute object coverage masks without a render engine or a GPU
+# (for example when running Blender in background mode). Masks are binary, sampled at pixel centers,
+# and stored as (height, width) arrays with the first row at the top of the image (like PIL images).
+
+_BATCH_SIZE = 1 << 20 # Maximum number of pixel/triangle tests performed at once
+
+
+def object_triangles(obj, depsgraph):
+    """Return the evaluated geometry of an object as world space vertices (n, 3) and triangle indices (m, 3)"""
+    eval_obj = obj.evaluated_get(depsgraph)
+    try:
+        mesh = eval_obj.to_mesh()
+    except RuntimeError:
+        mesh = None
+    if mesh is None:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int32)
+    mesh.calc_loop_triangles()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', triangles)
+    eval_obj.to_mesh_clear()
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    co = co.reshape((-1, 3)) @ matrix[:3, :3].T + matrix[:3, 3]
+    return co, triangles.reshape((-1, 3))
+
+
+def rasterize(clip, triangles, width, height, mask=None):
+    """Rasterize triangles given by their clip space vertices (n, 4) and indices (m, 3) to a boolean coverage mask.
+    Triangles crossing the camera plane are discarded.
+    """
+    if mask is None:
+        mask = np.zeros((height, width), dtype=bool)
+    if len(triangles) == 0:
+        return mask
+    clip = np.asarray(clip, dtype=np.float64)
+    triangles = triangles[np.all(clip[triangles, 3] > 1e-6, axis=1)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px = (1.0 + clip[:, 0] / clip[:, 3]) * (0.5 * width)
+        py = (1.0 - clip[:, 1] / clip[:, 3]) * (0.5 * height)
+    x = px[triangles]
+    y = py[triangles]
+    # Pixel range covering the pixel centers inside the triangle bounds (max is exclusive)
+    x0 = np.clip(np.ceil(x.min(axis=1) - 0.5), 0, width).astype(np.int64)
+    x1 = np.clip(np.floor(x.max(axis=1) - 0.5) + 1, 0, width).astype(np.int64)
+    y0 = np.clip(np.ceil(y.min(axis=1) - 0.5), 0, height).astype(np.int64)
+    y1 = np.clip(np.floor(y.max(axis=1) - 0.5) + 1, 0, height).astype(np.int64)
+    area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+    keep = (x1 > x0) & (y1 > y0) & (area != 0)
+    x, y, x0, x1, y0, y1, sign = x[keep], y[keep], x0[keep], x1[keep], y0[keep], y1[keep], np.sign(area[keep])
+    size = np.maximum(x1 - x0, y1 - y0)
+    # Small triangles are processed together on a fixed size pixel grid, large ones one by one
+    prev_size = 0
+    for grid_size in (1, 2, 4, 8, 16, 32):
+        selected = np.flatnonzero((size > prev_size) & (size <= grid_size))
+        prev_size = grid_size
+        if len(selected) == 0:
+            continue
+        grid_y, grid_x = np.divmod(np.arange(grid_size * grid_size), grid_size)
+        chunk = max(1, _BATCH_SIZE // (grid_size * grid_size))
+        for start in range(0, len(selected), chunk):
+            s = selected[start:start + chunk]
+            ox = x0[s, None] + grid_x[None, :]
+            oy = y0[s, None] + grid_y[None, :]
+            inside = (ox < x1[s, None]) & (oy < y1[s, None]) & _inside(x[s], y[s], sign[s], ox + 0.5, oy + 0.5)
+            mask[oy[inside], ox[inside]] = True
+    for t in np.flatnonzero(size > prev_size):
+        oy, ox = np.mgrid[y0[t]:y1[t], x0[t]:x1[t]]
+        inside = _inside(x[t:t+1], y[t:t+1], sign[t:t+1], ox.reshape((1, -1)) + 0.5, oy.reshape((1, -1)) + 0.5)
+        mask[oy.reshape((1, -1))[inside], ox.reshape((1, -1))[inside]] = True
+    return mask
+
+
+def _inside(x, y, sign, cx, cy):
+    """Edge function test of the points (cx, cy) against triangles (x, y), for both triangle windings"""
+    result = None
+    for a, b in ((0, 1), (1, 2), (2, 0)):
+        e = ((x[:, b, None] - x[:, a, None]) * (cy - y[:, a, None]) - (y[:, b, None] - y[:, a, None]) * (cx - x[:, a, None])) * sign[:, None]
+        result = e >= 0 if result is None else result & (e >= 0)
+    return result
+
+
+def rasterize_uv_triangles(uvs, width, height):
+    """Rasterize triangles given by their UV coordinates (n, 3, 2) to a width x height map where each pixel contains the
+    list of the triangles covering it, stored as a compressed sparse row structure (indptr, triangles): the triangles
+    covering pixel x + y * width are triangles[indptr[xy]:indptr[xy+1]], in increasing order.
+    The rasterization is derived from https://fgiesen.wordpress.com/2013/02/08/triangle-rasterization-in-practice/
+    Vertices are truncated to integer pixel coordinates, and the rasterized area is extended by accepting pixels up to
+    one edge length outside of each edge, in the triangle bounds extended by one pixel and clipped to the map.
+    Triangles which do not cover any pixel are assigned to the first pixel of their (clipped) bounds.
+    """
+    uvs = np.asarray(uvs, dtype=np.float64).reshape((-1, 3, 2))
+    px = (uvs[:, :, 0] * width).astype(np.int64) # Truncate toward zero, like int()
+    py = (uvs[:, :, 1] * height).astype(np.int64)
+    # Edge thresholds (minus the edge length in pixels), ordered like the edge functions b-c, c-a, a-b
+    lengths = -np.sqrt(np.stack((
+        (px[:, 1] - px[:, 2]) ** 2 + (py[:, 1] - py[:, 2]) ** 2,
+        (px[:, 2] - px[:, 0]) ** 2 + (py[:, 2] - py[:, 0]) ** 2,
+        (px[:, 0] - px[:, 1]) ** 2 + (py[:, 0] - py[:, 1]) ** 2), axis=1))
+    x0 = np.clip(px.min(axis=1) - 1, 0, width - 1)
+    y0 = np.clip(py.min(axis=1) - 1, 0, height - 1)
+    x1 = np.clip(px.max(axis=1) + 1, 0, width - 1) # Inclusive
+    y1 = np.clip(py.max(axis=1) + 1, 0, height - 1)
+    size = np.maximum(x1 - x0, y1 - y0) + 1
+    pixel_parts = []
+    tri_parts = []
+    # Small triangles are processed together on a fixed size pixel grid, large ones one by one
+    prev_size = 0
+    for grid_size in (2, 4, 8, 16, 32):
+        selected = np.flatnonzero((size > prev_size) & (size <= grid_size))
+        prev_size = grid_size
+        if len(selected) == 0:
+            continue
+        grid_y, grid_x = np.divmod(np.arange(grid_size * grid_size), grid_size)
+        chunk = max(1, _BATCH_SIZE // (grid_size * grid_size))
+        for start in range(0, len(selected), chunk):
+            s = selected[start:start + chunk]
+            ox = x0[s, None] + grid_x[None, :]
+            oy = y0[s, None] + grid_y[None, :]
+            inside = (ox <= x1[s, None]) & (oy <= y1[s, None]) & _inside_extended(px[s], py[s], lengths[s], ox, oy)
+            rows = np.nonzero(inside)[0]
+            pixel_parts.append(ox[inside] + oy[inside] * width)
+            tri_parts.append(s[rows])
+    for t in np.flatnonzero(size > prev_size):
+        oy, ox = np.mgrid[y0[t]:y1[t] + 1, x0[t]:x1[t] + 1]
+        ox = ox.reshape((1, -1))
+        oy = oy.reshape((1, -1))
+        inside = _inside_extended(px[t:t+1], py[t:t+1], lengths[t:t+1], ox, oy)
+        pixel_parts.append(ox[inside] + oy[inside] * width)
+        tri_parts.append(np.full(np.count_nonzero(inside), t))
+    # Triangles that occupy less than one pixel are assigned to the corner of their bounds
+    marked = np.zeros(len(uvs), dtype=bool)
+    for part in tri_parts:
+        marked[part] = True
+    unmarked = np.flatnonzero(~marked)
+    pixel_parts.append(x0[unmarked] + y0[unmarked] * width)
+    tri_parts.append(unmarked)
+    pixels = np.concatenate(pixel_parts).astype(np.int64)
+    triangles = np.concatenate(tri_parts).astype(np.int64)
+    order = np.lexsort((triangles, pixels))
+    indptr = np.zeros(width * height + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pixels, minlength=width * height), out=indptr[1:])
+    return indptr, triangles[order]
+
+
+def _inside_extended(px, py, lengths, x, y):
+    """Extended orient2d test of the pixels (x, y) against triangles (px, py): points are accepted up to one edge length
+    outside of each edge (edge functions are evaluated exactly on integer coordinates)"""
+    result = None
+    for i, (a, b) in enumerate(((1, 2), (2, 0), (0, 1))):
+        w = (px[:, b, None] - px[:, a, None]) * (y - py[:, a, None]) - (py[:, b, None] - py[:, a, None]) * (x - px[:, a, None])
+        result = w >= lengths[:, i, None] if result is None else result & (w >= lengths[:, i, None])
+    return result
+
+
+def rasterize_objects(objects, mvp_matrix, width, height, depsgraph, pad=0):
+    """Compute the binary coverage mask (uint8 0/255 array of shape (height, width)) of the given objects
+    viewed through the given model view projection matrix, optionally dilated by pad pixels"""
+    mask = np.zeros((height, width), dtype=bool)
+    mvp = np.array(mvp_matrix, dtype=np.float64)
+    for obj in objects:
+        co, triangles = object_triangles(obj, depsgraph)
+        if len(triangles) == 0:
+            continue
+        clip = co @ mvp[:, :3].T + mvp[:, 3]
+        rasterize(clip, triangles, width, height, mask)
+    return dilate_mask(mask.astype(np.uint8) * 255, pad)
+
+
+def _composite_alpha(src, dst):
+    """Alpha of src composited over dst, using the same integer arithmetic as PIL alpha_composite"""
+    src = src.astype(np.uint32)
+    dst = dst.astype(np.uint32)
+    t = src * 255 + dst * (255 - src) + 0x80
+    return (((t >> 8) + t) >> 8).astype(np.uint8)
+
+
+def dilate_mask(alpha, pad):
+    """Dilate a 2D uint8 alpha mask by pad pixels, giving the same result as compositing the mask
+    over itself shifted by one pixel down, up, right then left, pad times. For binary masks, this
+    is a square max filter, otherwise the compositing passes are reproduced on the alpha channel.
+    """
+    alpha = alpha.copy()
+    if pad <= 0:
+        return alpha
+    if np.all((alpha == 0) | (alpha == 255)):
+        for axis in (0, 1):
+            src = alpha.copy()
+            for d in range(1, pad + 1):
+                if axis == 0:
+                    np.maximum(alpha[d:], src[:-d], out=alpha[d:])
+                    np.maximum(alpha[:-d], src[d:], out=alpha[:-d])
+                else:
+                    np.maximum(alpha[:, d:], src[:, :-d], out=alpha[:, d:])
+                    np.maximum(alpha[:, :-d], src[:, d:], out=alpha[:, :-d])
+        return alpha
+    for p in range(pad):
+        alpha[1:] = _composite_alpha(alpha[:-1], alpha[1:])
+        alpha[:-1] = _composite_alpha(alpha[1:], alpha[:-1])
+        alpha[:, 1:] = _composite_alpha(alpha[:, :-1], alpha[:, 1:])
+        alpha[:, :-1] = _composite_alpha(alpha[:, 1:], alpha[:, :-1])
+    return alpha
@@ -19,7 +19,15 @@ import mathutils
 import bmesh
 import os
 import re
+import json
 import time
+import shutil
+import socket
+import tempfile
+import threading
+import traceback
+import contextlib
+import subprocess
 import gpu
 import datetime
 import numpy as np
@@ -28,8 +36,14 @@ from mathutils import Vector
 from gpu_extras.batch import batch_for_shader
 from . import vlm_utils
 from . import vlm_collections
+from . import vlm_raster
+from . import vlm_render_cache
+from . import vlm_render_telemetry
 from PIL import Image # External dependency
 
+FARM_MANIFEST_NAME = 'Jobs.json'
+TMP_FOLDER_PREFIX = '.tmp-'
+
 
 def project_point(proj, p):
     p1 = proj @ Vector((p.x, p.y, p.z, 1)) # projected coordinates (range [-1, 1]x[-1, 1])
@@ -110,6 +124,24 @@ def get_light_influence_radius(light):
     return (None, None)
 
 
+def load_influence_mask(path):
+    """Load a low resolution padded mask as a tuple (width, height, coverage, integral image) for light influence tests.
+    The integral image (summed area table of the coverage) allows to count covered pixels in any rectangle in constant time.
+    """
+    im = Image.open(bpy.path.abspath(path))
+    coverage = np.frombuffer(im.tobytes("raw", "L"), dtype=np.uint8).reshape((im.size[1], im.size[0])) > 0
+    integral = np.zeros((im.size[1] + 1, im.size[0] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(coverage, axis=0, dtype=np.int32), axis=1, out=integral[1:, 1:])
+    return (im.size[0], im.size[1], coverage, integral)
+
+
+def count_covered(integral, min_x, min_y, max_x, max_y):
+    """Number of covered pixels in the given rectangle (bounds included) of an integral image"""
+    if max_x < min_x or max_y < min_y:
+        return 0
+    return integral[max_y + 1, max_x + 1] - integral[min_y, max_x + 1] - integral[max_y + 1, min_x] + integral[min_y, min_x]
+
+
 def get_light_influence(scene, depsgraph, camera, light, group_mask):
     """Compute area of influence of the given light
     If a group mask is provided, the AOI is filtered against it
@@ -120,7 +152,7 @@ def get_light_influence(scene, depsgraph, camera, light, group_mask):
         h = scene.render.resolution_y
         mask = None
     else:
-        w, h, mask = group_mask
+        w, h, mask, integral = group_mask
         
     center, radius = get_light_influence_radius(light)
     if center is None:
@@ -145,28 +177,104 @@ def get_light_influence(scene, depsgraph, camera, light, group_mask):
     if aoi[1] <= aoi[0] or aoi[3] <= aoi[2]:
         return None
     
-    if not mask: # No mask, just return the bounds of the area of influence of the light
+    if mask is None: # No mask, just return the bounds of the area of influence of the light
         return aoi
 
     min_x = int(aoi[0] * (w-1))
     max_x = int(aoi[1] * (w-1))
     min_y = int(aoi[2] * (h-1))
     max_y = int(aoi[3] * (h-1))
+    # Reject if there is no influenced object in the influence bounds
+    if count_covered(integral, min_x, min_y, max_x, max_y) == 0:
+        return None
+    if max_x == min_x: # Empty influence elipsoid
+        return None
     light_center = project_point(proj, center)
     light_center.x *= w - 1
     light_center.y *= h - 1
     alpha_y = (max_y - min_y) / (max_x - min_x)
     max_r2 = (max_x - min_x) * (max_x - min_x) / 4
-    for y in range(min_y, max_y + 1):
-        py = (y - light_center.y) * alpha_y
-        py2 = py * py
-        for x in range(min_x, max_x + 1):
-            px = x - light_center.x
-            if px*px+py2 < max_r2 and mask[x + y * w] > 0: # inside the influence elipsoid, with an influenced object
-                return aoi
+    # Accept if there is an influenced object in the rectangle inscribed in the influence elipsoid
+    if alpha_y > 0:
+        r = 0.999 * math.sqrt(max_r2 / 2)
+        if count_covered(integral, max(min_x, math.ceil(light_center.x - r)), max(min_y, math.ceil(light_center.y - r / alpha_y)),
+            min(max_x, math.floor(light_center.x + r)), min(max_y, math.floor(light_center.y + r / alpha_y))) > 0:
+            return aoi
+    # Otherwise, test the influenced pixels inside the influence elipsoid
+    py = (np.arange(min_y, max_y + 1) - light_center.y) * alpha_y
+    px = np.arange(min_x, max_x + 1) - light_center.x
+    inside = px[None, :] * px[None, :] + (py * py)[:, None] < max_r2
+    if np.any(inside & mask[min_y:max_y + 1, min_x:max_x + 1]):
+        return aoi
     return None
 
 
+def needs_influence_prepass(scenario):
+    """Return True for lightmap scenarios whose lights AOI can not be evaluated (node driven emission strength, emitter
+    meshes with linked strength,...) and would therefore be rendered full frame for every render group"""
+    name, is_lightmap, light_col, lights = scenario
+    if not is_lightmap or light_col.vlmSettings.world or not lights:
+        return False
+    if not all(light.vlmSettings.enable_aoi for light in lights): # AOI explicitly disabled by the user
+        return False
+    return any(get_light_influence_radius(light)[0] is None for light in lights)
+
+
+def render_influence_prepass(scene, depsgraph, camera, scenarios, render_col, output_path, scale, samples):
+    """Render the given lightmap scenarios at a low resolution and sample count, with all the objects directly rendered,
+    and measure the screen region they actually influence (pixels with a channel above the lightmap threshold).
+    Returns a dict of scenario name to a boolean coverage array (height, width) of the low resolution render, first row
+    at the top like the group masks.
+    """
+    prev_state = (scene.render.resolution_percentage, scene.cycles.samples, scene.cycles.use_denoising)
+    scene.render.resolution_percentage = max(1, int(100 * scale))
+    scene.cycles.samples = samples
+    scene.cycles.use_denoising = False
+    lm_threshold = vlm_utils.get_lm_threshold()
+    coverages = {}
+    try:
+        for i, scenario in enumerate(scenarios, start=1):
+            name, is_lightmap, light_col, lights = scenario
+            start_time = time.time()
+            state, restore_func = setup_light_scenario(scene, depsgraph, camera, scenario, None, render_col, influence=(0, 1, 0, 1))
+            if state is None:
+                # Not measured: the scenario falls back to the influence bounds of its lights
+                print(f". Influence pre-pass {i}/{len(scenarios)} for '{name}' skipped (scenario could not be setup)")
+                continue
+            try:
+                with temp_output_folder(output_path) as tmp_path:
+                    render_still(scene, f'{tmp_path}Prepass.exr', True)
+                    image = bpy.data.images.load(f'{tmp_path}Prepass.exr', check_existing=False)
+                    width, height = image.size
+                    pixels = np.empty(width * height * 4, dtype=np.float32)
+                    image.pixels.foreach_get(pixels)
+                    bpy.data.images.remove(image)
+            finally:
+                restore_func(state)
+            coverage = np.flipud(pixels.reshape((height, width, 4))[:, :, :3].max(axis=2) > lm_threshold)
+            coverages[name] = coverage
+            print(f". Influence pre-pass {i}/{len(scenarios)} for '{name}' measured {np.count_nonzero(coverage) / coverage.size:6.2%} of the view influenced in {vlm_utils.format_time(time.time() - start_time)}")
+    finally:
+        scene.render.resolution_percentage, scene.cycles.samples, scene.cycles.use_denoising = prev_state
+    return coverages
+
+
+def get_prepass_influence(coverage, group_mask):
+    """Influence bounds (min_x, max_x, min_y, max_y) of a scenario measured by the influence pre-pass, restricted to
+    the objects of a render group, or None if the scenario does not influence the group"""
+    w, h, mask, integral = group_mask
+    # Dilate by one pre-pass pixel to account for the resolution loss, then resample to the group mask resolution
+    coverage = vlm_raster.dilate_mask(coverage.astype(np.uint8) * 255, 1) > 0
+    ys = np.arange(h) * coverage.shape[0] // h
+    xs = np.arange(w) * coverage.shape[1] // w
+    influenced = coverage[ys[:, None], xs[None, :]] & mask
+    rows = np.flatnonzero(influenced.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(influenced.any(axis=0))
+    return (float(cols[0] / w), float((cols[-1] + 1) / w), float(rows[0] / h), float((rows[-1] + 1) / h))
+
+
 def check_min_render_size(scene):
     w = scene.render.border_max_x - scene.render.border_min_x
     if int(w * scene.render.resolution_x) < 1:
@@ -177,8 +285,9 @@ def check_min_render_size(scene):
     return True
 
 
-def setup_light_scenario(scene, depsgraph, camera, scenario, group_mask, render_col):
+def setup_light_scenario(scene, depsgraph, camera, scenario, group_mask, render_col, influence=None):
     """Apply a light scenario for rendering, returning the previous state and a lambda to restore it
+    If influence bounds are given (measured by the influence pre-pass), they are used instead of the lights AOI
     """
     name, is_lightmap, light_col, lights = scenario
     prev_world = scene.world
@@ -192,16 +301,16 @@ def setup_light_scenario(scene, depsgraph, camera, scenario, group_mask, render_
             scene.render.border_min_y = 0
             scene.render.border_max_y = 1
         else:
-            influence = None
-            for light in lights:
-                light_influence = get_light_influence(scene, depsgraph, camera, light, group_mask)
-                if light_influence:
-                    if influence:
-                        min_x, max_x, min_y, max_y = influence
-                        min_x2, max_x2, min_y2, max_y2 = light_influence
-                        influence = (min(min_x, min_x2), max(max_x, max_x2), min(min_y, min_y2), max(max_y, max_y2))
-                    else:
-                        influence = light_influence
+            if influence is None:
+                for light in lights:
+                    light_influence = get_light_influence(scene, depsgraph, camera, light, group_mask)
+                    if light_influence:
+                        if influence:
+                            min_x, max_x, min_y, max_y = influence
+                            min_x2, max_x2, min_y2, max_y2 = light_influence
+                            influence = (min(min_x, min_x2), max(max_x, max_x2), min(min_y, min_y2), max(max_y, max_y2))
+                        else:
+                            influence = light_influence
             if not influence:
                 return None, None
             min_x, max_x, min_y, max_y = influence
@@ -240,6 +349,304 @@ def restore_light_setup(initial_state, render_col, lights, scene, prev_world):
         for obj, color in zip(initial_state[2], initial_state[3]): obj.data.color = color
 
     
+def plan_render_batches(candidates, max_batch_size, render_overhead, render_size):
+    """Split the scenarios to be rendered into batches, each batch being rendered with the union of the influence bounds
+    of its scenarios. Batches are built by greedily merging the 2 batches for which the merge saves the most, the cost of a
+    batch being its fixed render overhead plus its rendered area. Merging stops when no merge reduces the overall cost,
+    which bounds the render border of each batch. There is at most one scenario with a custom world per batch.
+    candidates is a list of tuples (scenario, influence, render hash), influence being (min_x, max_x, min_y, max_y)
+    """
+    if not candidates:
+        return []
+    bounds = np.array([influence for _, influence, _ in candidates], dtype=np.float64)
+    sizes = np.ones(len(candidates), dtype=np.int32)
+    worlds = np.array([scenario[2].vlmSettings.world is not None for scenario, _, _ in candidates])
+    clusters = [[i] for i in range(len(candidates))]
+    while len(clusters) > 1:
+        area = (bounds[:, 1] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 2])
+        union = ((np.maximum.outer(bounds[:, 1], bounds[:, 1]) - np.minimum.outer(bounds[:, 0], bounds[:, 0]))
+            * (np.maximum.outer(bounds[:, 3], bounds[:, 3]) - np.minimum.outer(bounds[:, 2], bounds[:, 2])))
+        gain = area[:, None] + area[None, :] + render_overhead - union
+        gain[(sizes[:, None] + sizes[None, :] > max_batch_size) | (worlds[:, None] & worlds[None, :])] = -1
+        np.fill_diagonal(gain, -1)
+        i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[i, j] <= 0:
+            break
+        bounds[i] = (min(bounds[i, 0], bounds[j, 0]), max(bounds[i, 1], bounds[j, 1]), min(bounds[i, 2], bounds[j, 2]), max(bounds[i, 3], bounds[j, 3]))
+        sizes[i] += sizes[j]
+        worlds[i] |= worlds[j]
+        clusters[i].extend(clusters[j])
+        del clusters[j]
+        bounds = np.delete(bounds, j, axis=0)
+        sizes = np.delete(sizes, j)
+        worlds = np.delete(worlds, j)
+    batches = sorted((sorted(cluster) for cluster in clusters), key=lambda cluster: cluster[0])
+
+    # Evaluate the rendered area compared to batching scenarios in order
+    def batch_area(batch):
+        batch_bounds = np.array([candidates[i][1] for i in batch])
+        return (batch_bounds[:, 1].max() - batch_bounds[:, 0].min()) * (batch_bounds[:, 3].max() - batch_bounds[:, 2].min())
+    ordered_batches = []
+    remaining = list(range(len(candidates)))
+    while remaining:
+        batch, has_world, next_remaining = [], False, []
+        for i in remaining:
+            is_world = candidates[i][0][2].vlmSettings.world is not None
+            if len(batch) >= max_batch_size or (is_world and has_world):
+                next_remaining.append(i)
+            else:
+                batch.append(i)
+                has_world |= is_world
+        ordered_batches.append(batch)
+        remaining = next_remaining
+    n_pixels = render_size[0] * render_size[1]
+    planned_area = sum(batch_area(batch) for batch in batches)
+    ordered_area = sum(batch_area(batch) for batch in ordered_batches)
+    print(f'. Batch planner: {len(batches)} renders for {int(planned_area * n_pixels)} pixels instead of {len(ordered_batches)} renders for {int(ordered_area * n_pixels)} pixels when batching in order (estimated savings: {int((ordered_area - planned_area) * n_pixels)} pixels)')
+    return [[candidates[i] for i in batch] for batch in batches]
+
+
+def merge_influence(influence, other):
+    """Union of 2 influence bounds (min_x, max_x, min_y, max_y), any of them may be None"""
+    if not influence:
+        return other
+    if not other:
+        return influence
+    return (min(influence[0], other[0]), max(influence[1], other[1]), min(influence[2], other[2]), max(influence[3], other[3]))
+
+
+def create_render_scene(context, camera_object, bake_col):
+    """Create the temporary render scene, using the user render settings, with all bake objects linked for indirect influence.
+    Returns the scene, the indirect influence collection and the render collection.
+    """
+    scene = bpy.data.scenes.new('VLM.Tmp Scene')
+    scene.collection.objects.link(camera_object)
+    scene.camera = camera_object
+    for prop in bpy.context.scene.render.bl_rna.properties:
+        if not prop.is_readonly and prop.identifier not in {'rna_type'}:
+            setattr(scene.render, prop.identifier, getattr(context.scene.render, prop.identifier))
+    for prop in bpy.context.scene.cycles.bl_rna.properties:
+        if not prop.is_readonly and prop.identifier not in {'rna_type'}:
+            setattr(scene.cycles, prop.identifier, getattr(context.scene.cycles, prop.identifier))
+    scene.render.engine = 'CYCLES'
+    scene.render.use_border = False
+    scene.render.use_crop_to_border = False
+    render_size = vlm_utils.get_render_size(context)
+    scene.render.resolution_x = render_size[0]
+    scene.render.resolution_y = render_size[1]
+    scene.render.film_transparent = True
+    scene.view_settings.view_transform = 'Raw'
+    scene.view_settings.look = 'None'
+    scene.view_layers[0].use_pass_z = False
+    scene.use_nodes = False
+
+    # Setup the scene with all the bake objects with indirect render influence
+    indirect_col = bpy.data.collections.new('Indirect')
+    render_col = bpy.data.collections.new('Render')
+    scene.collection.children.link(indirect_col)
+    scene.collection.children.link(render_col)
+    vlm_collections.find_layer_collection(scene.view_layers[0].layer_collection, indirect_col).indirect_only = True
+    for obj in bake_col.all_objects:
+        if not obj.vlmSettings.hide_from_others:
+            indirect_col.objects.link(obj)
+    return scene, indirect_col, render_col
+
+
+def link_render_group(objects, indirect_col, render_col):
+    """Move the objects of a render group (and their bake masks) from indirect influence to direct rendering"""
+    for obj in objects:
+        if not obj.vlmSettings.hide_from_others:
+            indirect_col.objects.unlink(obj)
+        if obj.vlmSettings.bake_mask:
+            render_col.objects.link(obj.vlmSettings.bake_mask)
+        render_col.objects.link(obj)
+
+
+def unlink_render_group(objects, indirect_col, render_col):
+    for obj in objects:
+        if not obj.vlmSettings.hide_from_others:
+            indirect_col.objects.link(obj)
+        if obj.vlmSettings.bake_mask:
+            render_col.objects.unlink(obj.vlmSettings.bake_mask)
+        render_col.objects.unlink(obj)
+
+
+@contextlib.contextmanager
+def temp_output_folder(output_path):
+    """Temporary folder, created inside the given output folder, where renders are written before being moved to their final
+    path with os.replace (atomic since on the same file system), so that an interrupted render never leaves a partial file.
+    Yields the folder path, with a trailing separator. The folder and its remaining content are removed on exit.
+    """
+    vlm_utils.mkpath(output_path)
+    tmp_path = tempfile.mkdtemp(prefix=TMP_FOLDER_PREFIX, dir=bpy.path.abspath(output_path))
+    try:
+        yield os.path.join(tmp_path, '')
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def clean_temp_outputs(output_path):
+    """Remove temporary render outputs left by an interrupted render"""
+    folder = bpy.path.abspath(output_path)
+    if not os.path.exists(folder):
+        return
+    for file in os.listdir(folder):
+        if file.startswith(TMP_FOLDER_PREFIX):
+            print(f'. Removing incomplete render output {file}')
+            shutil.rmtree(os.path.join(folder, file), ignore_errors=True)
+        elif re.fullmatch(r"(.*exr)\d\d\d\d", file): # Compositor output left by previous versions
+            print(f'. Removing incomplete render output {file}')
+            os.remove(os.path.join(folder, file))
+
+
+def render_still(scene, render_path, is_lightmap):
+    """Render the scene and save it to the given path as an OpenEXR file"""
+    scene.render.image_settings.file_format = 'OPEN_EXR'
+    scene.render.image_settings.color_mode = 'RGB' if is_lightmap else 'RGBA'
+    scene.render.image_settings.exr_codec = 'ZIP' # Lossless compression
+    scene.render.image_settings.color_depth = '16'
+    with temp_output_folder(os.path.dirname(bpy.path.abspath(render_path))) as tmp_path:
+        scene.render.filepath = f'{tmp_path}{os.path.basename(render_path)}'
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+        os.replace(scene.render.filepath, bpy.path.abspath(render_path))
+
+
+def render_batch(scene, render_col, scenarios, influence, output_path, group_index, max_scenarios_in_batch):
+    """Render multiple light scenarios at once using light groups (Blender 3.2+), limited to the given influence bounds.
+    Each scenario is denoised and saved by the compositor to '{output_path}{scenario name} - Group {group_index}.exr'.
+    Renders limited to a border are saved cropped to it. Returns the crop region as (x, y, width, height, full width,
+    full height) in pixels from the bottom left corner, or None for full frame renders.
+    """
+    prev_world = scene.world
+    render_world = None
+    scene.use_nodes = True
+    scene.view_layers[0].cycles.denoising_store_passes = True
+    scene.render.use_file_extension = False
+
+    nodes = scene.node_tree.nodes
+    links = scene.node_tree.links
+    nodes.clear()
+    links.clear()
+    rl = nodes.new("CompositorNodeRLayers")
+    rl.scene = scene
+    rl.location.x = -200
+    dec = max_scenarios_in_batch / 2.0
+    batch = []
+    for i, scenario in enumerate(scenarios, start=1):
+        name, is_lightmap, light_col, lights = scenario
+        # One world bake maximum per batch (enforced by the batch planner)
+        if light_col.vlmSettings.world != None: 
+            render_world = light_col.vlmSettings.world
+            render_world.lightgroup = name
+
+        scene.view_layers[0].lightgroups.add(name=name.replace(".","_"))
+        initial_state = (0, None)
+        if vlm_utils.is_rgb_led(lights):
+            # RGB leds are rendered white (emitter meshes are rendered as is, like in the default rendering)
+            colored_lights = [o for o in lights if o.type=='LIGHT']
+            prev_colors = [tuple(o.data.color) for o in colored_lights]
+            for o in colored_lights: o.data.color = (1.0, 1.0, 1.0)
+            initial_state = (1, zip(colored_lights, prev_colors))
+        for light in lights: # Lights and emitter meshes
+            light.lightgroup = name.replace(".","_")
+            render_col.objects.link(light)
+        denoise = nodes.new("CompositorNodeDenoise")
+        denoise.location.x = 200
+        denoise.location.y = -(i-dec) * 200
+        links.new(rl.outputs['Denoising Normal'], denoise.inputs['Normal'])
+        links.new(rl.outputs['Denoising Albedo'], denoise.inputs['Albedo'])
+        out = nodes.new("CompositorNodeOutputFile")
+        out.location.x = 600
+        out.location.y = -(i-dec) * 200
+        if is_lightmap:
+            links.new(denoise.outputs['Image'], out.inputs['Image'])
+        else:
+            alpha = nodes.new("CompositorNodeSetAlpha")
+            alpha.location.x = 400
+            alpha.location.y = -(i-dec) * 200
+            links.new(denoise.outputs['Image'], alpha.inputs['Image'])
+            links.new(rl.outputs['Alpha'], alpha.inputs['Alpha'])
+            links.new(alpha.outputs['Image'], out.inputs['Image'])
+        batch.append((scenario, denoise, out, initial_state))
+
+    scene.world = render_world
+
+    for scenario, denoise, out, initial_state in batch:
+        name, is_lightmap, light_col, lights = scenario
+        links.new(rl.outputs[f'Combined_{name.replace(".","_")}'], denoise.inputs[0])
+
+    for scenario, denoise, out, _ in batch:
+        name, is_lightmap, light_col, lights = scenario
+        out.file_slots[0].path = f'{name} - Group {group_index}.exr'
+        out.file_slots[0].use_node_format = True
+        out.format.file_format = 'OPEN_EXR'
+        out.format.color_mode = 'RGB' if is_lightmap else 'RGBA'
+        out.format.exr_codec = 'ZIP'
+        out.format.color_depth = '16'
+
+    # Setup AOI, snapped to whole pixels and saved cropped. The border is offset by a quarter of pixel so that it gives
+    # the same pixel bounds whether they are rounded or truncated
+    crop = None
+    if influence != (0, 1, 0, 1):
+        min_x, max_x, min_y, max_y = influence
+        width, height = scene.render.resolution_x, scene.render.resolution_y
+        x0 = max(0, math.floor(min_x * width))
+        x1 = min(width, max(x0 + 1, math.ceil(max_x * width)))
+        y0 = max(0, math.floor((1 - max_y) * height))
+        y1 = min(height, max(y0 + 1, math.ceil((1 - min_y) * height)))
+        scene.render.use_border = True
+        scene.render.use_crop_to_border = True
+        scene.render.border_min_x = (x0 + 0.25) / width
+        scene.render.border_max_x = min(1, (x1 + 0.25) / width)
+        scene.render.border_min_y = (y0 + 0.25) / height
+        scene.render.border_max_y = min(1, (y1 + 0.25) / height)
+        crop = (x0, y0, x1 - x0, y1 - y0, width, height)
+    else:
+        scene.render.use_border = False
+    
+    with temp_output_folder(output_path) as tmp_path:
+        for _, _, out, _ in batch:
+            out.base_path = tmp_path
+        bpy.ops.render.render(write_still=False, scene=scene.name)
+
+        # Move files to their final path, removing the render index number that blender appends to the filename
+        for file in os.listdir(tmp_path):
+            match = re.fullmatch(r"(.*exr)\d\d\d\d", file)
+            if match:
+                os.replace(f'{tmp_path}{file}', bpy.path.abspath(f'{output_path}{match[1]}'))
+
+    for scenario, denoise, out, initial_state in batch:
+        _, _, _, lights = scenario
+        for light in lights:
+            render_col.objects.unlink(light)
+        if initial_state[0] == 1:
+            for o, c in initial_state[1]: o.data.color = c
+        bpy.ops.scene.view_layer_remove_lightgroup({'scene':scene})
+    nodes.clear()
+    links.clear()
+    scene.use_nodes = False
+    scene.world = prev_world
+    scene.view_layers[0].cycles.denoising_store_passes = False
+    scene.render.use_border = False
+    scene.render.use_crop_to_border = False
+    return crop
+
+
+def influence_area(influence, n_pixels):
+    """Pixel area of an influence bounds (None for the full render)"""
+    if not influence:
+        return n_pixels
+    min_x, max_x, min_y, max_y = influence
+    return (max_x - min_x) * (max_y - min_y) * n_pixels
+
+
+def border_area(scene, n_pixels):
+    """Pixel area of the render border of a scene"""
+    if not scene.render.use_border:
+        return n_pixels
+    return (scene.render.border_max_x - scene.render.border_min_x) * (scene.render.border_max_y - scene.render.border_min_y) * n_pixels
+
+
 def render_all_groups(op, context):
     """Render all render groups for all lighting situations
     """
@@ -266,14 +673,26 @@ def render_all_groups(op, context):
         op.report({'ERROR'}, 'Bake camera is missing')
         return {'CANCELLED'}
 
+    use_farm = context.scene.vlmSettings.use_render_farm
+    if use_farm and context.blend_data.is_dirty:
+        op.report({'ERROR'}, 'You must save your project before rendering with the render farm since workers render the saved file')
+        return {'CANCELLED'}
+
     start_time = time.time()
     bakepath = vlm_utils.get_bakepath(context, type='RENDERS')
+    farm_path = get_farm_path(context)
     vlm_utils.mkpath(bakepath)
+    clean_temp_outputs(bakepath)
     if context.scene.vlmSettings.max_lighting == 0:
         max_scenarios_in_batch = 1024
     else:
         max_scenarios_in_batch = int(context.scene.vlmSettings.max_lighting * 4096 / int(context.scene.vlmSettings.render_height))
     opt_force_render = False # Force rendering even if cache is available
+    opt_render_overhead = 0.1 # Fixed cost of a render (scene preparation,...) expressed as a fraction of a full frame render, used to plan batches
+    opt_prepass_scale = 0.125 # Resolution scale of the influence pre-pass renders
+    opt_prepass_samples = 16 # Sample count of the influence pre-pass renders
+    render_cache = vlm_render_cache.RenderCache(context)
+    telemetry = vlm_render_telemetry.RenderTelemetry(context)
     render_aspect_ratio = context.scene.vlmSettings.render_aspect_ratio
     n_render_groups = vlm_utils.get_n_render_groups(context)
     light_scenarios = vlm_utils.get_lightings(context)
@@ -283,44 +702,13 @@ def render_all_groups(op, context):
     if fixed_view:
         fixed_view.nodes['Incoming'].inputs[0].default_value = camera_object.location
 
-    # Create temp render scene, using the user render settings setup
-    scene = bpy.data.scenes.new('VLM.Tmp Scene')
-    scene.collection.objects.link(camera_object)
-    scene.camera = camera_object
-    for prop in bpy.context.scene.render.bl_rna.properties:
-        if not prop.is_readonly and prop.identifier not in {'rna_type'}:
-            setattr(scene.render, prop.identifier, getattr(context.scene.render, prop.identifier))
-    for prop in bpy.context.scene.cycles.bl_rna.properties:
-        if not prop.is_readonly and prop.identifier not in {'rna_type'}:
-            setattr(scene.cycles, prop.identifier, getattr(context.scene.cycles, prop.identifier))
-    scene.render.engine = 'CYCLES'
-    scene.render.use_border = False
-    scene.render.use_crop_to_border = False
+    scene, indirect_col, render_col = create_render_scene(context, camera_object, bake_col)
     render_size = vlm_utils.get_render_size(context)
-    scene.render.resolution_x = render_size[0]
-    scene.render.resolution_y = render_size[1]
-    scene.render.film_transparent = True
-    scene.view_settings.view_transform = 'Raw'
-    scene.view_settings.look = 'None'
-    scene.view_layers[0].use_pass_z = False
-    scene.use_nodes = False
-
-    # Setup the scene with all the bake objects with indirect render influence
-    indirect_col = bpy.data.collections.new('Indirect')
-    render_col = bpy.data.collections.new('Render')
-    scene.collection.children.link(indirect_col)
-    scene.collection.children.link(render_col)
-    vlm_collections.find_layer_collection(scene.view_layers[0].layer_collection, indirect_col).indirect_only = True
-    for obj in bake_col.all_objects:
-        if not obj.vlmSettings.hide_from_others:
-            indirect_col.objects.link(obj)
+    n_pixels = render_size[0] * render_size[1]
     
     # Load the group masks to filter out the obviously non influenced scenarios
     mask_path = vlm_utils.get_bakepath(context, type='MASKS')
-    group_masks = []
-    for i in range(n_render_groups):
-        im = Image.open(bpy.path.abspath(f'{mask_path}Mask - Group {i} (Padded LD).png'))
-        group_masks.append((im.size[0], im.size[1], im.tobytes("raw", "L")))
+    group_masks = [load_influence_mask(f'{mask_path}Mask - Group {i} (Padded LD).png') for i in range(n_render_groups)]
 
     # Prepare and report stats
     n_lighting_situations = len(light_scenarios)
@@ -330,226 +718,122 @@ def render_all_groups(op, context):
     print(f'\nEvaluating {n_total_render} renders ({n_render_groups} render groups and {n_bake_objects} bakes for {n_lighting_situations} lighting situations)')
     
     # Perform the actual rendering of all the passes
+    farm_jobs = []
     if bake_info_group: bake_info_group.nodes['IsBake'].outputs["Value"].default_value = 1.0
+
+    # Influence pre-pass: scenarios with lights whose AOI can not be evaluated are rendered once for the whole scene at low
+    # resolution to measure the region they actually influence, which is then used instead of a full frame render border
+    prepass = {}
+    if context.scene.vlmSettings.influence_prepass:
+        group_objects = [[obj for obj in bake_col.all_objects if obj.vlmSettings.render_group == group_index and not obj.vlmSettings.use_bake] for group_index in range(n_render_groups)]
+        prepass_scenarios = []
+        for scenario in (scenario for scenario in light_scenarios if needs_influence_prepass(scenario)):
+            for group_index, objects in enumerate(group_objects):
+                rendered_objects = objects + [obj.vlmSettings.bake_mask for obj in objects if obj.vlmSettings.bake_mask]
+                render_hash = render_cache.render_digest(camera_object, rendered_objects, scenario)
+                if opt_force_render or not render_cache.is_valid(f'{bakepath}{scenario[0]} - Group {group_index}.exr', render_hash):
+                    prepass_scenarios.append(scenario)
+                    break
+        if prepass_scenarios:
+            print(f'. Rendering influence pre-pass for {len(prepass_scenarios)} lighting scenarios')
+            all_objects = [obj for objects in group_objects for obj in objects]
+            link_render_group(all_objects, indirect_col, render_col)
+            prepass = render_influence_prepass(scene, context.view_layer.depsgraph, camera_object, prepass_scenarios, render_col, bakepath, opt_prepass_scale, opt_prepass_samples)
+            unlink_render_group(all_objects, indirect_col, render_col)
     for group_index, group_mask in enumerate(group_masks):
         objects = [obj for obj in bake_col.all_objects if obj.vlmSettings.render_group == group_index and not obj.vlmSettings.use_bake]
         n_objects = len(objects)
-        for obj in objects:
-            if not obj.vlmSettings.hide_from_others:
-                indirect_col.objects.unlink(obj)
-            if obj.vlmSettings.bake_mask:
-                render_col.objects.link(obj.vlmSettings.bake_mask)
-            render_col.objects.link(obj)
+        link_render_group(objects, indirect_col, render_col)
+        rendered_objects = objects + [obj.vlmSettings.bake_mask for obj in objects if obj.vlmSettings.bake_mask]
         
         #########
         # Blender 3.2+ batch light pass rendering
         #
         # In Blender 3.2, we can render multiple lights at once and save there data separately using light groups for way faster rendering.
-        # This needs to use the compositor to performs denoising and save to split file outputs.
+        # This needs to use the compositor to performs denoising and save to split file outputs. Light groups are assigned to objects,
+        # so emitter meshes are batched like lights.
         print(f'. Processing batch render for group {group_index}')
-        scenarios_to_process = [scenario for scenario in light_scenarios]
-        while scenarios_to_process:
-            prev_world = scene.world
-            render_world = None
-            n_scenarios = 0
-            scene.use_nodes = True
-            scene.view_layers[0].cycles.denoising_store_passes = True
-            scene.render.use_file_extension = False
-
-            nodes = scene.node_tree.nodes
-            links = scene.node_tree.links
-            nodes.clear()
-            links.clear()
-            rl = nodes.new("CompositorNodeRLayers")
-            rl.scene = scene
-            rl.location.x = -200
-            dec = max_scenarios_in_batch / 2.0
-            batch = []
-            influence = None
-            remaining_scenarios = []
-            for i, scenario in enumerate(scenarios_to_process, start=1):
-                name, is_lightmap, light_col, lights = scenario
-                # Light pass does not work with emitter meshes (consider the scenario as processed for the batch since it will be processed later)
-                if next((l for l in lights if l.type != 'LIGHT'), None): 
-                    continue
-                # One world bake maximum per batch
-                if light_col.vlmSettings.world != None: 
-                    if render_world is None: 
-                        render_world = light_col.vlmSettings.world
-                        render_world.lightgroup = name
-                    else:
-                        remaining_scenarios.append(scenario)
-                        continue
-                # Maximum number of simultaneous scenario (Blender may crash by out of memory if there are too much)
-                if len(batch) >= max_scenarios_in_batch: 
-                    remaining_scenarios.append(scenario)
-                    continue
-                # Do not re-render existing cached renders
-                render_path = f'{bakepath}{name} - Group {group_index}.exr'
-                if not opt_force_render and os.path.exists(bpy.path.abspath(render_path)):
-                    print(f'. Skipping scenario {name} for group {group_index} since it is already rendered and cached')
-                    n_existing += 1
-                    continue
-                # Only render if the scenario influence the objects in the group
-                if not is_lightmap or light_col.vlmSettings.world:
-                    scenario_influence = (0, 1, 0, 1)
-                else:
-                    scenario_influence = None
-                    for light in lights:
-                        light_influence = get_light_influence(scene, context.view_layer.depsgraph, camera_object, light, group_mask)
-                        if light_influence:
-                            if scenario_influence:
-                                min_x, max_x, min_y, max_y = scenario_influence
-                                min_x2, max_x2, min_y2, max_y2 = light_influence
-                                scenario_influence = (min(min_x, min_x2), max(max_x, max_x2), min(min_y, min_y2), max(max_y, max_y2))
-                            else:
-                                scenario_influence = light_influence
-                if not scenario_influence:
-                    print(f'. Skipping scenario {name} since it is not influencing group {group_index}')
-                    n_skipped += 1
-                    continue
-
-                if influence:
-                    min_x, max_x, min_y, max_y = influence
-                    min_x2, max_x2, min_y2, max_y2 = scenario_influence
-                    influence = (min(min_x, min_x2), max(max_x, max_x2), min(min_y, min_y2), max(max_y, max_y2))
-                else:
-                    influence = scenario_influence
-                
-                scene.view_layers[0].lightgroups.add(name=name.replace(".","_"))
-                initial_state = (0, None)
-                if vlm_utils.is_rgb_led(lights):
-                    colored_lights = [o for o in lights if o.type=='LIGHT']
-                    prev_colors = [o.data.color for o in colored_lights]
-                    for o in colored_lights: o.data.color = (1.0, 1.0, 1.0)
-                    initial_state = (1, zip(colored_lights, prev_colors))
+        batch_candidates = []
+        for scenario in light_scenarios:
+            name, is_lightmap, light_col, lights = scenario
+            # Do not re-render cached renders if their inputs did not change
+            render_path = f'{bakepath}{name} - Group {group_index}.exr'
+            render_hash = render_cache.render_digest(camera_object, rendered_objects, scenario)
+            if not opt_force_render and render_cache.is_valid(render_path, render_hash):
+                print(f'. Skipping scenario {name} for group {group_index} since it is already rendered and cached')
+                telemetry.record('group', group_index, [name], 'cached')
+                n_existing += 1
+                continue
+            # Only render if the scenario influence the objects in the group
+            if not is_lightmap or light_col.vlmSettings.world:
+                scenario_influence = (0, 1, 0, 1)
+            elif name in prepass:
+                scenario_influence = get_prepass_influence(prepass[name], group_mask)
+            else:
+                scenario_influence = None
                 for light in lights:
-                    light.lightgroup = name.replace(".","_")
-                    render_col.objects.link(light)
-                denoise = nodes.new("CompositorNodeDenoise")
-                denoise.location.x = 200
-                denoise.location.y = -(i-dec) * 200
-                links.new(rl.outputs['Denoising Normal'], denoise.inputs['Normal'])
-                links.new(rl.outputs['Denoising Albedo'], denoise.inputs['Albedo'])
-                out = nodes.new("CompositorNodeOutputFile")
-                out.location.x = 600
-                out.location.y = -(i-dec) * 200
-                if is_lightmap:
-                    links.new(denoise.outputs['Image'], out.inputs['Image'])
-                else:
-                    alpha = nodes.new("CompositorNodeSetAlpha")
-                    alpha.location.x = 400
-                    alpha.location.y = -(i-dec) * 200
-                    links.new(denoise.outputs['Image'], alpha.inputs['Image'])
-                    links.new(rl.outputs['Alpha'], alpha.inputs['Alpha'])
-                    links.new(alpha.outputs['Image'], out.inputs['Image'])
-                batch.append((scenario, denoise, out, initial_state))
-
-            if not batch:
-                scenarios_to_process = remaining_scenarios
+                    scenario_influence = merge_influence(scenario_influence, get_light_influence(scene, context.view_layer.depsgraph, camera_object, light, group_mask))
+            if not scenario_influence:
+                print(f'. Skipping scenario {name} since it is not influencing group {group_index}')
+                telemetry.record('group', group_index, [name], 'skipped')
+                n_skipped += 1
+                continue
+            batch_candidates.append((scenario, scenario_influence, render_hash))
+
+        batches = []
+        for batch in plan_render_batches(batch_candidates, max_scenarios_in_batch, opt_render_overhead, render_size):
+            influence = None
+            for _, scenario_influence, _ in batch:
+                influence = merge_influence(influence, scenario_influence)
+            batches.append((batch, influence))
+        for batch_index, (batch, influence) in enumerate(batches):
+            if use_farm:
+                farm_jobs.append({'id': f'{len(farm_jobs):04d}', 'type': 'batch', 'group': group_index, 'border': influence,
+                    'scenarios': [scenario[0] for scenario, _, _ in batch],
+                    'outputs': [f'{bakepath}{scenario[0]} - Group {group_index}.exr' for scenario, _, _ in batch],
+                    'hashes': [render_hash for _, _, render_hash in batch]})
                 continue
 
-            scene.world = render_world
-
-            for scenario, denoise, out, initial_state in batch:
-                name, is_lightmap, light_col, lights = scenario
-                links.new(rl.outputs[f'Combined_{name.replace(".","_")}'], denoise.inputs[0])
-
-            for scenario, denoise, out, _ in batch:
-                name, is_lightmap, light_col, lights = scenario
-                out.base_path = f'{bakepath}'
-                out.file_slots[0].path = f'{name} - Group {group_index}.exr'
-                out.file_slots[0].use_node_format = True
-                out.format.file_format = 'OPEN_EXR'
-                out.format.color_mode = 'RGB' if is_lightmap else 'RGBA'
-                out.format.exr_codec = 'ZIP'
-                out.format.color_depth = '16'
-            
             elapsed = time.time() - start_time
             msg = f". Rendering group #{group_index+1}/{n_render_groups} ({n_objects} objects) for {len(batch)} lighting scenarios (influence: {influence}). Progress is {((n_skipped+n_render_performed+n_existing)/n_total_render):5.2%}, elapsed: {vlm_utils.format_time(elapsed)}"
-            if elapsed > 0 and n_render_performed > 0:
-                elapsed_per_render = elapsed / n_render_performed
-                remaining_render = n_total_render - (n_skipped+n_render_performed+n_existing)
-                msg = f'{msg}, remaining: {vlm_utils.format_time(remaining_render * elapsed_per_render)} for {remaining_render} renders'
-            print(msg)
+            pending = [(influence_area(b[1], n_pixels), len(b[0])) for b in batches[batch_index:]]
+            n_remaining = n_total_render - (n_skipped+n_render_performed+n_existing) - sum(n for _, n in pending)
+            print(telemetry.progress_message(msg, pending, n_remaining))
             print(f'. Scenarios: {",".join(s[0][0] for s in batch)}')
-            #return {'FINISHED'}                    
-
-            # Setup AOI
-            if influence != (0, 1, 0, 1):
-                min_x, max_x, min_y, max_y = influence
-                scene.render.use_border = True
-                scene.render.border_min_x = min_x
-                scene.render.border_max_x = max_x
-                scene.render.border_min_y = 1 - max_y
-                scene.render.border_max_y = 1 - min_y
-            else:
-                scene.render.use_border = False
-            
-            bpy.ops.render.render(write_still=False, scene=scene.name)
-            n_render_performed += len(batch)
 
-            # Rename files since blender will append a render index number to the filename
-            for file in os.listdir(bpy.path.abspath(f'{bakepath}')):
-                match = re.fullmatch(r"(.*exr)\d\d\d\d", file)
-                if match:
-                    outRenderFileName = bpy.path.abspath(f'{bakepath}{match[1]}')
-                    if os.path.exists(outRenderFileName):
-                        os.remove(outRenderFileName)
-                    os.rename(bpy.path.abspath(f'{bakepath}{file}'), outRenderFileName)
-
-            for scenario, denoise, out, initial_state in batch:
-                _, _, _, lights = scenario
-                for light in lights:
-                    render_col.objects.unlink(light)
-                if initial_state[0] == 1:
-                    for o, c in initial_state[1]: o.data.color = c
-                bpy.ops.scene.view_layer_remove_lightgroup({'scene':scene})
-            nodes.clear()
-            links.clear()
-            scene.use_nodes = False
-            scene.world = prev_world
-            scene.view_layers[0].cycles.denoising_store_passes = False
-            scene.render.use_border = False
-        
-            scenarios_to_process = remaining_scenarios
+            telemetry.begin()
+            crop = render_batch(scene, render_col, [scenario for scenario, _, _ in batch], influence, bakepath, group_index, max_scenarios_in_batch)
+            telemetry.end('batch', group_index, [scenario[0] for scenario, _, _ in batch], influence_area(influence, n_pixels))
+            n_render_performed += len(batch)
+            for scenario, _, render_hash in batch:
+                render_cache.store(f'{bakepath}{scenario[0]} - Group {group_index}.exr', render_hash, crop)
     
-        #########
-        # Default rendering
-        #
-        # Light pass batch rendering does not support emitter mesh, so we use the legacy per light scenario rendering to process them
-        for i, scenario in enumerate(light_scenarios, start=1):
-            name, is_lightmap, light_col, lights = scenario
-            render_path = f'{bakepath}{scenario[0]} - Group {group_index}.exr'
-            if opt_force_render or not os.path.exists(bpy.path.abspath(render_path)):
-                state, restore_func = setup_light_scenario(scene, context.view_layer.depsgraph, camera_object, scenario, group_mask, render_col)
-                elapsed = time.time() - start_time
-                msg = f". Rendering group #{group_index+1}/{n_render_groups} ({n_objects} objects) for '{scenario[0]}' ({i}/{n_lighting_situations}). Progress is {((n_skipped+n_render_performed+n_existing)/n_total_render):5.2%}, elapsed: {vlm_utils.format_time(elapsed)}"
-                if elapsed > 0 and n_render_performed > 0:
-                    elapsed_per_render = elapsed / n_render_performed
-                    remaining_render = n_total_render - (n_skipped+n_render_performed+n_existing)
-                    msg = f'{msg}, remaining: {vlm_utils.format_time(remaining_render * elapsed_per_render)} for {remaining_render} renders'
-                if state:
-                    print(msg)
-                    scene.render.filepath = render_path
-                    scene.render.image_settings.file_format = 'OPEN_EXR'
-                    scene.render.image_settings.color_mode = 'RGB' if is_lightmap else 'RGBA'
-                    scene.render.image_settings.exr_codec = 'ZIP' # Lossless compression
-                    scene.render.image_settings.color_depth = '16'
-                    bpy.ops.render.render(write_still=True, scene=scene.name)
-                    restore_func(state)
-                    print('\n')
-                    n_render_performed += 1
-                else:
-                    print(f'{msg} - Skipped (no influence)')
-                    n_skipped += 1
+        unlink_render_group(objects, indirect_col, render_col)
 
-        for obj in objects:
-            if not obj.vlmSettings.hide_from_others:
-                indirect_col.objects.link(obj)
-            if obj.vlmSettings.bake_mask:
-                render_col.objects.unlink(obj.vlmSettings.bake_mask)
-            render_col.objects.unlink(obj)
+    #########
+    # Render farm
+    #
+    # Group renders are dispatched as jobs to background Blender processes (local workers, and/or workers launched by
+    # the user on other computers sharing the farm folder), then the render cache is updated with the completed jobs.
+    if use_farm and farm_jobs:
+        farm_result = run_render_farm(context, farm_path, farm_jobs, context.scene.vlmSettings.render_farm_workers)
+        for job, rendered, duration, crop in farm_result:
+            for render_path, render_hash in zip(job['outputs'], job['hashes']):
+                if render_path in rendered:
+                    render_cache.store(render_path, render_hash, crop)
+            if rendered:
+                telemetry.end(job['type'], job['group'], job['scenarios'], influence_area(job['border'], n_pixels), duration)
+            else:
+                telemetry.record(job['type'], job['group'], job['scenarios'], 'skipped')
+            n_render_performed += len(rendered)
+            n_skipped += len(job['outputs']) - len(rendered)
+        render_cache.save()
+        if len(farm_result) < len(farm_jobs):
+            if bake_info_group: bake_info_group.nodes['IsBake'].outputs["Value"].default_value = 0.0
+            bpy.data.scenes.remove(scene)
+            telemetry.save()
+            op.report({'ERROR'}, f'Render farm stopped with {len(farm_jobs) - len(farm_result)} uncompleted jobs, see console for details')
+            return {'CANCELLED'}
 
     #########
     # Traditional baking
@@ -566,21 +850,19 @@ def render_all_groups(op, context):
             indirect_col.objects.unlink(obj)
         render_col.objects.link(obj)
         elapsed = time.time() - start_time
-        im = Image.open(bpy.path.abspath(f'{mask_path}Mask - Bake - {obj.name} (Padded LD).png'))
-        obj_mask = (im.size[0], im.size[1], im.tobytes("raw", "L"))
+        obj_mask = load_influence_mask(f'{mask_path}Mask - Bake - {obj.name} (Padded LD).png')
         for i, scenario in enumerate(light_scenarios, start=1):
             name, is_lightmap, light_col, lights = scenario
             render_path = f'{bakepath}{scenario[0]} - Bake - {obj.name}.exr'
-            if opt_force_render or not os.path.exists(bpy.path.abspath(render_path)):
+            render_hash = render_cache.render_digest(camera_object, [obj], scenario)
+            if opt_force_render or not render_cache.is_valid(render_path, render_hash):
                 state, restore_func = setup_light_scenario(scene, context.view_layer.depsgraph, camera_object, scenario, obj_mask, render_col)
                 elapsed = time.time() - start_time
                 msg = f". Baking '{obj.name}' for '{scenario[0]}' ({i}/{n_lighting_situations}). Progress is {((n_skipped+n_render_performed+n_existing)/n_total_render):5.2%}, elapsed: {vlm_utils.format_time(elapsed)}"
-                if elapsed > 0 and n_render_performed > 0:
-                    elapsed_per_render = elapsed / n_render_performed
-                    remaining_render = n_total_render - (n_skipped+n_render_performed+n_existing)
-                    msg = f'{msg}, remaining: {vlm_utils.format_time(remaining_render * elapsed_per_render)} for {remaining_render} renders'
                 if state:
-                    print(msg)
+                    area = obj.vlmSettings.bake_width * obj.vlmSettings.bake_height
+                    print(telemetry.progress_message(msg, [(area, 1)], n_total_render - (n_skipped+n_render_performed+n_existing) - 1))
+                    telemetry.begin()
                     img_nodes = []
                     bake_img = bpy.data.images.new('Bake', obj.vlmSettings.bake_width, obj.vlmSettings.bake_height, alpha=True, float_buffer=True)
                     for mat in obj.data.materials:
@@ -588,25 +870,29 @@ def render_all_groups(op, context):
                         ti.image = bake_img
                         mat.node_tree.nodes.active = ti
                         img_nodes.append(ti)
-                    scene.render.filepath = render_path
                     scene.render.image_settings.file_format = 'OPEN_EXR'
                     scene.render.image_settings.color_mode = 'RGB' if is_lightmap else 'RGBA'
                     scene.render.image_settings.exr_codec = 'ZIP' # Lossless compression
                     scene.render.image_settings.color_depth = '16'
-                    with context.temp_override(scene=scene, selected_objects=[obj]):
+                    with context.temp_override(scene=scene, selected_objects=[obj]), temp_output_folder(bakepath) as tmp_path:
                         bpy.ops.object.bake(type='COMBINED', margin=context.scene.vlmSettings.padding, use_selected_to_active=False, use_clear=True)
-                        bake_img.save_render(bpy.path.abspath(render_path), scene=scene)
+                        bake_img.save_render(f'{tmp_path}{os.path.basename(render_path)}', scene=scene)
+                        os.replace(f'{tmp_path}{os.path.basename(render_path)}', bpy.path.abspath(render_path))
                     for mat, ti in zip(obj.data.materials, img_nodes):
                         mat.node_tree.nodes.remove(ti)
                     bpy.data.images.remove(bake_img)
+                    telemetry.end('bake', obj.name, [name], area)
                     restore_func(state)
+                    render_cache.store(render_path, render_hash)
                     print('\n')
                     n_render_performed += 1
                 else:
                     print(f'{msg} - Skipped (no influence)')
+                    telemetry.record('bake', obj.name, [name], 'skipped')
                     n_skipped += 1
             else:
-                print(f'{msg} - Skipped since it is already rendered and cached')
+                print(f". Skipping '{obj.name}' for '{scenario[0]}' since it is already rendered and cached")
+                telemetry.record('bake', obj.name, [name], 'cached')
                 n_existing += 1
         if not obj.vlmSettings.hide_from_others:
             indirect_col.objects.link(obj)
@@ -614,11 +900,218 @@ def render_all_groups(op, context):
 
     if bake_info_group: bake_info_group.nodes['IsBake'].outputs["Value"].default_value = 0.0
     bpy.data.scenes.remove(scene)
+    render_cache.save()
+    telemetry.save()
     length = time.time() - start_time
     print(f"\nRendering finished in a total time of {vlm_utils.format_time(length)}")
     if n_existing > 0: print(f". {n_existing:>3} renders were skipped since they were already existing")
     if n_skipped > 0: print(f". {n_skipped:>3} renders were skipped since objects were outside of lights influence")
     if n_render_performed > 0: print(f". {n_render_performed:>3} renders were computed ({vlm_utils.format_time(length/n_render_performed)} per render)")
+    telemetry.print_summary()
 
     context.scene.vlmSettings.last_bake_step = 'renders'
     return {'FINISHED'}
+
+
+def get_farm_path(context):
+    """Absolute path of the folder used to exchange jobs with render farm workers"""
+    farm_path = context.scene.vlmSettings.render_farm_path
+    if not farm_path:
+        farm_path = f'{vlm_utils.get_bakepath(context)}Farm/'
+    return bpy.path.abspath(farm_path)
+
+
+def claim_render_job(farm_path, job_id):
+    """Claim a render farm job by atomically creating its lock file, returning False if it is already claimed or done"""
+    if os.path.exists(os.path.join(farm_path, f'{job_id}.done')):
+        return False
+    try:
+        fd = os.open(os.path.join(farm_path, f'{job_id}.lock'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, f)
+    return True
+
+
+def write_job_result(farm_path, job_id, result):
+    """Atomically write the done file of a render farm job"""
+    done_path = os.path.join(farm_path, f'{job_id}.done')
+    with open(f'{done_path}.tmp', 'w') as f:
+        json.dump(result, f)
+    os.replace(f'{done_path}.tmp', done_path)
+
+
+def run_render_farm(context, farm_path, jobs, n_workers, lock_timeout=120, max_retries=2, stall_limit=600):
+    """Dispatch render jobs to workers through a job manifest stored in the farm folder, and wait for their completion.
+    Workers are background Blender processes running worker.py on the saved blend file. They claim jobs by creating a
+    lock file, which they touch periodically while rendering, then create a done file listing the rendered outputs (or
+    the error which made the job fail). n_workers local workers are launched (and launched again if jobs are released),
+    others may be launched by the user on computers sharing the farm folder.
+    Locks which are not touched for lock_timeout seconds (crashed or killed worker, workers touch their lock every 10s)
+    are released so that the job can be claimed again, up to max_retries times after which the job is failed. The wait
+    ends when all jobs are done or failed, when nothing progresses for stall_limit seconds (no job completed nor being
+    rendered), or on Ctrl+C.
+    Returns the list of (job, rendered outputs, wall time, crop region) of the completed jobs.
+    """
+    vlm_utils.mkpath(farm_path)
+    for file in os.listdir(farm_path):
+        if file.endswith('.lock') or file.endswith('.done'):
+            os.remove(os.path.join(farm_path, file))
+    manifest_path = os.path.join(farm_path, FARM_MANIFEST_NAME)
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        json.dump({'blend': bpy.path.abspath(context.blend_data.filepath), 'jobs': jobs}, f, indent=1)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')
+    print(f'\nRender farm: {len(jobs)} jobs written to {manifest_path}')
+    print(f'. Additional workers can be launched on computers sharing the farm folder with:')
+    print(f'. blender -b "<table.blend>" --python "<add-on folder>/worker.py" -- "<farm folder>/{FARM_MANIFEST_NAME}"')
+    blend_path = bpy.path.abspath(context.blend_data.filepath)
+    launch_worker = lambda: subprocess.Popen([bpy.app.binary_path, '-b', blend_path, '--python', worker_script, '--', manifest_path])
+    workers = [launch_worker() for _ in range(n_workers)]
+    max_launches = n_workers * (1 + max_retries)
+    n_launches = n_workers
+    start_time = last_progress = time.time()
+    retries = {}
+    completed = []
+    failed = []
+    pending = list(jobs)
+    try:
+        while pending:
+            for job in [job for job in pending if os.path.exists(os.path.join(farm_path, f'{job["id"]}.done'))]:
+                with open(os.path.join(farm_path, f'{job["id"]}.done'), 'r') as f:
+                    result = json.load(f)
+                pending.remove(job)
+                last_progress = time.time()
+                if result.get('error'):
+                    failed.append(job)
+                    print(f'. Job {job["id"]} (group {job["group"]}, {len(job["scenarios"])} scenarios) failed on {result["worker"]}: {result["error"]}')
+                    continue
+                completed.append((job, result['rendered'], result['time'], result['crop']))
+                print(f'. Job {job["id"]} (group {job["group"]}, {len(job["scenarios"])} scenarios) completed by {result["worker"]} in {vlm_utils.format_time(result["time"])}. Progress is {len(completed)}/{len(jobs)} jobs, elapsed: {vlm_utils.format_time(time.time() - start_time)}')
+            # Check the locks of the pending jobs, releasing the stale ones
+            n_unclaimed = 0
+            for job in pending:
+                lock_path = os.path.join(farm_path, f'{job["id"]}.lock')
+                try:
+                    lock_age = time.time() - os.path.getmtime(lock_path)
+                except OSError:
+                    n_unclaimed += 1
+                    continue
+                if lock_age <= lock_timeout:
+                    last_progress = time.time() # Job is being rendered
+                    continue
+                retries[job['id']] = retries.get(job['id'], 0) + 1
+                if retries[job['id']] > max_retries:
+                    write_job_result(farm_path, job['id'], {'worker': 'coordinator', 'rendered': [], 'time': 0, 'crop': None,
+                        'error': f'worker stopped responding {retries[job["id"]]} times'})
+                else:
+                    print(f'. Job {job["id"]} lock is stale (worker stopped responding), releasing it to be rendered again')
+                    with contextlib.suppress(OSError):
+                        os.remove(lock_path)
+                    n_unclaimed += 1
+            # Keep the local workers running while there are unclaimed jobs
+            workers = [worker for worker in workers if worker.poll() is None]
+            while n_unclaimed > 0 and len(workers) < min(n_workers, n_unclaimed) and n_launches < max_launches:
+                workers.append(launch_worker())
+                n_launches += 1
+            if pending and time.time() - last_progress > stall_limit:
+                print(f'. No render farm progress for {vlm_utils.format_time(stall_limit)} (no job completed or being rendered), stopping')
+                break
+            if pending:
+                time.sleep(1.0)
+    except KeyboardInterrupt:
+        print(f'. Render farm cancelled by user')
+    for worker in workers:
+        if worker.poll() is None:
+            worker.terminate()
+    if pending or failed:
+        print(f'. Render farm stopped with {len(pending) + len(failed)} uncompleted jobs: {", ".join(job["id"] for job in failed + pending)}')
+    return completed
+
+
+def _touch_lock(lock_path, stop, period):
+    """Periodically update the modification time of a render farm job lock, to show that its worker is alive"""
+    while not stop.wait(period):
+        with contextlib.suppress(OSError):
+            os.utime(lock_path)
+
+
+def run_render_worker(op, context, manifest_path):
+    """Render farm worker: claim and render the jobs of the given job manifest until all of them are claimed.
+    Each output is rendered to a temporary folder then moved to its final path, so that an interrupted worker never
+    leaves a partially written render.
+    """
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        op.report({'ERROR'}, f'Failed to load render farm job manifest: {e}')
+        return {'CANCELLED'}
+    farm_path = os.path.dirname(os.path.abspath(manifest_path))
+
+    bake_col = vlm_collections.get_collection(context.scene.collection, 'VLM.Bake', create=False)
+    if not bake_col:
+        op.report({'ERROR'}, "No 'VLM.Bake' collection to process")
+        return {'CANCELLED'}
+
+    camera_object = vlm_utils.get_vpx_item(context, 'VPX.Camera', 'Bake', single=True)
+    if not camera_object:
+        op.report({'ERROR'}, 'Bake camera is missing')
+        return {'CANCELLED'}
+
+    worker_name = f'{socket.gethostname()}:{os.getpid()}'
+    if context.scene.vlmSettings.max_lighting == 0:
+        max_scenarios_in_batch = 1024
+    else:
+        max_scenarios_in_batch = int(context.scene.vlmSettings.max_lighting * 4096 / int(context.scene.vlmSettings.render_height))
+    light_scenarios = {scenario[0]: scenario for scenario in vlm_utils.get_lightings(context)}
+    bake_info_group = bpy.data.node_groups.get('VLM.BakeInfo')
+    fixed_view = bpy.data.node_groups.get('Fixed View Incoming')
+    if fixed_view:
+        fixed_view.nodes['Incoming'].inputs[0].default_value = camera_object.location
+
+    scene, indirect_col, render_col = create_render_scene(context, camera_object, bake_col)
+    if bake_info_group: bake_info_group.nodes['IsBake'].outputs["Value"].default_value = 1.0
+    print(f'\nRender farm worker {worker_name} processing {manifest_path}')
+    opt_heartbeat_period = 10 # Delay in seconds between updates of the lock of the job being rendered (must be far below the coordinator lock timeout)
+    n_jobs = 0
+    while True:
+        # Jobs are claimed again on each iteration, since the coordinator releases the jobs of workers which stopped responding
+        job = next((job for job in manifest['jobs'] if claim_render_job(farm_path, job['id'])), None)
+        if job is None:
+            break # All jobs are done or being rendered by other workers
+        start_time = time.time()
+        group_index = job['group']
+        print(f'. Rendering job {job["id"]}: group {group_index} for {", ".join(job["scenarios"])}')
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=_touch_lock, args=(os.path.join(farm_path, f'{job["id"]}.lock'), stop_heartbeat, opt_heartbeat_period), daemon=True)
+        heartbeat.start()
+        result = {'worker': worker_name, 'rendered': [], 'crop': None}
+        try:
+            scenarios = [light_scenarios.get(name) for name in job['scenarios']]
+            if None in scenarios:
+                result['error'] = 'some of its lighting scenarios are missing (the blend file does not match the job manifest)'
+            else:
+                objects = [obj for obj in bake_col.all_objects if obj.vlmSettings.render_group == group_index and not obj.vlmSettings.use_bake]
+                link_render_group(objects, indirect_col, render_col)
+                try:
+                    output_path = os.path.join(os.path.dirname(bpy.path.abspath(job['outputs'][0])), '')
+                    result['crop'] = render_batch(scene, render_col, scenarios, tuple(job['border']), output_path, group_index, max_scenarios_in_batch)
+                    result['rendered'] = job['outputs']
+                finally:
+                    unlink_render_group(objects, indirect_col, render_col)
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        result['time'] = time.time() - start_time
+        write_job_result(farm_path, job['id'], result)
+        n_jobs += 1
+
+    if bake_info_group: bake_info_group.nodes['IsBake'].outputs["Value"].default_value = 0.0
+    bpy.data.scenes.remove(scene)
+    print(f'\nRender farm worker {worker_name} finished after rendering {n_jobs} jobs')
+    return {'FINISHED'}
@@ -0,0 +1,346 @@
+#    Copyright (C) 2022  Vincent Bousquet
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import bpy
+import os
+import json
+import hashlib
+import numpy as np
+from . import vlm_utils
+
+# Render cache manifest
+#
+# Each render output (group render, bake render, object mask) is stored in the manifest with a hash of the inputs that
+# were used to produce it. A cached file is only reused if it exists and the hash of the current inputs matches the one
+# stored when it was rendered, so that changing a light, a material, the camera or the render settings only invalidates
+# the impacted renders. Objects which are only rendered as indirect influence are not part of the hash.
+#
+# Completed outputs are also appended, with their size and checksum, to a journal which is flushed to disk after each
+# render and merged into the manifest when it is saved. If Blender crashes during a long bake, the journal is replayed
+# on restart and each output is validated against its recorded size and checksum before being reused, so that rendering
+# resumes where it stopped without trusting incomplete files.
+
+MANIFEST_NAME = 'Render Manifest.json'
+JOURNAL_NAME = 'Render Journal.jsonl'
+_HASHED_PROPERTY_TYPES = {'BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM'}
+# Render settings which are overriden when rendering (and therefore do not influence the result)
+_RENDER_EXCLUDED = {'filepath', 'use_border', 'use_crop_to_border', 'border_min_x', 'border_max_x', 'border_min_y', 'border_max_y',
+    'resolution_x', 'resolution_y', 'resolution_percentage', 'film_transparent', 'use_file_extension', 'use_lock_interface'}
+
+
+class RenderCache:
+    """Manifest of rendered files, stored as a JSON file in the bake folder, and hashing helpers for render inputs.
+    Entries are stored as [digest, file size, file checksum, crop region] lists (older manifests only store the digest).
+    Renders limited to a render border are stored cropped to it, the crop region being stored as [x, y, width, height,
+    full width, full height] in pixels from the bottom left corner of the full frame (None for full frame renders).
+    Object, material and world digests are memoized for the lifetime of the cache, so a cache must not be kept across
+    scene modifications.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.root = vlm_utils.get_bakepath(context)
+        self.path = bpy.path.abspath(f'{self.root}{MANIFEST_NAME}')
+        self.journal_path = bpy.path.abspath(f'{self.root}{JOURNAL_NAME}')
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                print(f'. Render manifest is unreadable, all renders will be performed again')
+        if os.path.exists(self.journal_path):
+            n_records = 0
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break # Truncated last record (crash while writing it)
+                    self.entries[record['key']] = [record['digest'], record['size'], record['checksum'], record.get('crop')]
+                    n_records += 1
+            print(f'. Render journal replayed ({n_records} outputs completed since the manifest was last saved)')
+        self.verified = set()
+        self.digests = {}
+        self.settings_digest = None
+
+    def _key(self, path):
+        if path.startswith(self.root):
+            return path[len(self.root):]
+        return path
+
+    def is_valid(self, path, digest):
+        """Return True if the given file exists, was rendered from inputs with the given digest, and matches the size
+        and checksum recorded when it was completed (files are verified once per cache instance)"""
+        key = self._key(path)
+        entry = self.entries.get(key)
+        if isinstance(entry, str):
+            entry = [entry, None, None]
+        if entry is None or entry[0] != digest:
+            return False
+        filepath = bpy.path.abspath(path)
+        if not os.path.exists(filepath):
+            return False
+        if entry[1] is not None and key not in self.verified:
+            if os.path.getsize(filepath) != entry[1] or file_checksum(filepath) != entry[2]:
+                print(f'. {key} does not match its recorded size and checksum (incomplete or modified file), it will be rendered again')
+                del self.entries[key]
+                return False
+            self.verified.add(key)
+        return True
+
+    def store(self, path, digest, crop=None):
+        """Record a completed output, appending it to the journal"""
+        key = self._key(path)
+        filepath = bpy.path.abspath(path)
+        size, checksum = os.path.getsize(filepath), file_checksum(filepath)
+        crop = list(crop) if crop else None
+        self.entries[key] = [digest, size, checksum, crop]
+        self.verified.add(key)
+        vlm_utils.mkpath(self.root)
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps({'key': key, 'digest': digest, 'size': size, 'checksum': checksum, 'crop': crop}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get_crop(self, path):
+        """Crop region (x, y, width, height, full width, full height) of a render stored cropped to its render border,
+        or None if it is stored full frame"""
+        entry = self.entries.get(self._key(path))
+        if isinstance(entry, list) and len(entry) > 3 and entry[3]:
+            return tuple(entry[3])
+        return None
+
+    def get_checked_crop(self, path, image_size, render_size):
+        """Crop region of a render (see get_crop), after checking that its image has the expected size: the crop region
+        size for renders stored cropped, the full render size otherwise. Raises a ValueError if it does not, instead of
+        silently using a cropped render as a full frame one (for example if the cache manifest and journal were lost)."""
+        crop = self.get_crop(path)
+        expected = crop[2:4] if crop else render_size
+        if tuple(image_size) != tuple(expected) or (crop and tuple(crop[4:6]) != tuple(render_size)):
+            stored = f'cropped to {crop[2]}x{crop[3]} of a {crop[4]}x{crop[5]} render' if crop else 'full frame'
+            raise ValueError(f'Render {path} is {image_size[0]}x{image_size[1]} but it is recorded as {stored} while the render size is {render_size[0]}x{render_size[1]}. Render it again.')
+        return crop
+
+    def save(self):
+        """Save the manifest (atomically replacing the previous one), then clear the journal which is now merged in it"""
+        vlm_utils.mkpath(self.root)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _memoized(self, kind, id_data, hash_func):
+        key = (kind, id_data.name)
+        digest = self.digests.get(key)
+        if digest is None:
+            h = hashlib.sha1()
+            hash_func(h, id_data)
+            digest = self.digests[key] = h.digest()
+        return digest
+
+    def object_digest(self, obj, with_materials=True):
+        return self._memoized('OBJ' if with_materials else 'GEO', obj, lambda h, o: self._hash_object(h, o, with_materials))
+
+    def world_digest(self, world):
+        if world is None:
+            return b''
+        return self._memoized('WORLD', world, self._hash_world)
+
+    def render_digest(self, camera, objects, scenario):
+        """Digest of the inputs of a render of the given objects for the given light scenario"""
+        h = hashlib.sha1()
+        h.update(self.get_settings_digest())
+        h.update(self.object_digest(camera))
+        for obj in sorted(objects, key=lambda o: o.name):
+            h.update(self.object_digest(obj))
+        name, is_lightmap, light_col, lights = scenario
+        h.update(repr((name, is_lightmap)).encode())
+        h.update(self.world_digest(light_col.vlmSettings.world))
+        for light in sorted(lights, key=lambda o: o.name):
+            h.update(self.object_digest(light))
+        return h.hexdigest()
+
+    def mask_digest(self, camera, objects, width, height):
+        """Digest of the inputs of an object mask render (materials are not used for masks)"""
+        h = hashlib.sha1()
+        h.update(repr((width, height, self.context.scene.vlmSettings.mask_mode)).encode())
+        h.update(self.object_digest(camera))
+        for obj in sorted(objects, key=lambda o: o.name):
+            h.update(self.object_digest(obj, with_materials=False))
+        return h.hexdigest()
+
+    def get_settings_digest(self):
+        """Digest of the user render settings (render, output format & color management, cycles settings, render size and bake padding)"""
+        if self.settings_digest is None:
+            scene = self.context.scene
+            h = hashlib.sha1()
+            h.update(repr(vlm_utils.get_render_size(self.context)).encode())
+            _hash_rna(h, scene.render, _RENDER_EXCLUDED)
+            _hash_rna(h, scene.cycles)
+            _hash_rna(h, scene.render.image_settings)
+            _hash_rna(h, scene.render.image_settings.view_settings)
+            _hash_rna(h, scene.render.image_settings.display_settings)
+            _hash_rna(h, scene.view_settings)
+            _hash_rna(h, scene.display_settings)
+            _hash_rna(h, scene.sequencer_colorspace_settings)
+            h.update(repr(scene.vlmSettings.padding).encode())
+            self.settings_digest = h.digest()
+        return self.settings_digest
+
+    def _hash_object(self, h, obj, with_materials):
+        h.update(repr((obj.name, obj.type)).encode())
+        h.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+        settings = obj.vlmSettings
+        h.update(repr((settings.is_rgb_led, settings.enable_aoi, settings.hide_from_others, settings.use_bake, settings.bake_width, settings.bake_height)).encode())
+        if obj.type == 'MESH':
+            mesh = obj.evaluated_get(self.context.evaluated_depsgraph_get()).data
+            co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', co)
+            h.update(co.tobytes())
+            loops = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', loops)
+            h.update(loops.tobytes())
+            if with_materials:
+                for layer in mesh.uv_layers:
+                    uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+                    layer.data.foreach_get('uv', uv)
+                    h.update(uv.tobytes())
+                # Shading: smooth flags, material assignment, split normals (auto smooth & custom normals) and color attributes
+                smooth = np.empty(len(mesh.polygons), dtype=bool)
+                mesh.polygons.foreach_get('use_smooth', smooth)
+                h.update(smooth.tobytes())
+                material_index = np.empty(len(mesh.polygons), dtype=np.int32)
+                mesh.polygons.foreach_get('material_index', material_index)
+                h.update(material_index.tobytes())
+                h.update(repr((getattr(mesh, 'use_auto_smooth', None), getattr(mesh, 'auto_smooth_angle', None), mesh.has_custom_normals)).encode())
+                if hasattr(mesh, 'calc_normals_split'): # Loop normals are always up to date in Blender 4.1+
+                    mesh.calc_normals_split()
+                normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+                mesh.loops.foreach_get('normal', normals)
+                h.update(normals.tobytes())
+                for layer in mesh.color_attributes:
+                    colors = np.empty(len(layer.data) * 4, dtype=np.float32)
+                    layer.data.foreach_get('color', colors)
+                    h.update(f'{layer.name}:{layer.domain}:{layer.data_type};'.encode())
+                    h.update(colors.tobytes())
+        elif obj.type == 'LIGHT':
+            _hash_rna(h, obj.data)
+            if obj.data.use_nodes:
+                _hash_node_tree(h, obj.data.node_tree)
+        elif obj.type == 'CAMERA':
+            _hash_rna(h, obj.data)
+        elif obj.data is not None:
+            h.update(np.array([c[:] for c in obj.bound_box], dtype=np.float32).tobytes())
+        if with_materials and obj.type != 'LIGHT':
+            for slot in obj.material_slots: # Slot material is either the mesh or the object one, depending on the slot link
+                h.update(slot.link.encode())
+                if slot.material:
+                    h.update(self._memoized('MAT', slot.material, self._hash_material))
+                else:
+                    h.update(b'None')
+
+    def _hash_material(self, h, mat):
+        _hash_rna(h, mat)
+        if mat.use_nodes:
+            _hash_node_tree(h, mat.node_tree)
+
+    def _hash_world(self, h, world):
+        _hash_rna(h, world, {'lightgroup'}) # Light group is assigned when batch rendering
+        if world.use_nodes:
+            _hash_node_tree(h, world.node_tree)
+
+
+def load_full_frame_image(path, crop):
+    """Load a render stored cropped to its render border as a full frame image (black and transparent outside of the
+    crop region), for uses which can not handle cropped renders like material previews"""
+    cropped = bpy.data.images.load(path, check_existing=False)
+    x, y, width, height, full_width, full_height = crop
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    cropped.pixels.foreach_get(pixels)
+    bpy.data.images.remove(cropped)
+    full = np.zeros((full_height, full_width, 4), dtype=np.float32)
+    full[y:y + height, x:x + width] = pixels.reshape((height, width, 4))
+    image = bpy.data.images.new(os.path.basename(bpy.path.abspath(path)), full_width, full_height, alpha=True, float_buffer=True)
+    image.pixels.foreach_set(full.ravel())
+    image.filepath_raw = path
+    return image
+
+
+def file_checksum(filepath):
+    """SHA1 checksum of the content of a file"""
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _hash_rna(h, struct, excluded=()):
+    """Hash all the editable value properties (not pointers or collections) of a Blender struct"""
+    for prop in struct.bl_rna.properties:
+        if prop.type not in _HASHED_PROPERTY_TYPES or prop.is_readonly or prop.identifier in excluded:
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if isinstance(value, set):
+            value = sorted(value)
+        elif hasattr(value, '__len__') and not isinstance(value, str):
+            value = tuple(value[:])
+        h.update(f'{prop.identifier}={value!r};'.encode())
+
+
+def _hash_image(h, image):
+    """Hash the settings and the content of an image: the pixels of generated or modified images, the packed data of packed
+    images, or the modification time and size of the file of file images (so that textures repainted in place are detected)"""
+    _hash_rna(h, image, {'name', 'use_fake_user', 'display_aspect'})
+    h.update(f'{image.size[:]}:{image.colorspace_settings.name};'.encode())
+    if image.is_dirty or image.source == 'GENERATED':
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        h.update(pixels.tobytes())
+    elif image.packed_file:
+        h.update(hashlib.sha1(image.packed_file.data).digest())
+    else:
+        filepath = bpy.path.abspath(image.filepath, library=image.library)
+        if os.path.exists(filepath):
+            stat = os.stat(filepath)
+            h.update(f'{stat.st_mtime_ns}:{stat.st_size};'.encode())
+
+
+def _hash_node_tree(h, node_tree, visited=None):
+    if visited is None:
+        visited = set()
+    if node_tree.name in visited:
+        return
+    visited.add(node_tree.name)
+    for node in sorted(node_tree.nodes, key=lambda n: n.name):
+        h.update(f'{node.name}:{node.bl_idname};'.encode())
+        _hash_rna(h, node, {'name', 'label', 'location', 'width', 'height', 'select', 'show_options', 'show_preview', 'hide'})
+        for socket in node.inputs:
+            if not socket.is_linked and hasattr(socket, 'default_value'):
+                value = socket.default_value
+                if hasattr(value, '__len__') and not isinstance(value, str):
+                    value = tuple(value[:])
+                h.update(f'{socket.identifier}={value!r};'.encode())
+        image = getattr(node, 'image', None)
+        if image:
+            _hash_image(h, image)
+        if getattr(node, 'node_tree', None):
+            _hash_node_tree(h, node.node_tree, visited)
+    links = [f'{l.from_node.name}.{l.from_socket.identifier}>{l.to_node.name}.{l.to_socket.identifier}' for l in node_tree.links]
+    h.update(';'.join(sorted(links)).encode())
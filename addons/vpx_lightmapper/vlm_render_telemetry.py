@@ -0,0 +1,193 @@
+#    Copyright (C) 2022  Vincent Bousquet
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import bpy
+import os
+import re
+import csv
+import json
+import time
+import numpy as np
+from bpy.app.handlers import persistent
+from . import vlm_utils
+
+# Render telemetry
+#
+# Each render (or skipped/cached render) of the render step is recorded with its AOI pixel area, sample count, wall time
+# and peak memory. Records are appended to a CSV file in the renders folder, so that the render cost model fitted from
+# them improves across runs of the same bake. The model estimates the wall time of a render from its area and the number
+# of scenarios rendered together, and is used for the live ETA and to report the most expensive scenarios.
+
+CSV_NAME = 'Render Telemetry.csv'
+SUMMARY_NAME = 'Render Telemetry.json'
+FIELDS = ['run', 'kind', 'group', 'scenarios', 'status', 'area', 'samples', 'time', 'peak_memory']
+_MAX_HISTORY = 1000 # Number of previous rendered records used to seed the cost model
+_MIN_FIT_RECORDS = 6 # Minimum number of records to fit the full model instead of a plain cost per pixel
+
+_peak_memory = 0.0
+
+
+@persistent
+def _render_stats_handler(stats):
+    """Track the peak memory reported by the render engine (in MB), from stats like '... | Mem:120.45M, Peak:130.12M | ...'"""
+    global _peak_memory
+    match = re.search(r'Peak:\s*([\d.]+)([KMG])', stats)
+    if match:
+        _peak_memory = max(_peak_memory, float(match[1]) * {'K': 1.0 / 1024.0, 'M': 1.0, 'G': 1024.0}[match[2]])
+
+
+class RenderTelemetry:
+    """Telemetry records of a render step, with a render cost model fitted on the rendered records.
+    Modeled wall time is c0 + c1 * area * samples + c2 * area * samples * n_scenarios (c0 is the fixed overhead of a
+    render, c2 accounts for the per scenario denoising and compositing of batch renders)."""
+    def __init__(self, context):
+        self.context = context
+        self.path = bpy.path.abspath(vlm_utils.get_bakepath(context, type='RENDERS'))
+        self.run = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.records = []
+        self.history = []
+        self.coefs = None
+        self.start_time = 0
+        csv_path = os.path.join(self.path, CSV_NAME)
+        if os.path.exists(csv_path):
+            try:
+                with open(csv_path, 'r', newline='') as f:
+                    self.history = [row for row in csv.DictReader(f) if row['status'] == 'rendered'][-_MAX_HISTORY:]
+                for row in self.history:
+                    row['scenarios'] = row['scenarios'].split(';')
+                    for field in ('area', 'samples', 'time', 'peak_memory'):
+                        row[field] = float(row[field])
+            except (OSError, ValueError, KeyError):
+                print(f'. Render telemetry history is unreadable, it will be ignored')
+                self.history = []
+        self.fit()
+
+    def begin(self):
+        """Start measuring a render"""
+        global _peak_memory
+        _peak_memory = 0.0
+        if _render_stats_handler not in bpy.app.handlers.render_stats:
+            bpy.app.handlers.render_stats.append(_render_stats_handler)
+        self.start_time = time.time()
+
+    def end(self, kind, group, scenarios, area, duration=None):
+        """Record a performed render, started by begin, of the given pixel area"""
+        if duration is None:
+            duration = time.time() - self.start_time
+        self.record(kind, group, scenarios, 'rendered', area, duration, _peak_memory)
+        self.fit()
+
+    def record(self, kind, group, scenarios, status, area=0.0, duration=0.0, peak_memory=0.0):
+        self.records.append({'run': self.run, 'kind': kind, 'group': group, 'scenarios': list(scenarios), 'status': status,
+            'area': float(area), 'samples': float(self.context.scene.cycles.samples), 'time': float(duration), 'peak_memory': float(peak_memory)})
+
+    def fit(self):
+        """Fit the cost model coefficients on the rendered records (least squares, falling back to a plain cost per pixel
+        and sample if there are not enough records or if the fit is not physically meaningful)"""
+        rendered = self.history + [r for r in self.records if r['status'] == 'rendered']
+        rendered = [r for r in rendered if r['area'] > 0 and r['samples'] > 0]
+        if not rendered:
+            self.coefs = None
+            return
+        work = np.array([r['area'] * r['samples'] for r in rendered])
+        n_scenarios = np.array([len(r['scenarios']) for r in rendered])
+        times = np.array([r['time'] for r in rendered])
+        if len(rendered) >= _MIN_FIT_RECORDS:
+            features = np.stack((np.ones(len(rendered)), work, work * n_scenarios), axis=1)
+            coefs, _, rank, _ = np.linalg.lstsq(features, times, rcond=None)
+            if rank == features.shape[1] and np.all(coefs >= 0): # Singular records (for example all the same batch size) can not separate the terms
+                self.coefs = coefs
+                return
+        self.coefs = np.array([0.0, times.sum() / work.sum(), 0.0])
+
+    def predict(self, area, n_scenarios, samples=None):
+        """Predicted wall time of a render of the given pixel area for the given number of scenarios, None if there is no model yet"""
+        if self.coefs is None:
+            return None
+        if samples is None:
+            samples = self.context.scene.cycles.samples
+        work = area * samples
+        return self.coefs[0] + self.coefs[1] * work + self.coefs[2] * work * n_scenarios
+
+    def eta(self, pending, n_remaining):
+        """Estimated remaining time for the given pending renders, as (pixel area, number of scenarios), and n_remaining
+        other single scenario renders whose area is not known yet (estimated from the average area of this run renders)"""
+        if self.coefs is None:
+            return None
+        rendered = [r for r in self.records if r['status'] == 'rendered']
+        n_rendered_scenarios = sum(len(r['scenarios']) for r in rendered)
+        average_area = sum(r['area'] for r in rendered) / n_rendered_scenarios if n_rendered_scenarios else 0
+        remaining = sum(self.predict(area, n) for area, n in pending)
+        if n_remaining > 0 and average_area > 0:
+            remaining += n_remaining * self.predict(average_area, 1)
+        return remaining
+
+    def progress_message(self, msg, pending, n_remaining):
+        eta = self.eta(pending, n_remaining)
+        if eta is None:
+            return msg
+        return f'{msg}, remaining: {vlm_utils.format_time(eta)} for {len(pending) + n_remaining} renders'
+
+    def scenario_costs(self):
+        """Cumulated wall time, number of renders and pixel area per scenario of this run (batch render time is shared among its scenarios)"""
+        costs = {}
+        for r in (r for r in self.records if r['status'] == 'rendered'):
+            n = max(1, len(r['scenarios']))
+            for name in r['scenarios']:
+                cost = costs.setdefault(name, [0.0, 0, 0.0])
+                cost[0] += r['time'] / n
+                cost[1] += 1
+                cost[2] += r['area']
+        return costs
+
+    def save(self):
+        """Append the records of this run to the telemetry CSV, and save the model and per scenario costs as JSON"""
+        if _render_stats_handler in bpy.app.handlers.render_stats:
+            bpy.app.handlers.render_stats.remove(_render_stats_handler)
+        vlm_utils.mkpath(self.path)
+        csv_path = os.path.join(self.path, CSV_NAME)
+        new_file = not os.path.exists(csv_path)
+        with open(csv_path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            if new_file:
+                writer.writeheader()
+            for r in self.records:
+                writer.writerow(dict(r, scenarios=';'.join(r['scenarios'])))
+        summary = {
+            'run': self.run,
+            'model': None if self.coefs is None else {'overhead': self.coefs[0], 'per_pixel_sample': self.coefs[1], 'per_pixel_sample_scenario': self.coefs[2]},
+            'renders': {status: len([r for r in self.records if r['status'] == status]) for status in ('rendered', 'cached', 'skipped')},
+            'time': sum(r['time'] for r in self.records),
+            'peak_memory': max((r['peak_memory'] for r in self.records), default=0),
+            'scenarios': {name: {'time': c[0], 'renders': c[1], 'area': c[2]} for name, c in self.scenario_costs().items()},
+        }
+        with open(os.path.join(self.path, f'{SUMMARY_NAME}.tmp'), 'w') as f:
+            json.dump(summary, f, indent=1, default=float)
+        os.replace(os.path.join(self.path, f'{SUMMARY_NAME}.tmp'), os.path.join(self.path, SUMMARY_NAME))
+
+    def print_summary(self, n_scenarios=10):
+        costs = sorted(self.scenario_costs().items(), key=lambda c: -c[1][0])
+        if not costs:
+            return
+        total = sum(c[0] for _, c in costs)
+        print(f'\nMost expensive lighting scenarios (batch render time is shared among batched scenarios):')
+        print(f'. {"Scenario":<40} {"Renders":>8} {"MPixels":>10} {"Time":>10} {"Share":>7}')
+        for name, (duration, n_renders, area) in costs[:n_scenarios]:
+            print(f'. {name:<40} {n_renders:>8} {area / 1e6:>10.2f} {vlm_utils.format_time(duration):>10} {duration / total if total > 0 else 0:>7.1%}')
+        peak_memory = max((r['peak_memory'] for r in self.records), default=0)
+        if peak_memory > 0:
+            print(f'. Peak render memory: {peak_memory:.0f}MB')
+        if self.coefs is not None:
+            print(f'. Render cost model: {self.coefs[0]:.2f}s per render + {self.coefs[1] * 1e6:.4f}s per megapixel.sample + {self.coefs[2] * 1e6:.4f}s per megapixel.sample.scenario')
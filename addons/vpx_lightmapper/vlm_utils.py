@@ -25,10 +25,13 @@ import functools
 import datetime
 import string
 import unicodedata
+import numpy as np
 from mathutils import Vector
+from bpy.app.handlers import persistent
 from gpu_extras.presets import draw_texture_2d
 from gpu_extras.batch import batch_for_shader
 from . import vlm_collections
+from . import vlm_raster
 
 
 def get_global_scale(context):
@@ -48,7 +51,25 @@ def get_lm_threshold():
     return 0.01
 
 
+# Last evaluated render size, as a tuple (inputs, render size)
+_render_size_cache = (None, None)
+# Incremented on each geometry update, used to detect playfield mesh edits without reading the meshes
+_geometry_version = 0
+
+
+@persistent
+def _geometry_update_handler(scene, depsgraph):
+    global _geometry_version
+    if any(update.is_updated_geometry for update in depsgraph.updates):
+        _geometry_version += 1
+
+
 def get_render_size(context):
+    """Evaluate the render size. In 'fit_pf' layback mode, the render height applies to the playfield projected
+    through the bake camera. The result is memoized and evaluated again when any of its inputs change (the memo
+    is keyed on cheap inputs: object transforms, mesh sizes and a geometry update counter).
+    """
+    global _render_size_cache
     opt_render_height = int(context.scene.vlmSettings.render_height)
     render_aspect_ratio = context.scene.vlmSettings.render_aspect_ratio
     render_size = (int(opt_render_height * render_aspect_ratio), opt_render_height)
@@ -56,43 +77,35 @@ def get_render_size(context):
         # render height apply to projected playfield, so upscale accordingly
         camera = get_vpx_item(context, 'VPX.Camera', 'Bake', single=True)
         if camera:
+            if _geometry_update_handler not in bpy.app.handlers.depsgraph_update_post:
+                bpy.app.handlers.depsgraph_update_post.append(_geometry_update_handler)
             winx = render_size[0] * context.scene.render.pixel_aspect_x
             winy = render_size[1] * context.scene.render.pixel_aspect_y
-            min_u = min_v = 100000
-            max_u = max_v = -100000
-            for obj in context.scene.vlmSettings.playfield_col.all_objects:
-                if obj.type == 'MESH':
-                    mesh = obj.data
-                    obj_mat = obj.matrix_basis
-                    modelview_matrix = camera.matrix_world.normalized().inverted()
-                    if winx > winy:
-                        xasp = 1.0
-                        yasp = winx / float(winy)
-                    else:
-                        xasp = winy / float(winx)
-                        yasp = 1.0
-                    shiftx = 0.5 - (camera.data.shift_x * xasp)
-                    shifty = 0.5 - (camera.data.shift_y * yasp)
-                    camsize = math.tan(camera.data.angle / 2.0)
-                    uv_layer = mesh.uv_layers.active
-                    for face in mesh.polygons:
-                        y_mirror = 1.0
-                        for loop_idx in face.loop_indices:
-                            co = mesh.vertices[mesh.loops[loop_idx].vertex_index].co
-                            p1 = modelview_matrix @ obj_mat @ Vector((co[0], y_mirror * co[1], co[2], 1))
-                            if p1.z == 0.0: p1.z = 0.00001
-                            u = shiftx + xasp * (-p1.x * ((1.0 / camsize) / p1.z)) / 2.0
-                            v = shifty + yasp * (-p1.y * ((1.0 / camsize) / p1.z)) / 2.0
-                            min_v = min(min_v, v)
-                            max_v = max(max_v, v)
-                            min_u = min(min_u, u)
-                            max_u = max(max_u, u)
-            v_size = max_v - min_v
-            if v_size > 0.0:
-                s = 1.0 / v_size
-                render_size = (int(s * opt_render_height * render_aspect_ratio), int(s * opt_render_height))
-                print(f'. Upscale to fit PF to render size: {s}')
-                print(f'. Expected playfield render size: {int((max_u-min_u)*render_size[0])}x{int((max_v-min_v)*render_size[1])}')
+            playfield = [obj for obj in context.scene.vlmSettings.playfield_col.all_objects if obj.type == 'MESH']
+            key = (opt_render_height, render_aspect_ratio, winx, winy, camera.name, tuple(tuple(r) for r in camera.matrix_world),
+                camera.data.angle, camera.data.shift_x, camera.data.shift_y, _geometry_version,
+                tuple((obj.name, obj.data.name, tuple(tuple(r) for r in obj.matrix_basis), len(obj.data.vertices), len(obj.data.loops)) for obj in playfield))
+            if _render_size_cache[0] == key:
+                return _render_size_cache[1]
+            uv = []
+            for obj in playfield:
+                mesh = obj.data
+                co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+                mesh.vertices.foreach_get('co', co)
+                loops = np.empty(len(mesh.loops), dtype=np.int32)
+                mesh.loops.foreach_get('vertex_index', loops)
+                uv.append(camera_project_points(camera, obj.matrix_basis, co.reshape((-1, 3))[loops], winx / float(winy)))
+            if uv:
+                uv = np.concatenate(uv)
+                min_u, min_v = uv.min(axis=0, initial=100000)
+                max_u, max_v = uv.max(axis=0, initial=-100000)
+                v_size = max_v - min_v
+                if v_size > 0.0:
+                    s = 1.0 / v_size
+                    render_size = (int(s * opt_render_height * render_aspect_ratio), int(s * opt_render_height))
+                    print(f'. Upscale to fit PF to render size: {s}')
+                    print(f'. Expected playfield render size: {int((max_u-min_u)*render_size[0])}x{int((max_v-min_v)*render_size[1])}')
+            _render_size_cache = (key, render_size)
     return render_size
 
 
@@ -106,16 +119,11 @@ def tri_area(co1, co2, co3):
     return (co2 - co1).cross(co3 - co1).length / 2.0
 
 
-# Adapted from Blender source code:
-# https://developer.blender.org/diffusion/B/browse/master/source/blender/editors/uvedit/uvedit_unwrap_ops.c
-# https://developer.blender.org/diffusion/B/browse/master/source/blender/blenlib/intern/uvproject.c
-# ar is x/y render resolution, including pixel aspect ratio
-def project_uv(camera, obj, ar):
-    if camera.type != 'CAMERA':
-        raise Exception(f"Object {camera.name} is not a camera.")
-    mesh = obj.data
-    obj_mat = obj.matrix_basis
-    modelview_matrix = camera.matrix_world.normalized().inverted()
+def camera_project_points(camera, obj_mat, co, ar):
+    """Project object space points (array of shape (n, 3)) to camera UV coordinates (array of shape (n, 2)),
+    like Blender's 'Project from View' unwrap. ar is x/y render resolution, including pixel aspect ratio
+    """
+    modelview_matrix = np.array(camera.matrix_world.normalized().inverted() @ obj_mat, dtype=np.float64)
     if ar > 1.0:
         xasp = 1.0
         yasp = ar
@@ -125,18 +133,30 @@ def project_uv(camera, obj, ar):
     shiftx = 0.5 - (camera.data.shift_x * xasp)
     shifty = 0.5 - (camera.data.shift_y * yasp)
     camsize = math.tan(camera.data.angle / 2.0)
-    uv_layer = mesh.uv_layers.active
-    for face in mesh.polygons:
-        y_mirror = 1.0
-        for loop_idx in face.loop_indices:
-            co = mesh.vertices[mesh.loops[loop_idx].vertex_index].co
-            p1 = modelview_matrix @ obj_mat @ Vector((co[0], y_mirror * co[1], co[2], 1))
-            if p1.z == 0.0: p1.z = 0.00001
-            u = shiftx + xasp * (-p1.x * ((1.0 / camsize) / p1.z)) / 2.0
-            v = shifty + yasp * (-p1.y * ((1.0 / camsize) / p1.z)) / 2.0
-            uv_layer.data[loop_idx].uv = (u, v)
-    
-    
+    p1 = np.asarray(co, dtype=np.float64) @ modelview_matrix[:3, :3].T + modelview_matrix[:3, 3]
+    z = np.where(p1[:, 2] == 0.0, 0.00001, p1[:, 2])
+    uv = np.empty((len(p1), 2))
+    uv[:, 0] = shiftx + xasp * (-p1[:, 0] * ((1.0 / camsize) / z)) / 2.0
+    uv[:, 1] = shifty + yasp * (-p1[:, 1] * ((1.0 / camsize) / z)) / 2.0
+    return uv
+
+
+# Adapted from Blender source code:
+# https://developer.blender.org/diffusion/B/browse/master/source/blender/editors/uvedit/uvedit_unwrap_ops.c
+# https://developer.blender.org/diffusion/B/browse/master/source/blender/blenlib/intern/uvproject.c
+# ar is x/y render resolution, including pixel aspect ratio
+def project_uv(camera, obj, ar):
+    if camera.type != 'CAMERA':
+        raise Exception(f"Object {camera.name} is not a camera.")
+    mesh = obj.data
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loops)
+    uv = camera_project_points(camera, obj.matrix_basis, co.reshape((-1, 3)), ar)
+    mesh.uv_layers.active.data.foreach_set('uv', uv[loops].astype(np.float32).reshape(-1))
+
+
 def fixSlash(filepath: str) -> str:
     """convert \\\+ to /"""
     filepath = re.sub(r"\\+", "/", filepath)
@@ -425,10 +445,19 @@ def get_n_render_groups(context):
 
 def render_mask(context, width, height, target_image, view_matrix, projection_matrix):
     """Uses Blender's internal renderer to render the active scene as an opacity mask
-    to the given image (not saved)
+    to the given image (not saved). When there is no 3D viewport (background mode), the
+    visible objects are rasterized on the CPU instead.
     """
+    area = next((a for a in context.screen.areas if a.type == 'VIEW_3D'), None) if context.screen else None
+    if area is None or bpy.app.background:
+        objects = [o for o in context.view_layer.objects if o.visible_get() and o.type in {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}]
+        mask = vlm_raster.rasterize_objects(objects, projection_matrix @ view_matrix, width, height, context.evaluated_depsgraph_get())
+        pixels = np.zeros((height, width, 4), dtype=np.float32)
+        pixels[:, :, 3] = np.flipud(mask) / 255.0
+        target_image.scale(width, height)
+        target_image.pixels.foreach_set(pixels.reshape(-1))
+        return
     offscreen = gpu.types.GPUOffScreen(width, height)
-    area = next((a for a in context.screen.areas if a.type == 'VIEW_3D'), None)
     space = area.spaces.active
     state = [
         space.overlay.show_floor,
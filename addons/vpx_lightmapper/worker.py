@@ -0,0 +1,31 @@
+#    Copyright (C) 2022  Vincent Bousquet
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+# Render farm worker script (not part of the add-on modules). Launched by the render step or by the user, with:
+# blender -b <table.blend> --python <add-on folder>/worker.py -- <farm folder>/Jobs.json
+# The add-on must be enabled in the Blender preferences of the worker.
+
+import bpy
+import sys
+
+argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+if len(argv) != 1:
+    print('Usage: blender -b <table.blend> --python worker.py -- <job manifest>')
+    sys.exit(1)
+if not hasattr(bpy.types, 'VLM_OT_render_farm_worker'):
+    print('VPX light mapper add-on is not enabled')
+    sys.exit(1)
+result = bpy.ops.vlm.render_farm_worker(manifest=argv[0])
+sys.exit(0 if result == {'FINISHED'} else 1)
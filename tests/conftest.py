@@ -0,0 +1,27 @@
+import importlib.util
+import os
+import sys
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'addons', 'vpx_lightmapper')
+
+
+def load_addon_module(name):
+    """Load a standalone module of the add-on (one without Blender or relative imports) without importing the add-on package"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ADDON_PATH, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def import_addon_module(name):
+    """Import a module of the add-on package, registering the add-on, and skipping the test when not running in Blender (bpy module)"""
+    import pytest
+    pytest.importorskip('bpy')
+    addons_path = os.path.dirname(ADDON_PATH)
+    if addons_path not in sys.path:
+        sys.path.insert(0, addons_path)
+    import bpy
+    addon = importlib.import_module('vpx_lightmapper')
+    if not hasattr(bpy.types.Object, 'vlmSettings'):
+        addon.register()
+    return importlib.import_module(f'vpx_lightmapper.{name}')
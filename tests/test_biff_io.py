@@ -0,0 +1,172 @@
+import random
+import struct
+import pytest
+from conftest import load_addon_module
+
+biff_io = load_addon_module('biff_io')
+
+
+class EagerBIFFReader:
+    """Reference implementation applying inserts and deletes directly to the stream (previous BIFF_reader behavior)"""
+    def __init__(self, stream):
+        self.data = bytearray(stream)
+        self.pos = 0
+        self.record_start = 0
+        self.bytes_in_record_remaining = 0
+        self.tag = b''
+
+    def is_eof(self):
+        return self.pos >= len(self.data) or self.tag == 'ENDB'
+
+    def get_u32(self):
+        self.pos += 4
+        self.bytes_in_record_remaining -= 4
+        return struct.unpack('<I', self.data[self.pos - 4:self.pos])[0]
+
+    def get_str(self, count):
+        self.pos += count
+        self.bytes_in_record_remaining -= count
+        return str(self.data[self.pos - count:self.pos], 'latin_1')
+
+    def get_string(self):
+        return self.get_str(self.get_u32())
+
+    def next(self):
+        self.pos += max(0, self.bytes_in_record_remaining)
+        self.record_start = self.pos
+        self.bytes_in_record_remaining = self.get_u32()
+        self.tag = self.get_str(4)
+
+    def skip_tag(self):
+        self.pos += self.bytes_in_record_remaining
+        self.bytes_in_record_remaining = 0
+
+    def delete_tag(self):
+        self.data = self.data[:self.record_start] + self.data[self.pos + self.bytes_in_record_remaining:]
+        self.pos = self.record_start
+        self.bytes_in_record_remaining = 0
+        self.tag = b''
+
+    def delete_bytes(self, count):
+        self.data = self.data[:self.pos] + self.data[self.pos + count:]
+
+    def insert_data(self, new_data):
+        for d in new_data:
+            self.data.insert(self.pos, d)
+            self.pos += 1
+
+    def get_data(self):
+        return bytes(self.data)
+
+
+def record(tag, payload):
+    return struct.pack('<I', len(payload) + 4) + tag.encode('latin_1') + payload
+
+
+def string_record(tag, value):
+    return record(tag, struct.pack('<I', len(value)) + value.encode('latin_1'))
+
+
+def replay(reader, actions):
+    """Walk the records of a stream, applying an action per record like the VPX export does"""
+    index = 0
+    while not reader.is_eof():
+        action = actions[index % len(actions)]
+        index += 1
+        if action == 'insert_before':
+            reader.insert_data(record('NEW0', b'before'))
+        reader.next()
+        if action == 'replace': # Replace a record by a new one (IMAG, PLMA)
+            reader.delete_tag()
+            reader.insert_data(string_record(reader.tag or 'REPL', 'replacement'))
+        elif action == 'delete':
+            reader.delete_tag()
+        elif action == 'rewrite_string' and reader.bytes_in_record_remaining >= 4: # Rewrite a string payload (CODE)
+            string_pos = reader.pos
+            value = reader.get_string()
+            reader.pos = string_pos
+            reader.delete_bytes(len(value) + 4)
+            reader.insert_data(struct.pack('<I', len(value) * 2) + (value * 2).encode('latin_1'))
+        else:
+            reader.skip_tag()
+    return reader.get_data()
+
+
+def random_stream(rng, n_records, with_endb=True):
+    data = b''.join(string_record(f'T{i:03d}', ''.join(rng.choice('abcdef') for _ in range(rng.randrange(0, 12)))) for i in range(n_records))
+    return data + (record('ENDB', b'') if with_endb else b'')
+
+
+def test_random_edit_sequences_match_eager_edits():
+    rng = random.Random(1)
+    for i in range(300):
+        stream = random_stream(rng, rng.randrange(1, 12), with_endb=rng.random() < 0.7)
+        actions = [rng.choice(['keep', 'replace', 'delete', 'rewrite_string', 'insert_before']) for _ in range(rng.randrange(1, 6))]
+        assert replay(biff_io.BIFF_reader(bytearray(stream)), actions) == replay(EagerBIFFReader(stream), actions), (stream, actions)
+
+
+def test_insert_after_delete_at_same_position():
+    stream = bytes(range(32))
+    for first, second in ((8, b'xyz'), (0, b'abc')):
+        reader, eager = biff_io.BIFF_reader(bytearray(stream)), EagerBIFFReader(stream)
+        for r in (reader, eager):
+            r.pos = first
+            r.delete_bytes(4)
+            r.pos = first
+            r.insert_data(second)
+        assert reader.get_data() == eager.get_data() == stream[:first] + second + stream[first + 4:]
+
+
+def test_inserts_at_same_position_keep_their_order():
+    stream = bytes(range(16))
+    reader = biff_io.BIFF_reader(bytearray(stream))
+    reader.pos = 4
+    reader.insert_data(b'A')
+    reader.insert_data(b'B')
+    reader.delete_bytes(2)
+    reader.insert_data(b'C')
+    eager = EagerBIFFReader(stream)
+    eager.pos = 4
+    eager.insert_data(b'A')
+    eager.insert_data(b'B')
+    eager.delete_bytes(2)
+    eager.insert_data(b'C')
+    assert reader.get_data() == eager.get_data() == stream[:4] + b'ABC' + stream[6:]
+
+
+def test_overlapping_edits_are_rejected():
+    reader = biff_io.BIFF_reader(bytearray(range(32)))
+    reader.pos = 8
+    reader.delete_bytes(8)
+    reader.pos = 12
+    with pytest.raises(ValueError):
+        reader.insert_data(b'inside')
+    reader.pos = 4
+    with pytest.raises(ValueError):
+        reader.delete_bytes(6)
+    reader.pos = 8
+    with pytest.raises(ValueError):
+        reader.delete_bytes(2)
+    reader.pos = 20
+    reader.insert_data(b'x')
+    reader.pos = 18
+    with pytest.raises(ValueError):
+        reader.delete_bytes(4)
+    reader.pos = 16 # Edits touching the bounds of the deleted span are valid
+    reader.insert_data(b'end')
+    reader.pos = 4
+    reader.delete_bytes(4)
+    assert reader.get_data() == bytes(range(4)) + b'end' + bytes(range(16, 20)) + b'x' + bytes(range(20, 32))
+
+
+def test_delete_at_end_of_stream():
+    # Last record deleted then replaced, stream without ENDB (like the game data edited by the VPX export)
+    stream = string_record('CODE', 'Option Explicit') + string_record('IMAG', 'playfield')
+    for actions in (['keep', 'replace'], ['keep', 'delete'], ['keep', 'rewrite_string']):
+        assert replay(biff_io.BIFF_reader(bytearray(stream)), actions) == replay(EagerBIFFReader(stream), actions)
+    reader, eager = biff_io.BIFF_reader(bytearray(stream)), EagerBIFFReader(stream)
+    for r in (reader, eager):
+        r.pos = len(stream) - 4
+        r.delete_bytes(16) # Delete past the end of the stream
+        r.insert_data(b'tail')
+    assert reader.get_data() == eager.get_data() == stream[:-4] + b'tail'
@@ -0,0 +1,86 @@
+import os
+import struct
+import pytest
+from conftest import load_addon_module
+
+cfb_io = load_addon_module('cfb_io')
+
+# RFC 1319 test suite
+MD2_VECTORS = [
+    (b'', '8350e5a3e24c153df2275c9f80692773'),
+    (b'a', '32ec01ec4a6dac72c0ab96fb34c0b5d1'),
+    (b'abc', 'da853b0d3f88d99b30283a69e6ded6bb'),
+    (b'message digest', 'ab4f496bfb2a530b219ff33031fe06b0'),
+    (b'abcdefghijklmnopqrstuvwxyz', '4e8ddff3650292ab5a4108c3aa47940b'),
+    (b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789', 'da33def2a42df13975352846c30338cd'),
+    (b'12345678901234567890123456789012345678901234567890123456789012345678901234567890', 'd5976f79d83d3a0dc9806c3c66f3efd8'),
+]
+
+
+def python_md2():
+    hasher = cfb_io.MD2()
+    hasher.native = None # Force the pure Python implementation
+    return hasher
+
+
+@pytest.mark.parametrize('data, expected', MD2_VECTORS)
+def test_md2_rfc1319_vectors(data, expected):
+    hasher = python_md2()
+    hasher.update(data)
+    assert hasher.digest().hex() == expected
+    hasher = cfb_io.MD2()
+    hasher.update(data)
+    assert hasher.digest().hex() == expected
+
+
+def test_md2_incremental_updates():
+    data = MD2_VECTORS[-1][0]
+    hasher = python_md2()
+    for i in range(0, len(data), 7):
+        hasher.update(data[i:i + 7])
+    assert hasher.digest().hex() == MD2_VECTORS[-1][1]
+    assert hasher.digest().hex() == MD2_VECTORS[-1][1] # digest does not alter the hasher state
+
+
+def stream_data(size, seed):
+    """Deterministic non repeating sector content of the given size"""
+    pattern = bytes((i * 31 + seed) & 0xFF for i in range(4099))
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+@pytest.mark.parametrize('sizes', [
+    [0, 1, 63, 64, 65, 4095], # Mini stream only
+    [4096, 4097, 100000, 10, 700], # Regular FAT chains mixed with mini streams
+    [8 * 1024 * 1024 + 3, 5000, 20], # More than 109 FAT sectors, requiring DIFAT sectors
+])
+def test_cfb_round_trip(tmp_path, sizes):
+    olefile = pytest.importorskip('olefile')
+    path = os.path.join(tmp_path, 'test.vpx')
+    expected = {}
+    writer = cfb_io.CFB_writer(path)
+    game_stg = writer.create_storage('GameStg')
+    info_stg = writer.create_storage('TableInfo')
+    for i, size in enumerate(sizes):
+        data = stream_data(size, i)
+        game_stg.write_stream(f'GameItem{i}', data)
+        expected[f'GameStg/GameItem{i}'] = data
+    game_stg.write_stream('Version', struct.pack('<I', 1080))
+    expected['GameStg/Version'] = struct.pack('<I', 1080)
+    for i in range(40): # Enough siblings to build a multi level red-black tree
+        data = f'Info {i}'.encode('utf-16-le')
+        info_stg.write_stream(f'Field{i}', data)
+        expected[f'TableInfo/Field{i}'] = data
+    writer.close()
+
+    assert olefile.isOleFile(path)
+    ole = olefile.OleFileIO(path, raise_defects=olefile.DEFECT_INCORRECT)
+    try:
+        assert not ole.parsing_issues
+        streams = {'/'.join(entry) for entry in ole.listdir(streams=True, storages=False)}
+        assert streams == set(expected)
+        for name, data in expected.items():
+            assert ole.get_size(name) == len(data)
+            with ole.openstream(name) as stream:
+                assert stream.read() == data
+    finally:
+        ole.close()
@@ -0,0 +1,41 @@
+import numpy as np
+from conftest import import_addon_module
+
+
+def weld_vertices_dict(loop_data):
+    """Reference implementation: per loop dictionary welding (previous export code)"""
+    indices = []
+    vertices = []
+    vert_dict = {}
+    for vertex in map(tuple, loop_data.tolist()):
+        existing_index = vert_dict.get(vertex, None)
+        if existing_index is None:
+            vert_dict[vertex] = len(vertices)
+            indices.append(len(vertices))
+            vertices.append(vertex)
+        else:
+            indices.append(existing_index)
+    return vertices, indices
+
+
+def test_weld_vertices_matches_dict_welding():
+    vlm_export = import_addon_module('vlm_export')
+    rng = np.random.default_rng(0)
+    for n_unique, n_loops in ((1, 3), (10, 30), (500, 3000), (5000, 3000)):
+        unique = rng.normal(size=(n_unique, 8))
+        unique[rng.random((n_unique, 8)) < 0.2] = 0.0
+        loop_data = unique[rng.integers(0, n_unique, n_loops)]
+        loop_data[rng.random((n_loops, 8)) < 0.05] *= -1.0 # Signed zeros must be merged like Python float equality does
+        vertices, indices = vlm_export.weld_vertices(loop_data)
+        ref_vertices, ref_indices = weld_vertices_dict(loop_data)
+        assert vertices.tolist() == [list(v) for v in ref_vertices] # Same vertices, ordered by first occurrence
+        assert indices.tolist() == ref_indices
+        assert vertices.astype('<f4').tobytes() == np.array(ref_vertices, dtype='<f4').tobytes()
+        assert indices.astype('<u4').tobytes() == np.array(ref_indices, dtype='<u4').tobytes()
+
+
+def test_weld_vertices_empty_mesh():
+    vlm_export = import_addon_module('vlm_export')
+    vertices, indices = vlm_export.weld_vertices(np.zeros((0, 8)))
+    assert vertices.shape == (0, 8)
+    assert len(indices) == 0
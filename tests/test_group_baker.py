@@ -0,0 +1,44 @@
+import random
+from conftest import import_addon_module
+
+
+def random_graph(rng, n, density):
+    adjacency = [set() for v in range(n)]
+    for v in range(n):
+        for u in range(v + 1, n):
+            if rng.random() < density:
+                adjacency[v].add(u)
+                adjacency[u].add(v)
+    return adjacency
+
+
+def assert_valid_coloring(adjacency, colors):
+    assert len(colors) == len(adjacency)
+    assert all(c >= 0 for c in colors)
+    assert all(colors[v] != colors[u] for v in range(len(adjacency)) for u in adjacency[v])
+
+
+def test_colorings_are_valid_and_not_worse_than_greedy():
+    vlm_group_baker = import_addon_module('vlm_group_baker')
+    rng = random.Random(0)
+    for n, density in ((1, 0.0), (5, 1.0), (12, 0.0), (30, 0.2), (60, 0.5), (120, 0.1)):
+        adjacency = random_graph(rng, n, density)
+        n_greedy = max(vlm_group_baker.greedy_coloring(adjacency)) + 1
+        dsatur = vlm_group_baker.dsatur_coloring(adjacency)
+        assert_valid_coloring(adjacency, dsatur)
+        randomized = vlm_group_baker.dsatur_coloring(adjacency, random.Random(1))
+        assert_valid_coloring(adjacency, randomized)
+        optimized = vlm_group_baker.optimize_coloring(adjacency, 5.0, 50)
+        assert_valid_coloring(adjacency, optimized)
+        assert max(optimized) + 1 <= min(n_greedy, max(dsatur) + 1)
+
+
+def test_optimize_coloring_known_graphs():
+    vlm_group_baker = import_addon_module('vlm_group_baker')
+    assert vlm_group_baker.optimize_coloring([], 1.0, 10) == []
+    # Odd cycle: 3 colors, even cycle: 2 colors, complete graph: one color per vertex
+    cycle = lambda n: [{(v - 1) % n, (v + 1) % n} for v in range(n)]
+    assert max(vlm_group_baker.optimize_coloring(cycle(7), 1.0, 10)) + 1 == 3
+    assert max(vlm_group_baker.optimize_coloring(cycle(8), 1.0, 10)) + 1 == 2
+    complete = [set(range(6)) - {v} for v in range(6)]
+    assert sorted(vlm_group_baker.optimize_coloring(complete, 1.0, 10)) == list(range(6))
@@ -0,0 +1,73 @@
+import math
+import time
+import numpy as np
+from conftest import import_addon_module
+
+
+def project_uv_loop(camera, obj, ar):
+    """Per loop implementation of vlm_utils.project_uv, used as a reference"""
+    from mathutils import Vector
+    mesh = obj.data
+    obj_mat = obj.matrix_basis
+    modelview_matrix = camera.matrix_world.normalized().inverted()
+    if ar > 1.0:
+        xasp = 1.0
+        yasp = ar
+    else:
+        xasp = 1.0 / ar
+        yasp = 1.0
+    shiftx = 0.5 - (camera.data.shift_x * xasp)
+    shifty = 0.5 - (camera.data.shift_y * yasp)
+    camsize = math.tan(camera.data.angle / 2.0)
+    uv_layer = mesh.uv_layers.active
+    for face in mesh.polygons:
+        for loop_idx in face.loop_indices:
+            co = mesh.vertices[mesh.loops[loop_idx].vertex_index].co
+            p1 = modelview_matrix @ obj_mat @ Vector((co[0], co[1], co[2], 1))
+            if p1.z == 0.0: p1.z = 0.00001
+            u = shiftx + xasp * (-p1.x * ((1.0 / camsize) / p1.z)) / 2.0
+            v = shifty + yasp * (-p1.y * ((1.0 / camsize) / p1.z)) / 2.0
+            uv_layer.data[loop_idx].uv = (u, v)
+
+
+def benchmark_project_uv(project_uv, camera, obj, ar, repeat=3):
+    """Compare project_uv against the per loop implementation, returning the best time of each implementation
+    and the maximum difference between the computed UVs"""
+    uv_layer = obj.data.uv_layers.active
+    results = []
+    for func in (project_uv_loop, project_uv):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            func(camera, obj, ar)
+            timings.append(time.perf_counter() - start)
+        uv = np.empty(len(obj.data.loops) * 2, dtype=np.float32)
+        uv_layer.data.foreach_get('uv', uv)
+        results.append((min(timings), uv))
+    max_diff = np.abs(results[0][1] - results[1][1]).max(initial=0)
+    print(f'. project_uv on {len(obj.data.loops)} loops: loop {results[0][0]:.3f}s, numpy {results[1][0]:.3f}s, max difference {max_diff}')
+    return results[0][0], results[1][0], max_diff
+
+
+def test_project_uv_matches_per_loop_implementation():
+    vlm_utils = import_addon_module('vlm_utils')
+    import bpy
+    camera_data = bpy.data.cameras.new('Test Camera')
+    camera_data.shift_x = 0.1
+    camera_data.shift_y = -0.05
+    camera = bpy.data.objects.new('Test Camera', camera_data)
+    camera.location = (0.3, -2.0, 5.0)
+    camera.rotation_euler = (0.4, 0.0, 0.1)
+    mesh = bpy.data.meshes.new('Test Mesh')
+    grid = np.mgrid[0:40, 0:40].reshape((2, -1)).T / 40.0
+    verts = [(x - 0.5, y - 0.5, 0.1 * math.sin(10 * x * y)) for x, y in grid]
+    faces = [(i * 40 + j, i * 40 + j + 1, (i + 1) * 40 + j + 1, (i + 1) * 40 + j) for i in range(39) for j in range(39)]
+    mesh.from_pydata(verts, [], faces)
+    mesh.uv_layers.new(name='UVMap')
+    obj = bpy.data.objects.new('Test Mesh', mesh)
+    obj.location = (0.1, 0.2, -0.3)
+    obj.scale = (1.5, 1.0, 1.0)
+    camera.data.angle = math.radians(50)
+    for ar in (0.5, 1.0, 16.0 / 9.0):
+        _, _, max_diff = benchmark_project_uv(vlm_utils.project_uv, camera, obj, ar, repeat=1)
+        assert max_diff < 1e-5
@@ -0,0 +1,127 @@
+import math
+import numpy as np
+import pytest
+from conftest import load_addon_module
+
+vlm_raster = load_addon_module('vlm_raster')
+
+
+def brute_force_coverage(clip, triangles, width, height):
+    """Coverage of pixel centers by triangles, using a barycentric point in triangle test on every pixel"""
+    mask = np.zeros((height, width), dtype=bool)
+    cy, cx = np.mgrid[0:height, 0:width] + 0.5
+    for tri in triangles:
+        v = clip[tri]
+        if np.any(v[:, 3] <= 1e-6):
+            continue # Crossing the camera plane
+        x = (1.0 + v[:, 0] / v[:, 3]) * (0.5 * width)
+        y = (1.0 - v[:, 1] / v[:, 3]) * (0.5 * height)
+        det = (y[1] - y[2]) * (x[0] - x[2]) + (x[2] - x[1]) * (y[0] - y[2])
+        if det == 0:
+            continue
+        l0 = ((y[1] - y[2]) * (cx - x[2]) + (x[2] - x[1]) * (cy - y[2])) / det
+        l1 = ((y[2] - y[0]) * (cx - x[2]) + (x[0] - x[2]) * (cy - y[2])) / det
+        mask |= (l0 >= 0) & (l1 >= 0) & (1.0 - l0 - l1 >= 0)
+    return mask
+
+
+@pytest.mark.parametrize('scale', [0.02, 0.2, 1.5])
+def test_rasterize_matches_point_in_triangle(scale):
+    rng = np.random.default_rng(int(scale * 100))
+    width, height = 97, 64
+    for i in range(10):
+        n = 60
+        centers = rng.uniform(-1.2, 1.2, (n, 1, 2))
+        xy = centers + rng.normal(scale=scale, size=(n, 3, 2))
+        w = rng.uniform(0.5, 2.0, (n, 3))
+        w[rng.random((n, 3)) < 0.02] *= -1.0 # Some triangles cross the camera plane
+        clip = np.concatenate((xy.reshape((-1, 2)) * w.reshape((-1, 1)), np.zeros((3 * n, 1)), w.reshape((-1, 1))), axis=1)
+        triangles = np.arange(3 * n).reshape((-1, 3))
+        mask = vlm_raster.rasterize(clip, triangles, width, height)
+        expected = brute_force_coverage(clip, triangles, width, height)
+        assert np.array_equal(mask, expected)
+
+
+def test_rasterize_empty():
+    mask = vlm_raster.rasterize(np.zeros((0, 4)), np.zeros((0, 3), dtype=np.int32), 8, 4)
+    assert mask.shape == (4, 8) and not mask.any()
+
+
+def pil_dilate(alpha, pad):
+    """Previous mask padding: compositing the mask over itself shifted by one pixel down, up, right then left"""
+    from PIL import Image
+    pixels = np.full(alpha.shape + (4,), 255, dtype=np.uint8)
+    pixels[:, :, 3] = alpha
+    im = Image.fromarray(pixels, 'RGBA')
+    for p in range(pad):
+        im.alpha_composite(im, (0, 1))
+        im.alpha_composite(im, (0, -1))
+        im.alpha_composite(im, (1, 0))
+        im.alpha_composite(im, (-1, 0))
+    return np.frombuffer(im.tobytes('raw', 'A'), dtype=np.uint8).reshape(alpha.shape)
+
+
+@pytest.mark.parametrize('binary', [True, False])
+@pytest.mark.parametrize('pad', [0, 1, 3])
+def test_dilate_mask_matches_pil_compositing(binary, pad):
+    pytest.importorskip('PIL')
+    rng = np.random.default_rng(pad)
+    for i in range(5):
+        alpha = rng.integers(0, 256, (37, 53)).astype(np.uint8)
+        if binary:
+            alpha = np.where(rng.random(alpha.shape) < 0.05, 255, 0).astype(np.uint8)
+        else:
+            alpha[rng.random(alpha.shape) < 0.7] = 0
+        assert np.array_equal(vlm_raster.dilate_mask(alpha, pad), pil_dilate(alpha, pad))
+
+
+def loop_uv_visibility_map(uvs, width, height):
+    """Visibility map built with the per pixel orient2d loop the vectorized rasterizer replaced"""
+    def orient2d(ax, ay, bx, by, cx, cy):
+        return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    vmaps = [[] for xy in range(width * height)]
+    for i, (a, b, c) in enumerate(uvs):
+        ax, ay = int(a[0] * width), int(a[1] * height)
+        bx, by = int(b[0] * width), int(b[1] * height)
+        cx, cy = int(c[0] * width), int(c[1] * height)
+        lab = -math.sqrt((bx-ax)*(bx-ax)+(by-ay)*(by-ay))
+        lac = -math.sqrt((cx-ax)*(cx-ax)+(cy-ay)*(cy-ay))
+        lbc = -math.sqrt((bx-cx)*(bx-cx)+(by-cy)*(by-cy))
+        min_x = max(0, min(width - 1, min(ax, bx, cx) - 1))
+        min_y = max(0, min(height - 1, min(ay, by, cy) - 1))
+        max_x = max(0, min(width - 1, max(ax, bx, cx) + 1))
+        max_y = max(0, min(height - 1, max(ay, by, cy) + 1))
+        marked = False
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                if orient2d(bx, by, cx, cy, x, y) >= lbc and orient2d(cx, cy, ax, ay, x, y) >= lac and orient2d(ax, ay, bx, by, x, y) >= lab:
+                    marked = True
+                    vmaps[x + y * width].append(i)
+        if not marked:
+            vmaps[min_x + min_y * width].append(i)
+    return vmaps
+
+
+@pytest.mark.parametrize('scale', [0.003, 0.05, 0.6])
+def test_rasterize_uv_triangles_matches_orient2d_loop(scale):
+    rng = np.random.default_rng(int(scale * 1000))
+    width, height = 53, 40
+    centers = rng.uniform(-0.1, 1.1, (300, 1, 2)) # Partly outside of the map, to test truncation toward zero and clipping
+    uvs = (centers + rng.uniform(-scale, scale, (300, 3, 2))).astype(np.float32).astype(np.float64)
+    uvs[:10] = uvs[:10, :1] # Degenerated triangles
+    indptr, triangles = vlm_raster.rasterize_uv_triangles(uvs, width, height)
+    expected = loop_uv_visibility_map(uvs, width, height)
+    assert indptr.shape == (width * height + 1,) and indptr[-1] == len(triangles)
+    assert [list(triangles[indptr[xy]:indptr[xy + 1]]) for xy in range(width * height)] == expected
+
+
+def test_rasterize_uv_triangles_fallback_and_empty():
+    width, height = 8, 4
+    # Triangles which do not cover any pixel (here outside of the map) are assigned to the first pixel of their clipped bounds
+    uvs = np.array([[(2.0, 2.0), (3.0, 2.0), (2.0, 3.0)], [(1.2, -0.5), (1.3, -0.5), (1.2, -0.4)]])
+    indptr, triangles = vlm_raster.rasterize_uv_triangles(uvs, width, height)
+    assert list(np.diff(indptr).nonzero()[0]) == [7, 31]
+    assert list(triangles) == [1, 0]
+    assert [list(triangles[indptr[xy]:indptr[xy + 1]]) for xy in range(width * height)] == loop_uv_visibility_map(uvs, width, height)
+    indptr, triangles = vlm_raster.rasterize_uv_triangles(np.zeros((0, 3, 2)), width, height)
+    assert len(triangles) == 0 and np.all(indptr == 0)
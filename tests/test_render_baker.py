@@ -0,0 +1,169 @@
+import os
+import json
+import random
+import numpy as np
+import pytest
+from conftest import import_addon_module
+
+
+@pytest.fixture
+def light_setup():
+    """Scene, camera looking down at a point light, and the influence bounds of the light without mask"""
+    vlm_render_baker = import_addon_module('vlm_render_baker')
+    import bpy
+    from mathutils import Matrix
+    scene = bpy.data.scenes.new('Test Influence')
+    scene.render.resolution_x = 256
+    scene.render.resolution_y = 256
+    camera = bpy.data.objects.new('Test Camera', bpy.data.cameras.new('Test Camera'))
+    camera.matrix_world = Matrix.Translation((0, 0, 10))
+    light = bpy.data.objects.new('Test Light', bpy.data.lights.new('Test Light', 'POINT'))
+    light.data.energy = 10
+    light.matrix_world = Matrix.Translation((0, 0, 0))
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    aoi = vlm_render_baker.get_light_influence(scene, depsgraph, camera, light, None)
+    assert aoi is not None and 0 < aoi[0] < 0.5 < aoi[1] < 1 and 0 < aoi[2] < 0.5 < aoi[3] < 1
+    yield vlm_render_baker, scene, depsgraph, camera, light, aoi
+    bpy.data.scenes.remove(scene)
+
+
+def group_mask(vlm_render_baker, tmp_path, coverage):
+    from PIL import Image
+    path = os.path.join(tmp_path, 'Mask.png')
+    Image.fromarray(coverage.astype(np.uint8) * 255, 'L').save(path)
+    return vlm_render_baker.load_influence_mask(path)
+
+
+def test_light_influence_with_coverage_mask(light_setup, tmp_path):
+    vlm_render_baker, scene, depsgraph, camera, light, aoi = light_setup
+    w = h = 32
+    min_x, max_x, min_y, max_y = int(aoi[0] * (w - 1)), int(aoi[1] * (w - 1)), int(aoi[2] * (h - 1)), int(aoi[3] * (h - 1))
+    cases = []
+    # Covered pixels around the light center are influenced
+    coverage = np.zeros((h, w), dtype=bool)
+    coverage[14:18, 14:18] = True
+    cases.append((coverage, aoi))
+    # Nothing covered
+    cases.append((np.zeros((h, w), dtype=bool), None))
+    # Covered pixel outside of the influence bounds
+    coverage = np.zeros((h, w), dtype=bool)
+    coverage[0, 0] = True
+    cases.append((coverage, None))
+    # Covered pixel inside the influence bounds but outside of the influence elipsoid
+    coverage = np.zeros((h, w), dtype=bool)
+    coverage[min_y, min_x] = True
+    cases.append((coverage, None))
+    # Covered pixel inside the influence elipsoid but outside of its inscribed rectangle
+    coverage = np.zeros((h, w), dtype=bool)
+    coverage[(min_y + max_y) // 2, min_x + 1] = True
+    cases.append((coverage, aoi))
+    for coverage, expected in cases:
+        mask = group_mask(vlm_render_baker, tmp_path, coverage)
+        assert isinstance(mask[2], np.ndarray)
+        assert vlm_render_baker.get_light_influence(scene, depsgraph, camera, light, mask) == expected
+
+
+def make_candidates(n, n_worlds=0, seed=0):
+    import bpy
+    rng = random.Random(seed)
+    candidates = []
+    for i in range(n):
+        light_col = bpy.data.collections.new(f'Test Scenario {i}')
+        if i < n_worlds:
+            light_col.vlmSettings.world = bpy.data.worlds.new(f'Test World {i}')
+        x, y, size = rng.random() * 0.8, rng.random() * 0.8, 0.05 + rng.random() * 0.2
+        candidates.append(((f'Scenario {i}', True, light_col, []), (x, x + size, y, y + size), f'hash {i}'))
+    return candidates
+
+
+def check_batches(candidates, batches, max_batch_size):
+    assert sorted(c[2] for batch in batches for c in batch) == sorted(c[2] for c in candidates) # Each scenario is rendered once
+    for batch in batches:
+        assert 1 <= len(batch) <= max_batch_size
+        assert sum(scenario[2].vlmSettings.world is not None for scenario, _, _ in batch) <= 1
+
+
+def test_batches_respect_max_scenarios_in_batch():
+    vlm_render_baker = import_addon_module('vlm_render_baker')
+    candidates = make_candidates(40, n_worlds=5)
+    for max_batch_size in (1, 2, 3, 7, 16, 64):
+        for overhead in (0.0, 0.1, 10.0): # A large overhead makes all merges profitable, so only the size bound limits them
+            batches = vlm_render_baker.plan_render_batches(candidates, max_batch_size, overhead, (1000, 2000))
+            check_batches(candidates, batches, max_batch_size)
+            if max_batch_size == 1:
+                assert len(batches) == len(candidates)
+            if overhead == 10.0:
+                assert len(batches) <= max(5, -(-len(candidates) // max_batch_size)) + 1
+
+
+def test_batches_merge_overlapping_scenarios():
+    vlm_render_baker = import_addon_module('vlm_render_baker')
+    candidates = make_candidates(2)
+    candidates[1] = (candidates[1][0], candidates[0][1], candidates[1][2]) # Same influence bounds
+    assert len(vlm_render_baker.plan_render_batches(candidates, 8, 0.01, (100, 100))) == 1
+    assert vlm_render_baker.plan_render_batches([], 8, 0.01, (100, 100)) == []
+
+
+def test_render_farm_recovers_from_stale_and_failed_jobs(tmp_path):
+    """Simulate a remote worker which completes a job, fails another one, and keeps crashing on a third one, while the
+    last job is never claimed: the farm must return the completed job and stop waiting instead of hanging."""
+    vlm_render_baker = import_addon_module('vlm_render_baker')
+    import bpy
+    import threading
+    farm_path = str(tmp_path)
+    jobs = [{'id': job_id, 'group': 0, 'scenarios': ['Scenario']} for job_id in ('ok', 'error', 'crash', 'unclaimed')]
+    stop = threading.Event()
+
+    def remote_worker():
+        while not os.path.exists(os.path.join(farm_path, vlm_render_baker.FARM_MANIFEST_NAME)):
+            stop.wait(0.05)
+        assert vlm_render_baker.claim_render_job(farm_path, 'ok')
+        vlm_render_baker.write_job_result(farm_path, 'ok', {'worker': 'remote', 'rendered': ['Render.exr'], 'time': 1.0, 'crop': None})
+        assert vlm_render_baker.claim_render_job(farm_path, 'error')
+        vlm_render_baker.write_job_result(farm_path, 'error', {'worker': 'remote', 'rendered': [], 'time': 1.0, 'crop': None, 'error': 'failed'})
+        while not stop.is_set():
+            # Crash right after claiming the job: the lock is never touched again
+            if vlm_render_baker.claim_render_job(farm_path, 'crash'):
+                os.utime(os.path.join(farm_path, 'crash.lock'), (0, 0))
+            stop.wait(0.05)
+
+    thread = threading.Thread(target=remote_worker, daemon=True)
+    thread.start()
+    try:
+        completed = vlm_render_baker.run_render_farm(bpy.context, farm_path, jobs, 0, lock_timeout=1, max_retries=1, stall_limit=3)
+    finally:
+        stop.set()
+        thread.join()
+    assert [(job['id'], rendered) for job, rendered, duration, crop in completed] == [('ok', ['Render.exr'])]
+    with open(os.path.join(farm_path, 'crash.done'), 'r') as f:
+        assert 'stopped responding' in json.load(f)['error']
+    assert not os.path.exists(os.path.join(farm_path, 'unclaimed.done'))
+
+
+def test_influence_prepass_skips_unset_scenarios_and_restores_settings(monkeypatch, tmp_path):
+    vlm_render_baker = import_addon_module('vlm_render_baker')
+    import bpy
+    scene = bpy.data.scenes.new('Test Prepass')
+    scene.render.resolution_percentage = 50
+    scene.cycles.samples = 128
+    scene.cycles.use_denoising = True
+    restored = []
+
+    def setup_light_scenario(scene, depsgraph, camera, scenario, group_mask, render_col, influence=None):
+        if scenario[0] == 'Unset':
+            return None, None
+        return scenario[0], restored.append
+
+    def render_still(scene, path, force):
+        raise RuntimeError('render failed')
+
+    monkeypatch.setattr(vlm_render_baker, 'setup_light_scenario', setup_light_scenario)
+    monkeypatch.setattr(vlm_render_baker, 'render_still', render_still)
+    scenarios = [('Unset', True, None, []), ('Failing', True, None, [])]
+    try:
+        with pytest.raises(RuntimeError):
+            vlm_render_baker.render_influence_prepass(scene, None, None, scenarios, None, f'{tmp_path}/', 0.125, 16)
+        assert restored == ['Failing']
+        assert (scene.render.resolution_percentage, scene.cycles.samples, scene.cycles.use_denoising) == (50, 128, True)
+    finally:
+        bpy.data.scenes.remove(scene)
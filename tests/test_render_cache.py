@@ -0,0 +1,59 @@
+import pytest
+from conftest import import_addon_module
+
+
+def render_digest(obj):
+    import bpy
+    vlm_render_cache = import_addon_module('vlm_render_cache')
+    render_cache = vlm_render_cache.RenderCache(bpy.context) # Digests are memoized per cache, so use a new one
+    return render_cache.object_digest(obj), render_cache.get_settings_digest()
+
+
+def test_object_linked_materials_and_output_settings_are_hashed():
+    import_addon_module('vlm_render_cache')
+    import bpy
+    mesh = bpy.data.meshes.new('Test Cache Mesh')
+    mesh.from_pydata([(0, 0, 0), (1, 0, 0), (0, 1, 0)], [], [(0, 1, 2)])
+    mesh.materials.append(bpy.data.materials.new('Test Mesh Material'))
+    obj = bpy.data.objects.new('Test Cache Object', mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    try:
+        object_material = bpy.data.materials.new('Test Object Material')
+        obj.material_slots[0].link = 'OBJECT'
+        obj.material_slots[0].material = object_material
+        obj_digest = render_digest(obj)[0]
+        object_material.diffuse_color = (1, 0, 0, 1)
+        assert render_digest(obj)[0] != obj_digest
+        obj_digest = render_digest(obj)[0]
+        obj.material_slots[0].link = 'DATA'
+        assert render_digest(obj)[0] != obj_digest
+        image_settings = bpy.context.scene.render.image_settings
+        image_settings.file_format = 'OPEN_EXR'
+        settings_digest = render_digest(obj)[1]
+        image_settings.exr_codec = 'PIZ' if image_settings.exr_codec != 'PIZ' else 'ZIP'
+        assert render_digest(obj)[1] != settings_digest
+        settings_digest = render_digest(obj)[1]
+        bpy.context.scene.view_settings.exposure += 1.0
+        assert render_digest(obj)[1] != settings_digest
+    finally:
+        bpy.data.objects.remove(obj)
+
+
+def test_render_size_is_checked_against_the_recorded_crop(tmp_path):
+    vlm_render_cache = import_addon_module('vlm_render_cache')
+    import bpy
+    bpy.ops.wm.save_as_mainfile(filepath=str(tmp_path / 'Cache.blend')) # Render cache is stored in the bake folder of the blend file
+    render_cache = vlm_render_cache.RenderCache(bpy.context)
+    render_path = str(tmp_path / 'Render.exr')
+    with open(render_path, 'wb') as f:
+        f.write(b'render')
+    render_size = (640, 480)
+    assert render_cache.get_checked_crop(render_path, render_size, render_size) is None
+    with pytest.raises(ValueError): # Cropped render whose crop region was lost
+        render_cache.get_checked_crop(render_path, (100, 50), render_size)
+    render_cache.store(render_path, 'digest', (10, 20, 100, 50, 640, 480))
+    assert render_cache.get_checked_crop(render_path, (100, 50), render_size) == (10, 20, 100, 50, 640, 480)
+    with pytest.raises(ValueError): # Full frame render recorded as cropped
+        render_cache.get_checked_crop(render_path, render_size, render_size)
+    with pytest.raises(ValueError): # Render size changed since the render was recorded
+        render_cache.get_checked_crop(render_path, (100, 50), (1280, 960))
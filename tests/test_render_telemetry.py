@@ -0,0 +1,51 @@
+import random
+import numpy as np
+from conftest import import_addon_module
+
+
+def new_telemetry(tmp_path):
+    import bpy
+    vlm_render_telemetry = import_addon_module('vlm_render_telemetry')
+    bpy.ops.wm.save_as_mainfile(filepath=str(tmp_path / 'Telemetry.blend')) # Telemetry is stored in the bake folder of the blend file
+    telemetry = vlm_render_telemetry.RenderTelemetry(bpy.context)
+    telemetry.history = [] # Do not use the records of previous runs
+    telemetry.fit()
+    return telemetry
+
+
+def test_telemetry_fit_falls_back_without_enough_records(tmp_path):
+    telemetry = new_telemetry(tmp_path)
+    samples = telemetry.context.scene.cycles.samples
+    assert telemetry.coefs is None
+    assert telemetry.predict(1000, 1) is None and telemetry.eta([(1000, 1)], 2) is None
+    # Less than 3 records: plain cost per pixel and sample
+    telemetry.record('batch', 0, ['A'], 'rendered', 1000, 2.0)
+    telemetry.record('batch', 0, ['B', 'C'], 'rendered', 3000, 4.0)
+    telemetry.record('batch', 0, ['D'], 'cached') # Not rendered, not used by the model
+    telemetry.fit()
+    assert np.allclose(telemetry.coefs, [0.0, 6.0 / (4000 * samples), 0.0])
+    assert np.isclose(telemetry.predict(2000, 3), 3.0)
+
+
+def test_telemetry_fit_falls_back_on_singular_records(tmp_path):
+    telemetry = new_telemetry(tmp_path)
+    samples = telemetry.context.scene.cycles.samples
+    # Single scenario renders only: the per scenario term can not be separated from the per pixel one
+    for i in range(10):
+        area = 1000 * (i + 1)
+        telemetry.record('batch', i, ['A'], 'rendered', area, 1.0 + 1e-4 * area * samples)
+    telemetry.fit()
+    total_time = sum(r['time'] for r in telemetry.records)
+    assert np.allclose(telemetry.coefs, [0.0, total_time / (55000 * samples), 0.0])
+
+
+def test_telemetry_fit_recovers_cost_model(tmp_path):
+    telemetry = new_telemetry(tmp_path)
+    samples = telemetry.context.scene.cycles.samples
+    rng = random.Random(0)
+    for i in range(20):
+        area, n = rng.randrange(1000, 100000), rng.randrange(1, 6)
+        telemetry.record('batch', i, [f'S{k}' for k in range(n)], 'rendered', area, 2.0 + area * samples * (1e-7 + 2e-8 * n))
+    telemetry.fit()
+    assert np.allclose(telemetry.coefs, [2.0, 1e-7, 2e-8])
+    assert np.isclose(telemetry.eta([(5000, 2), (1000, 1)], 0), telemetry.predict(5000, 2) + telemetry.predict(1000, 1))